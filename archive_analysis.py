@@ -0,0 +1,263 @@
+"""Parallel, incrementally cached analysis of the monitor's recording archive.
+
+Runs the per-clip analyses (onset latency from clip_analysis.py, and the
+call classifier when reference calls are available) over every clip in a
+directory tree, fanned out over a ProcessPoolExecutor. Results are appended
+to a JSON Lines file as each clip finishes, one record per clip, so an
+interrupted run keeps everything done so far.
+
+The results file is also the cache. A record is reused when its clip's
+size and mtime are unchanged, or when a changed or moved file has the same
+SHA-256 content hash as a cached record, and only while the analyzer
+version matches. The version covers ANALYZER_VERSION, the classifier's
+feature version and the reference calls in use, so changing any of them
+recomputes everything; otherwise only new or changed clips are analysed.
+
+Clips are matched against the schedule of the site that recorded them:
+the monitor records each site of its sites.csv into recordings/<name>/,
+so a clip under a directory named after a site uses that site's timezone
+and sunset table, and any other clip the monitor's defaults.
+
+Usage:
+    python3 archive_analysis.py recordings [--workers N] [--out recordings/analysis.jsonl] [--sites sites.csv]
+    python3 archive_analysis.py recordings --scaling [--sample 64]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import audio_monitor
+import clip_analysis
+import call_classifier
+
+ANALYZER_VERSION = 2  # Bump when the analysis or record format changes
+RESULTS_FILENAME = 'analysis.jsonl'
+HASH_CHUNK = 1 << 20
+
+
+def find_clips(root):
+    """Every .wav under root, sorted."""
+    clips = []
+    for dirpath, _, filenames in os.walk(root):
+        clips += [os.path.join(dirpath, f) for f in filenames if f.lower().endswith('.wav')]
+    return sorted(clips)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def default_sites_path():
+    """The monitor's sites.csv, or None when it monitors a single site."""
+    path = os.path.join(audio_monitor.get_script_dir(), audio_monitor.SITES_FILENAME)
+    return path if os.path.exists(path) else None
+
+
+def load_sites(sites_path):
+    """Map site name -> audio_monitor.Site from a sites CSV ({} for None)."""
+    return {site.name: site for site in audio_monitor.load_sites(sites_path)} if sites_path else {}
+
+
+def site_for(path, sites):
+    """The Site a clip was recorded at: its nearest directory named after one, else None."""
+    directory = os.path.dirname(os.path.abspath(path))
+    while True:
+        site = sites.get(os.path.basename(directory))
+        if site is not None:
+            return site
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def analyzer_version(ref_dir, sites_path=None):
+    """Version string for results: analysis code plus the reference calls and sites in use."""
+    refs = call_classifier.find_references(ref_dir) if ref_dir else {}
+    inputs = sorted(refs.items())
+    if sites_path:
+        inputs.append(('sites', sites_path))
+    if not inputs:
+        return '{}/{}/norefs'.format(ANALYZER_VERSION, call_classifier.FEATURE_VERSION)
+    digest = hashlib.sha256()
+    for name, path in inputs:
+        st = os.stat(path)
+        digest.update('{}:{}:{};'.format(name, st.st_size, st.st_mtime_ns).encode())
+    return '{}/{}/{}'.format(ANALYZER_VERSION, call_classifier.FEATURE_VERSION, digest.hexdigest()[:12])
+
+
+def load_results(path):
+    """Return {clip path: record} from a results file (later records win)."""
+    records = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Partly written line from an interrupted run
+                records[record['path']] = record
+    except FileNotFoundError:
+        pass
+    return records
+
+
+# Per-process state for the workers, set up once by _init_worker
+_refs = None
+_known = {}
+_sites = {}
+
+
+def _init_worker(ref_dir, known, sites_path):
+    global _refs, _known, _sites
+    _known = known
+    _sites = load_sites(sites_path)
+    _refs = None
+    if ref_dir and call_classifier.find_references(ref_dir):
+        _refs = call_classifier.load_references(ref_dir, build=False)  # Built by process_archive
+
+
+def analyze_file(path):
+    """Worker: return the analysis fields for one clip, reusing a record with the same content."""
+    st = os.stat(path)
+    sha256 = file_hash(path)
+    record = {'path': path, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': sha256}
+    if sha256 in _known:
+        record.update(_known[sha256])
+        record['reused'] = True
+        return record
+    site = site_for(path, _sites)
+    result = clip_analysis.analyze_clip(path, site)
+    record.update(start=result['start'], length=result['length'], onset=result['onset'],
+                  key=result['key'], event=result['event'], scheduled=result['scheduled'],
+                  latency=result['latency'], rms=result['rms'])
+    if _refs is not None:
+        classified = call_classifier.classify_clip(path, _refs, site)
+        record.update(call=classified['call'], confidence=classified['confidence'],
+                      offset=classified['offset'], expected=classified['expected'])
+    return record
+
+
+RESULT_FIELDS = ('start', 'length', 'onset', 'key', 'event', 'scheduled', 'latency', 'rms', 'call',
+                 'confidence', 'offset', 'expected')
+
+
+def process_archive(clips, out_path, workers=None, ref_dir=call_classifier.DEFAULT_REFERENCE_DIR,
+                    force=False, sites_path=None):
+    """Analyse clips not already in out_path, appending records as they finish.
+
+    sites_path is a sites CSV giving each site's schedule (see site_for()).
+    Returns (analysed, cached, failed) counts.
+    """
+    version = analyzer_version(ref_dir, sites_path)
+    cache = {} if force else load_results(out_path)
+    todo = []
+    cached = 0
+    known = {}
+    for record in cache.values():
+        if record.get('version') == version:
+            known[record['sha256']] = {k: record.get(k) for k in RESULT_FIELDS}
+    for path in clips:
+        record = cache.get(path)
+        if record is not None and record.get('version') == version:
+            st = os.stat(path)
+            if record['size'] == st.st_size and record['mtime_ns'] == st.st_mtime_ns:
+                cached += 1
+                continue
+        todo.append(path)
+
+    analysed = failed = 0
+    if todo:
+        if ref_dir and call_classifier.find_references(ref_dir):
+            call_classifier.build_cache(ref_dir)  # Once, before the workers map it
+        with open(out_path, 'a') as out, ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(ref_dir, known, sites_path)) as pool:
+            futures = {pool.submit(analyze_file, path): path for path in todo}
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"{futures[future]}: {e}")
+                    continue
+                record['version'] = version
+                record.pop('reused', None)
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+                cache[record['path']] = record
+                analysed += 1
+
+    # Rewrite without superseded records or records of deleted clips
+    tmp = out_path + '.tmp'
+    with open(tmp, 'w') as f:
+        for path in sorted(cache):
+            if os.path.exists(path):
+                f.write(json.dumps(cache[path]) + '\n')
+    os.replace(tmp, out_path)
+    return analysed, cached, failed
+
+
+def scaling_report(clips, ref_dir, sample=64, sites_path=None):
+    """Time an uncached pass over `sample` clips with 1, 2, 4 ... cores."""
+    import tempfile
+    clips = clips[:sample]
+    cores = os.cpu_count() or 1
+    counts = []
+    n = 1
+    while n < cores:
+        counts.append(n)
+        n *= 2
+    counts.append(cores)
+    base = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in counts:
+            out = os.path.join(tmp, f'{workers}.jsonl')
+            t0 = time.perf_counter()
+            process_archive(clips, out, workers, ref_dir, force=True, sites_path=sites_path)
+            elapsed = time.perf_counter() - t0
+            rate = len(clips) / elapsed
+            base = base or rate
+            print(f"{workers:3d} worker(s): {rate:7.1f} clips/s, speedup {rate / base:.2f}x")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Analyse every clip in the recording archive.")
+    parser.add_argument('archive', help="directory of recorded clips")
+    parser.add_argument('--out', help="results file (default: ARCHIVE/{})".format(RESULTS_FILENAME))
+    parser.add_argument('--workers', type=int, help="processes (default: one per core)")
+    parser.add_argument('--refs', default=call_classifier.DEFAULT_REFERENCE_DIR,
+                        help="reference calls for classification")
+    parser.add_argument('--sites', default=default_sites_path(),
+                        help="sites CSV of a multi-site monitor (default: the monitor's, if any)")
+    parser.add_argument('--force', action='store_true', help="ignore cached results")
+    parser.add_argument('--scaling', action='store_true', help="report throughput per core count")
+    parser.add_argument('--sample', type=int, default=64, help="clips used by --scaling")
+    args = parser.parse_args(argv[1:])
+
+    clips = find_clips(args.archive)
+    if not clips:
+        print(f"No clips in {args.archive}")
+        return 1
+    if args.scaling:
+        scaling_report(clips, args.refs, args.sample, args.sites)
+        return 0
+    out = args.out or os.path.join(args.archive, RESULTS_FILENAME)
+    t0 = time.perf_counter()
+    analysed, cached, failed = process_archive(clips, out, args.workers, args.refs, args.force, args.sites)
+    elapsed = time.perf_counter() - t0
+    rate = analysed / elapsed if elapsed > 0 else 0
+    print(f"{len(clips)} clip(s): {analysed} analysed, {cached} cached, {failed} failed "
+          f"in {elapsed:.1f}s ({rate:.1f} clips/s) -> {out}")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,145 @@
+# archive_analysis_test
+# Incremental caching of archive analysis results, on synthetic clips:
+#   python3 archive_analysis_test.py
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import wave
+import zoneinfo
+
+import numpy as np
+
+import archive_analysis
+import call_classifier
+import sunset_table
+from audio_capture import clip_name
+from checks import check, finish, write_wav
+
+RATE = 16000
+
+
+def write_clip(directory, started, onset_s, length_s=20, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal(length_s * RATE) * 40
+    t = np.arange(len(x) - int(onset_s * RATE)) / RATE
+    x[int(onset_s * RATE):] += 5000 * np.sin(2 * np.pi * 466.16 * t)
+    path = os.path.join(directory, clip_name(started))
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(x.astype('<i2').tobytes())
+    return path
+
+
+def records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def write_archive(tmp):
+    archive = os.path.join(tmp, 'recordings')
+    os.makedirs(os.path.join(archive, '2025-06'))
+    day = datetime.datetime(2025, 6, 1)
+    paths = []
+    for i in range(6):
+        colors = (day + datetime.timedelta(days=i, hours=8)).timestamp()
+        paths.append(write_clip(os.path.join(archive, '2025-06'), colors - 10, 10.2 + i * 0.1, seed=i))
+    return archive, paths
+
+
+def test_incremental(tmp):
+    archive, paths = write_archive(tmp)
+    out = os.path.join(tmp, 'analysis.jsonl')
+    no_refs = os.path.join(tmp, 'no_references')
+    clips = archive_analysis.find_clips(archive)
+    check('clips found recursively', clips == sorted(paths))
+
+    analysed, cached, failed = archive_analysis.process_archive(clips, out, 2, no_refs)
+    check('first run analyses every clip', (analysed, cached, failed) == (6, 0, 0))
+    results = {r['path']: r for r in records(out)}
+    check('one record per clip', len(results) == 6)
+    latency = results[paths[3]]['latency']
+    check('record carries the clip latency', latency is not None and abs(latency - 0.5) < 0.01)
+
+    check('second run is fully cached',
+          archive_analysis.process_archive(clips, out, 2, no_refs) == (0, 6, 0))
+
+    # Touching a clip forces a re-hash; unchanged content reuses its record
+    os.utime(paths[0], ns=(0, 1))
+    moved = os.path.join(archive, os.path.basename(paths[1]))
+    shutil.move(paths[1], moved)
+    clips = archive_analysis.find_clips(archive)
+    check('touched and moved clips re-hashed only',
+          archive_analysis.process_archive(clips, out, 2, no_refs) == (2, 4, 0))
+    results = {r['path']: r for r in records(out)}
+    check('moved clip keeps its result and the old path is dropped',
+          moved in results and paths[1] not in results and results[moved]['latency'] is not None)
+
+    # Changing the content of a clip recomputes it
+    day = datetime.datetime(2025, 6, 1)
+    write_clip(os.path.dirname(paths[2]), (day + datetime.timedelta(days=2, hours=8)).timestamp() - 10, 12.0)
+    archive_analysis.process_archive(clips, out, 2, no_refs)
+    results = {r['path']: r for r in records(out)}
+    check('changed clip recomputed', abs(results[paths[2]]['latency'] - 2.0) < 0.01)
+
+    # A new analyzer version invalidates everything
+    archive_analysis.ANALYZER_VERSION += 1
+    check('version change recomputes all',
+          archive_analysis.process_archive(clips, out, 2, no_refs) == (6, 0, 0))
+
+
+def test_reference_cache(tmp):
+    # Reference calls: the cache is built once before the workers start, which only read it
+    archive, _ = write_archive(tmp)
+    out = os.path.join(tmp, 'analysis.jsonl')
+    refs = os.path.join(tmp, 'references')
+    os.makedirs(refs)
+    for i, name in enumerate(call_classifier.REFERENCE_NAMES):
+        t = np.arange(3 * RATE) / RATE
+        write_wav(os.path.join(refs, name + '.wav'), 8000 * np.sin(2 * np.pi * (300 + 100 * i) * t), RATE)
+    check('classified with a cold reference cache',
+          archive_analysis.process_archive(archive_analysis.find_clips(archive), out, 2, refs) == (6, 0, 0)
+          and all('confidence' in r for r in records(out)))
+    check('cache built before the pool', call_classifier.build_cache(refs) == [])
+
+
+def test_sites(tmp):
+    # Clips under recordings/<site>/ are matched in that site's timezone and from its table
+    with open(os.path.join(tmp, 'shared.bin'), 'wb') as f:
+        f.write(sunset_table.pack_table([1200] * 365, datetime.date(2025, 1, 1)))
+    sites_path = os.path.join(tmp, 'sites.csv')
+    with open(sites_path, 'w') as f:
+        f.write("name,timezone,sunset_table\n"
+                "fort_west,America/Los_Angeles,shared.bin\n"
+                "fort_east,America/New_York,shared.bin\n")
+    archive = os.path.join(tmp, 'site_recordings')
+    expected = {}
+    for name, tz in (('fort_west', 'America/Los_Angeles'), ('fort_east', 'America/New_York')):
+        directory = os.path.join(archive, name, '2025-06')
+        os.makedirs(directory)
+        for hour, key in ((8, '0800'), (20, 'sunset')):
+            event = datetime.datetime(2025, 6, 2, hour, tzinfo=zoneinfo.ZoneInfo(tz)).timestamp()
+            expected[write_clip(directory, event - 10, 10.5)] = (key, event)
+    sites = archive_analysis.load_sites(sites_path)
+    check('site found from the clip directory',
+          archive_analysis.site_for(next(iter(expected)), sites).name == 'fort_west'
+          and archive_analysis.site_for(os.path.join(tmp, 'x.wav'), sites) is None)
+    out = os.path.join(tmp, 'sites.jsonl')
+    clips = archive_analysis.find_clips(archive)
+    check('two sites analysed', archive_analysis.process_archive(
+        clips, out, 2, None, sites_path=sites_path) == (4, 0, 0))
+    results = {r['path']: r for r in records(out)}
+    check("each clip matched to its site's event",
+          all((results[path]['key'], results[path]['scheduled']) == event
+              and abs(results[path]['latency'] - 0.5) < 0.01 for path, event in expected.items()))
+
+
+if __name__ == '__main__':
+    for test in (test_incremental, test_reference_cache, test_sites):
+        with tempfile.TemporaryDirectory() as tmp:
+            test(tmp)
+    finish()
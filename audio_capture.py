@@ -0,0 +1,351 @@
+"""Ring-buffer audio capture for the audio monitor.
+
+A persistent reader streams raw PCM (16-bit little-endian) from an `arecord`
+pipe, or from a WAV file standing in for the sound card, into a fixed-size
+ring buffer holding the last few seconds of audio. When a recording starts,
+the clip is opened with the buffered pre-roll already in it and every chunk
+read after that is appended until the recording stops, so a clip includes
+audio from before the trigger without starting the recorder early. Memory
+use is the ring buffer plus one chunk, whatever the clip length.
+
+RingBufferCapture has the start()/stop() interface of the monitor's recorder
+backends; pump() reads one chunk, and open() runs it on a reader thread.
+attach() instead reads an ArecordSource from an asyncio event loop as data
+arrives, so one loop can serve many sound cards without a thread each.
+start() and stop() take an optional holder name, so the scheduled
+recordings and the continuous listener can share one clip: it closes when
+the last holder stops.
+
+ContinuousListener watches every chunk with a BugleDetector (a band-energy
+test, well under 1% of a core) and holds a clip open while bugle audio is
+heard, plus padding after it. With the ring buffer supplying the padding
+before it, manual plays from the player's buttons are captured without
+recording around the clock. The listener needs NumPy.
+"""
+import collections
+import datetime
+import math
+import os
+import shutil
+import subprocess
+import threading
+import time
+import wave
+
+try:
+    import numpy as np
+except ImportError:  # Only ContinuousListener needs it
+    np = None
+
+SAMPLE_WIDTH = 2  # S16_LE
+DEFAULT_RATE = 48000
+DEFAULT_CHANNELS = 1
+DEFAULT_PRE_ROLL_S = 10
+CHUNK_S = 0.1
+CLIPS_KEPT = 100  # Most recent clips listed in RingBufferCapture.clips; the files stay on disk
+# BugleDetector defaults: the Bb bugle's partials and first harmonics
+BUGLE_BAND_HZ = (200.0, 2000.0)
+DETECT_THRESHOLD_DB = 12.0  # Band level above the running noise floor
+DETECT_BAND_RATIO = 0.6  # Share of the chunk's energy that must be in the band
+NOISE_FLOOR_TC_S = 30.0  # Time constant of the noise floor while quiet
+MIN_ACTIVE_S = 0.3  # Detected audio must last this long to open a clip
+POST_PAD_S = 5.0  # Audio kept after the last detected chunk
+SEGMENTS_KEPT = 100  # Most recent segments listed in ContinuousListener.segments
+
+
+def clip_name(started):
+    """File name for a clip whose first sample is at epoch `started`, to the millisecond."""
+    t = datetime.datetime.fromtimestamp(started)
+    return t.strftime('%Y%m%d-%H%M%S-') + f'{t.microsecond // 1000:03d}.wav'
+
+
+def clip_start_time(path):
+    """Epoch of a clip's first sample, from a name written by clip_name()."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    t = datetime.datetime.strptime(stem, '%Y%m%d-%H%M%S-%f')
+    return t.timestamp()
+
+
+class RingBuffer:
+    """The most recent `size` bytes of a stream."""
+    def __init__(self, size):
+        self._buf = bytearray(size)
+        self.size = size
+        self.total = 0  # Bytes written since creation
+
+    def write(self, data):
+        data = memoryview(data)
+        if len(data) > self.size:
+            self.total += len(data) - self.size
+            data = data[len(data) - self.size:]
+        pos = self.total % self.size
+        first = min(len(data), self.size - pos)
+        self._buf[pos:pos + first] = data[:first]
+        self._buf[:len(data) - first] = data[first:]
+        self.total += len(data)
+
+    def tail(self, n):
+        """Return the last n bytes written (fewer if not retained)."""
+        n = min(n, self.total, self.size)
+        start = (self.total - n) % self.size
+        if start + n <= self.size:
+            return bytes(self._buf[start:start + n])
+        return bytes(self._buf[start:]) + bytes(self._buf[:start + n - self.size])
+
+
+class ArecordSource:
+    """Raw PCM from a persistent `arecord` process."""
+    def __init__(self, rate=DEFAULT_RATE, channels=DEFAULT_CHANNELS, device=None):
+        self.rate = rate
+        self.channels = channels
+        cmd = ['arecord', '-q', '-t', 'raw', '-f', 'S16_LE', '-r', str(rate), '-c', str(channels)]
+        if device:
+            cmd += ['-D', device]
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+
+    @staticmethod
+    def available():
+        return shutil.which('arecord') is not None
+
+    def read(self, n):
+        return self._proc.stdout.read(n)
+
+    def fileno(self):
+        return self._proc.stdout.fileno()
+
+    def close(self):
+        self._proc.terminate()
+        self._proc.wait()
+
+
+class WavFileSource:
+    """Raw PCM from a 16-bit WAV file, in place of a sound card for tests."""
+    def __init__(self, path):
+        self._wav = wave.open(path, 'rb')
+        if self._wav.getsampwidth() != SAMPLE_WIDTH:
+            raise ValueError(f"{path} is not 16-bit PCM")
+        self.rate = self._wav.getframerate()
+        self.channels = self._wav.getnchannels()
+
+    def read(self, n):
+        return self._wav.readframes(n // (SAMPLE_WIDTH * self.channels))
+
+    def close(self):
+        self._wav.close()
+
+
+class RingBufferCapture:
+    """Recorder backend writing WAV clips from a ring buffer with pre-roll."""
+    def __init__(self, source, clip_dir, pre_roll_s=DEFAULT_PRE_ROLL_S, clock=time.time):
+        self.source = source
+        self.clip_dir = clip_dir
+        self.pre_roll_s = pre_roll_s
+        self.clock = clock
+        self.frame_size = SAMPLE_WIDTH * source.channels
+        self.bytes_per_s = source.rate * self.frame_size
+        self.chunk_size = max(self.frame_size, int(source.rate * CHUNK_S) * self.frame_size)
+        self.ring = RingBuffer(max(1, int(pre_roll_s * source.rate)) * self.frame_size)
+        self.clips = collections.deque(maxlen=CLIPS_KEPT)  # (path, epoch of the clip's first sample)
+        self.listeners = []  # Called with each chunk read, outside the lock
+        self._clip = None
+        self._holders = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._loop = None  # Event loop reading the source, when attached
+        self._pending = bytearray()  # Bytes read from the loop, short of a chunk
+
+    def open(self):
+        """Starts the reader thread."""
+        self._running = True
+        self._thread = threading.Thread(target=self._read_loop, daemon=True)
+        self._thread.start()
+
+    def attach(self, loop):
+        """Reads the source from `loop` whenever it has data, in place of open().
+
+        The source needs a fileno(), as ArecordSource has. Data is passed on
+        in whole chunks, as pump() does.
+        """
+        fd = self.source.fileno()
+        os.set_blocking(fd, False)
+        loop.add_reader(fd, self._readable, fd)
+        self._loop = loop
+
+    def _readable(self, fd):
+        try:
+            data = os.read(fd, self.chunk_size)
+        except BlockingIOError:
+            return
+        if not data:
+            self._loop.remove_reader(fd)  # End of stream
+            return
+        self._pending += data
+        while len(self._pending) >= self.chunk_size:
+            self.feed(bytes(self._pending[:self.chunk_size]))
+            del self._pending[:self.chunk_size]
+
+    def close(self):
+        self._running = False
+        if self._loop is not None:
+            self._loop.remove_reader(self.source.fileno())
+            self._loop = None
+        with self._lock:
+            self._holders.clear()
+        self.stop()
+        self.source.close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _read_loop(self):
+        while self._running and self.pump():
+            pass
+
+    def pump(self):
+        """Reads one chunk from the source. Returns False at end of stream."""
+        data = self.source.read(self.chunk_size)
+        if not data:
+            return False
+        self.feed(data)
+        return True
+
+    def feed(self, data):
+        """Adds a chunk of audio to the ring buffer, the open clip and the listeners."""
+        with self._lock:
+            self.ring.write(data)
+            if self._clip is not None:
+                self._clip.writeframesraw(data)
+        for listener in self.listeners:
+            listener(data)
+
+    def start(self, holder='default'):
+        """Opens a clip with the buffered pre-roll, or joins the open one. Returns its path."""
+        with self._lock:
+            self._holders.add(holder)
+            if self._clip is not None:
+                return self.clips[-1][0]
+            pre_roll = self.ring.tail(self.ring.size)
+            started = self.clock() - len(pre_roll) / self.bytes_per_s
+            os.makedirs(self.clip_dir, exist_ok=True)
+            name = clip_name(started)
+            path = os.path.join(self.clip_dir, name)
+            clip = wave.open(path, 'wb')
+            clip.setnchannels(self.source.channels)
+            clip.setsampwidth(SAMPLE_WIDTH)
+            clip.setframerate(self.source.rate)
+            clip.writeframesraw(pre_roll)
+            self._clip = clip
+            self.clips.append((path, started))
+        print(f"[{datetime.datetime.now()}] Recording {path} with {len(pre_roll) / self.bytes_per_s:.1f}s pre-roll")
+        return path
+
+    @property
+    def open_clip(self):
+        """Path of the clip being written, or None."""
+        with self._lock:
+            return self.clips[-1][0] if self._clip is not None else None
+
+    def stop(self, holder='default'):
+        """Releases `holder`; closes the clip when no holder remains.
+
+        Returns the clip's path when it was closed, else None.
+        """
+        with self._lock:
+            self._holders.discard(holder)
+            if self._holders or self._clip is None:
+                return None
+            clip, self._clip = self._clip, None
+            clip.close()  # Fixes up the WAV header lengths
+        path = self.clips[-1][0]
+        print(f"[{datetime.datetime.now()}] Saved {path}")
+        return path
+
+
+class BugleDetector:
+    """Decides per chunk whether bugle audio is playing.
+
+    A chunk is active when its energy in the bugle band is DETECT_THRESHOLD_DB
+    above the running noise floor and makes up most of the chunk's energy,
+    which rejects broadband noise such as wind or traffic. The floor follows
+    the band level slowly while quiet and drops at once to a quieter chunk.
+    One rfft per chunk: at 10 chunks a second this is a tiny fraction of a core.
+    """
+    def __init__(self, rate, band=BUGLE_BAND_HZ, threshold_db=DETECT_THRESHOLD_DB,
+                 band_ratio=DETECT_BAND_RATIO, floor_tc_s=NOISE_FLOOR_TC_S):
+        self.rate = rate
+        self.band = band
+        self.threshold_db = threshold_db
+        self.band_ratio = band_ratio
+        self.floor_tc_s = floor_tc_s
+        self.floor = None  # Band level of background noise, dB
+        self._masks = {}  # Chunk length -> boolean mask of in-band rfft bins
+
+    def update(self, samples):
+        n = len(samples)
+        if n == 0:
+            return False
+        mask = self._masks.get(n)
+        if mask is None:
+            freqs = np.fft.rfftfreq(n, 1.0 / self.rate)
+            mask = self._masks[n] = (freqs >= self.band[0]) & (freqs <= self.band[1])
+        spectrum = np.fft.rfft(samples.astype(np.float32))
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        total = float(power.sum()) + 1e-9
+        in_band = float(power[mask].sum()) + 1e-9
+        level = 10 * math.log10(in_band / n)
+        if self.floor is None:
+            self.floor = level
+        active = level >= self.floor + self.threshold_db and in_band / total >= self.band_ratio
+        if not active:
+            if level < self.floor:
+                self.floor = level
+            else:
+                self.floor += (level - self.floor) * min(1.0, n / self.rate / self.floor_tc_s)
+        return active
+
+
+class ContinuousListener:
+    """Holds a RingBufferCapture clip open while its detector hears bugle audio.
+
+    Register with capture.listeners.append(listener). A clip opens once
+    detected audio has lasted min_active_s (the ring buffer supplies the
+    audio before it) and is released post_pad_s after the last detected
+    chunk; on_segment(path, start, end) then reports the epochs the audio
+    was detected between.
+    """
+    HOLDER = 'listener'
+
+    def __init__(self, capture, detector=None, min_active_s=MIN_ACTIVE_S, post_pad_s=POST_PAD_S,
+                 on_segment=None):
+        if np is None:
+            raise RuntimeError("Continuous listening needs NumPy")
+        self.capture = capture
+        self.detector = detector or BugleDetector(capture.source.rate)
+        self.min_active_s = min_active_s
+        self.post_pad_s = post_pad_s
+        self.on_segment = on_segment
+        self.segments = collections.deque(maxlen=SEGMENTS_KEPT)  # (path, start, end) of recent segments
+        self._channels = capture.source.channels
+        self._active_s = 0.0  # Length of the current run of active chunks
+        self._segment = None  # (path, start) while a clip is held
+        self._last_active = None
+
+    def __call__(self, data):
+        samples = np.frombuffer(data, dtype='<i2')[::self._channels]
+        seconds = len(samples) / self.capture.source.rate
+        now = self.capture.clock()
+        if self.detector.update(samples):
+            self._active_s += seconds
+            self._last_active = now
+            if self._segment is None and self._active_s >= self.min_active_s:
+                path = self.capture.start(self.HOLDER)
+                self._segment = (path, now - self._active_s)
+        else:
+            self._active_s = 0.0
+            if self._segment is not None and now - self._last_active >= self.post_pad_s:
+                self.capture.stop(self.HOLDER)
+                path, start = self._segment
+                self._segment = None
+                self.segments.append((path, start, self._last_active))
+                if self.on_segment is not None:
+                    self.on_segment(path, start, self._last_active)
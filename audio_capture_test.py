@@ -0,0 +1,183 @@
+# audio_capture_test
+# Ring buffer, pre-roll clip and continuous listening tests, using a WAV file as the sound card:
+#   python3 audio_capture_test.py
+
+import asyncio
+import os
+import struct
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from audio_capture import (CLIPS_KEPT, SEGMENTS_KEPT, BugleDetector, ContinuousListener, RingBuffer,
+                           RingBufferCapture, WavFileSource)
+from checks import check, finish, write_wav
+
+RATE = 8000
+
+
+def read_samples(path):
+    with wave.open(path, 'rb') as f:
+        data = f.readframes(f.getnframes())
+    return list(struct.unpack('<%dh' % (len(data) // 2), data))
+
+
+def test_ring_buffer():
+    ring = RingBuffer(8)
+    check('empty tail', ring.tail(4) == b'')
+    ring.write(b'abc')
+    check('tail before wrapping', ring.tail(8) == b'abc' and ring.tail(2) == b'bc')
+    ring.write(b'defghij')
+    check('tail across the wrap', ring.tail(8) == b'cdefghij' and ring.tail(3) == b'hij')
+    ring.write(b'0123456789xyz')
+    check('write larger than the ring keeps the newest bytes', ring.tail(8) == b'56789xyz')
+    check('total counts every byte', ring.total == 23)
+
+
+def test_clip_with_pre_roll():
+    # Samples are their own index, so a clip shows exactly which span it holds
+    with tempfile.TemporaryDirectory() as tmp:
+        source_path = os.path.join(tmp, 'card.wav')
+        write_wav(source_path, [i % 32768 for i in range(RATE * 30)], RATE)
+        now = [1000.0]
+        capture = RingBufferCapture(WavFileSource(source_path), os.path.join(tmp, 'clips'),
+                                    pre_roll_s=2, clock=lambda: now[0])
+        chunks_per_s = RATE // (capture.chunk_size // 2)
+        for _ in range(5 * chunks_per_s):  # 5 s of audio before the trigger
+            capture.pump()
+        check('ring holds only the pre-roll', capture.ring.size == 2 * RATE * 2)
+        path = capture.start()
+        check('clip starts pre-roll seconds before the trigger', capture.clips[0][1] == 998.0)
+        for _ in range(3 * chunks_per_s):
+            capture.pump()
+        capture.stop()
+        for _ in range(chunks_per_s):
+            capture.pump()  # Audio after stop() is not in the clip
+        samples = read_samples(path)
+        check('clip holds pre-roll plus recorded audio', len(samples) == 5 * RATE)
+        check('clip is contiguous from 2 s before the trigger',
+              samples == [i % 32768 for i in range(3 * RATE, 8 * RATE)])
+        now[0] = 1010.0
+        second = capture.start()
+        check('second start without stop reuses the open clip',
+              second != path and capture.start() == second and len(capture.clips) == 2)
+        check('only recent clips kept in memory', capture.clips.maxlen == CLIPS_KEPT)
+        capture.stop()
+        while capture.pump():
+            pass
+        check('end of stream reported', not capture.pump())
+        capture.close()
+
+
+def bugle(seconds, rate, level=6000):
+    """A Bb bugle note: 466 Hz with its first harmonics."""
+    t = np.arange(int(seconds * rate)) / rate
+    return level * sum(np.sin(2 * np.pi * 466.16 * k * t) / k for k in (1, 2, 3))
+
+
+def test_continuous_listening():
+    rate = 16000
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal(120 * rate) * 100  # Background noise
+    x[30 * rate:45 * rate] += bugle(15, rate)  # A manual play
+    x[60 * rate:65 * rate] = rng.standard_normal(5 * rate) * 6000  # Loud broadband noise: a passing truck
+    x[80 * rate:90 * rate] += bugle(10, rate, 1500)  # A quieter play
+    x[100 * rate:100 * rate + rate // 10] += bugle(0.1, rate)  # Too short to be a call
+    with tempfile.TemporaryDirectory() as tmp:
+        source_path = os.path.join(tmp, 'card.wav')
+        write_wav(source_path, x, rate)
+        capture = RingBufferCapture(WavFileSource(source_path), os.path.join(tmp, 'clips'), pre_roll_s=5,
+                                    clock=lambda: 1000.0 + capture.ring.total / capture.bytes_per_s)
+        segments = []
+        listener = ContinuousListener(capture, post_pad_s=5,
+                                      on_segment=lambda *segment: segments.append(segment))
+        capture.listeners.append(listener)
+        shared = None
+        while capture.pump():
+            if shared is None and capture.clock() >= 1040:
+                shared = capture.start()  # A scheduled recording while the listener holds the clip
+                check('scheduled recording joins the listener clip', shared == capture.open_clip)
+            elif shared and capture.clock() >= 1042 and capture.open_clip:
+                check('clip stays open while the listener holds it', capture.stop() is None)
+                shared = False
+        capture.close()
+        check('two plays detected, noise and a short blip ignored ({})'.format(len(segments)),
+              len(segments) == 2 and len(capture.clips) == 2)
+        check('listener remembers only recent segments',
+              list(listener.segments) == segments and listener.segments.maxlen == SEGMENTS_KEPT)
+        check('segments span the plays',
+              all(abs(start - 1000 - a) < 0.5 and abs(end - 1000 - b) < 0.2
+                  for (_, start, end), (a, b) in zip(segments, ((30, 45), (80, 90)))))
+        with wave.open(segments[0][0], 'rb') as f:
+            length = f.getnframes() / f.getframerate()
+        started = capture.clips[0][1] - 1000
+        check('clip padded before and after ({:.1f}s to {:.1f}s)'.format(started, started + length),
+              24 < started < 26 and 49.5 < started + length < 51)
+
+    # The detector's cost on a 48 kHz stream in the monitor's 0.1 s chunks; reported, not checked,
+    # as a loaded host would fail any fixed bound
+    detector = BugleDetector(48000)
+    chunk = (rng.standard_normal(4800) * 1000).astype('<i2')
+    t0 = time.perf_counter()
+    for _ in range(600):
+        detector.update(chunk)
+    used = (time.perf_counter() - t0) / 60
+    print('INFO detector uses {:.3f}% of a core'.format(used * 100))
+
+
+class PipeSource:
+    """Raw PCM written into a pipe, standing in for arecord's stdout."""
+    rate = RATE
+    channels = 1
+
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+
+    def fileno(self):
+        return self.read_fd
+
+    def close(self):
+        os.close(self.read_fd)
+
+
+async def feed_pipe(source, capture, samples):
+    # Odd-sized writes: the capture still passes on whole chunks only
+    data = struct.pack('<%dh' % len(samples), *samples)
+    chunks = []
+    capture.listeners.append(lambda chunk: chunks.append(chunk))
+    for i in range(0, len(data), 1001):
+        os.write(source.write_fd, data[i:i + 1001])
+        await asyncio.sleep(0)
+    os.close(source.write_fd)
+    for _ in range(2000):  # Up to 2 s for the loop to drain the pipe
+        if capture.ring.total == len(data) - len(data) % capture.chunk_size:
+            break
+        await asyncio.sleep(0.001)
+    return chunks
+
+
+def test_attached_to_event_loop():
+    with tempfile.TemporaryDirectory() as tmp:
+        source = PipeSource()
+        capture = RingBufferCapture(source, tmp, pre_roll_s=1)
+
+        async def run():
+            capture.attach(asyncio.get_running_loop())
+            chunks = await feed_pipe(source, capture, [i % 32768 for i in range(RATE * 2 + 100)])
+            capture.close()
+            return chunks
+
+        chunks = asyncio.run(run())
+        check('event loop reads the source in whole chunks',
+              len(chunks) == 2 * RATE // (capture.chunk_size // 2) and all(len(c) == capture.chunk_size for c in chunks))
+        check('ring holds the newest audio', capture.ring.tail(4) == struct.pack('<2h', 2 * RATE - 2, 2 * RATE - 1))
+
+
+if __name__ == '__main__':
+    test_ring_buffer()
+    test_clip_with_pre_roll()
+    test_attached_to_event_loop()
+    test_continuous_listening()
+    finish()
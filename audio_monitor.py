@@ -1,14 +1,74 @@
+import asyncio
 import time
+import csv
+import zoneinfo
 import datetime
+import heapq
 import subprocess
-import csv
+import mmap
 import os
+import struct
 import sys
+from array import array
+
+import audio_capture
+from audio_capture import ArecordSource, ContinuousListener, RingBufferCapture
+from event_index import EventIndex, measure_capture
+import sunset_table
+from sunset_table import read_delta_table
 
 # Configuration
 START_DATE = datetime.date(2025, 1, 1)
 CSV_FILENAME = 'sunset_data.csv'
+# Delta-encoded table shared with the controller (built by sunset_table.py).
+# Used in preference to CSV_FILENAME when present.
+SUNSET_TABLE_FILENAME = os.path.join('controller', 'sunset_data.sdt')
 RECORDING_DURATION = 180 # 3 minutes in seconds
+PRE_ROLL_S = 10 # Audio kept from before each event
+# 'ring' streams from arecord into a ring buffer and saves clips with PRE_ROLL_S of audio
+# from before the trigger; 'audio-recorder' drives the GUI recorder, started PRE_ROLL_S early.
+CAPTURE_BACKEND = 'ring'
+CLIP_DIR = 'recordings'
+# With the ring backend, also save a clip whenever bugle audio is heard (manual plays from the
+# player's buttons included), padded PRE_ROLL_S before and POST_PAD_S after. Needs NumPy.
+CONTINUOUS_LISTEN = True
+POST_PAD_S = 5
+INDEX_FILENAME = 'events.db' # SQLite index of every captured event (event_index.py)
+REFERENCE_DIR = 'references' # Reference calls for classifying captures (call_classifier.py)
+MAX_SLEEP_S = 3600 # Longest single sleep, so a clock change is noticed within the hour
+CLOCK_JUMP_S = 2 # Wall vs monotonic clock disagreement that forces a replan
+# The controller broadcasts each call it triggers (controller/event_broadcast.py); capture starts
+# on arrival, so the recording follows the controller's clock and sunset table. None disables.
+PUSH_PORT = 5005
+# Optional: one row per Colors Machine to monitor from this host (see load_sites). Without it
+# the monitor watches a single site in the host's timezone with the settings above.
+SITES_FILENAME = 'sites.csv'
+
+# (key, description, seconds past midnight or from sunset, relative to sunset, recording seconds)
+EVENTS = (
+    ('0755', '07:55 Event (First Call)', (7 * 60 + 55) * 60, False, 30),
+    ('0800', '08:00 Event (Colors)', 8 * 3600, False, 180),
+    ('sunset_minus_5', 'Sunset-5 Event (First Call)', -5 * 60, True, 30),
+    ('sunset', 'Sunset Event (Retreat)', 0, True, 120),
+    ('2200', '22:00 Event (Taps)', 22 * 3600, False, 120),
+)
+
+# Datagram format of controller/event_broadcast.py
+PUSH_MAGIC = b'CMEV'
+PUSH_VERSION = 1
+PUSH_HEADER = '!4sBBHI'
+PUSH_HEADER_SIZE = struct.calcsize(PUSH_HEADER)
+PUSH_KIND_TRIGGER = 0
+PUSH_KIND_BUTTON = 1
+# Controller event keys that differ from ours
+PUSH_KEYS = {'five_min_before_sunset': 'sunset_minus_5'}
+# Recording seconds for calls played from the MP3 player's buttons
+BUTTON_DURATIONS = {
+    'BTN-Star_Spangled_Banner': 180,  # Followed by Carry On
+    'BTN-TAPS': 120,
+    'BTN-First_Call': 30,
+    'BTN-Retreat': 120,  # Followed by Carry On
+}
 
 def get_script_dir():
     return os.path.dirname(os.path.abspath(__file__))
@@ -17,17 +77,103 @@ def get_day_number(target_date):
     delta = target_date - START_DATE
     return delta.days
 
+# Sunset tables by absolute path: (start date, minutes indexed by day number), each loaded once
+# and shared by every site that uses it
+_tables = {}
+
+def load_table(path, start_date=START_DATE):
+    """Returns (start date, sunset minutes by day number) of a .sdt, .bin or CSV table.
+
+    A .bin table is memory-mapped rather than read into memory. A CSV has no
+    header, so its day numbers count from start_date.
+    """
+    key = os.path.abspath(path)
+    if key in _tables:
+        return _tables[key]
+    extension = os.path.splitext(path)[1]
+    if extension == '.sdt':
+        start_date, minutes = read_delta_table(path)
+        table = array('H', minutes)
+    elif extension == '.bin' and sys.byteorder == 'little':
+        with open(path, 'rb') as f:
+            start_date, count = sunset_table.read_header(f)
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        end = sunset_table.HEADER_SIZE + count * sunset_table.RECORD_SIZE
+        table = memoryview(mapped)[sunset_table.HEADER_SIZE:end].cast('H')
+    elif extension == '.bin':
+        with open(path, 'rb') as f:
+            start_date, count = sunset_table.read_header(f)
+            table = array('H', f.read(count * sunset_table.RECORD_SIZE))
+        table.byteswap()
+    else:
+        table = array('H', sunset_table.read_csv(path))
+    _tables[key] = (start_date, table)
+    return _tables[key]
+
+def load_sunset_table():
+    """Returns the sunset data as an array('H') indexed by day number.
+
+    Uses the controller's delta table when present, otherwise the CSV.
+    """
+    table_path = os.path.join(get_script_dir(), SUNSET_TABLE_FILENAME)
+    if not os.path.exists(table_path):
+        table_path = os.path.join(get_script_dir(), CSV_FILENAME)
+    start_date, table = load_table(table_path)
+    if start_date != START_DATE:
+        raise ValueError(f"{table_path} starts on {start_date}, expected {START_DATE}")
+    return table
+
+class Site:
+    """One monitored Colors Machine: its timezone, sunset table, capture device and controller.
+
+    tz None is the host's timezone and table None the monitor's own sunset
+    data. Tables are shared between sites through load_table().
+    """
+    __slots__ = ('name', 'tz', 'start_date', 'table', 'device', 'controller')
+
+    def __init__(self, name='', tz=None, table=None, start_date=START_DATE, device=None, controller=None):
+        self.name = name
+        self.tz = tz
+        self.start_date = start_date
+        self.table = table
+        self.device = device
+        self.controller = controller  # Address the site's controller broadcasts from
+
+    def today(self, epoch):
+        return datetime.datetime.fromtimestamp(epoch, self.tz).date()
+
+    def sunset_minutes(self, date):
+        if self.table is None:
+            return get_sunset_minutes(get_day_number(date))
+        day = (date - self.start_date).days
+        if 0 <= day < len(self.table):
+            return self.table[day]
+        return None
+
+def load_sites(path):
+    """Returns [Site] from a sites CSV.
+
+    Columns: name, timezone (IANA name), sunset_table (.sdt, .bin or CSV,
+    relative to the CSV's directory) and optionally device (arecord -D
+    name) and controller (IP address of the site's controller).
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    sites = []
+    with open(path, 'r') as csvfile:
+        for row in csv.DictReader(csvfile):
+            start_date, table = load_table(os.path.join(base, row['sunset_table']))
+            sites.append(Site(row['name'], zoneinfo.ZoneInfo(row['timezone']), table, start_date,
+                              row.get('device') or None, row.get('controller') or None))
+    return sites
+
 def get_sunset_minutes(day_number):
-    csv_path = os.path.join(get_script_dir(), CSV_FILENAME)
     try:
-        with open(csv_path, 'r') as csvfile:
-            reader = csv.reader(csvfile)
-            next(reader, None)  # Skip header
-            for row in reader:
-                if len(row) == 2 and int(row[0]) == day_number:
-                    return int(row[1])
+        table = load_sunset_table()
     except Exception as e:
-        print(f"Error reading CSV: {e}")
+        print(f"Error reading sunset data: {e}")
+        return None
+    if 0 <= day_number < len(table):
+        return table[day_number]
     return None
 
 def control_recorder(command):
@@ -41,96 +187,409 @@ def control_recorder(command):
     except FileNotFoundError:
         print("Error: audio-recorder executable not found.")
 
-def record_for_duration(duration):
-    control_recorder('start')
-    time.sleep(duration)
-    control_recorder('stop')
+async def control_recorder_async(command):
+    """control_recorder() as a subprocess of the event loop, which keeps running meanwhile."""
+    print(f"[{datetime.datetime.now()}] Sending command: {command}")
+    try:
+        process = await asyncio.create_subprocess_exec('audio-recorder', '--command', command)
+        await process.wait()
+    except FileNotFoundError:
+        print("Error: audio-recorder executable not found.")
+
+class AudioRecorderCLI:
+    """Recorder backend that drives the audio-recorder application's CLI.
 
-def main():
-    print("Starting Audio Monitor...")
-    control_recorder('status') # Check status on startup
+    start() and stop() return at once: each command runs as a subprocess on
+    the event loop, after any command still running, so they reach
+    audio-recorder in order without holding up the other recordings.
+    """
+    pre_roll_s = 0  # Records only from start(), so it is triggered early instead
 
-    # State tracking to avoid double triggering in the same minute
-    triggered_events = {
-        '0755': False,
-        '0800': False,
-        'sunset_minus_5': False,
-        'sunset': False,
-        '2200': False
-    }
-    
-    current_date = datetime.date.today()
-    day_num = get_day_number(current_date)
-    sunset_mins = get_sunset_minutes(day_num)
-    
-    if sunset_mins:
-        sunset_time = datetime.time(sunset_mins // 60, sunset_mins % 60)
-        print(f"Today's sunset is at {sunset_time.strftime('%H:%M')}")
-    else:
-        print("Could not find sunset time for today.")
+    def __init__(self):
+        self._sending = None  # Task sending the last queued command
+
+    def start(self):
+        self._queue('start')
+
+    def stop(self):
+        self._queue('stop')
+
+    def _queue(self, command):
+        previous = self._sending
+
+        async def send():
+            if previous is not None:
+                await previous
+            await control_recorder_async(command)
+
+        self._sending = asyncio.get_running_loop().create_task(send())
+
+    async def drain(self):
+        """Waits until every queued command has been sent."""
+        if self._sending is not None:
+            await self._sending
+
+class SystemClock:
+    """Wall and monotonic time plus an asyncio sleep; tests substitute a virtual clock."""
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+class RecordingScheduler:
+    """Runs each event's recording window as an independent asyncio task.
+
+    Windows that overlap share one capture: the recorder is started when the
+    first window opens and stopped when the last open window closes, so an
+    event never waits for, or cuts short, another event's recording.
+
+    When a capture stops, on_capture(path, windows) is called with the path
+    the recorder returned (None if it has none) and the (key, start, stop)
+    of every window the capture covered.
+    """
+    def __init__(self, recorder, clock=None, on_capture=None):
+        self.recorder = recorder
+        self.clock = clock or SystemClock()
+        self.on_capture = on_capture
+        self._tasks = {}  # key -> task for its window
+        self._open = set()  # keys whose window is open
+        self._opened = {}  # key -> start of the window it last opened
+        self._capture_path = None
+        self._closed = []  # (key, start, stop) of windows closed in the current capture
+
+    def schedule(self, key, start, stop, description=None):
+        """Records from epoch `start` to `stop` under `key`.
+
+        Scheduling a key again replaces its pending window. A window that has
+        already opened for the same start is ignored, so the day's plan can be
+        rebuilt at any time without recording an event twice.
+        """
+        if self._opened.get(key) == start:
+            return None
+        self.cancel(key)
+        task = asyncio.ensure_future(self._run(key, start, stop, description or key))
+        self._tasks[key] = task
+        return task
+
+    def cancel(self, key):
+        """Cancels a window that has not opened yet. Returns True if one was pending."""
+        task = self._tasks.get(key)
+        if task is None or task.done() or key in self._open:
+            return False
+        task.cancel()
+        del self._tasks[key]
+        return True
+
+    def cancel_pending(self):
+        for key in list(self._tasks):
+            self.cancel(key)
+
+    def is_recording(self):
+        return bool(self._open)
+
+    def is_open(self, key):
+        return key in self._open
+
+    async def wait(self):
+        """Waits for every scheduled window to close."""
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def _run(self, key, start, stop, description):
+        delay = start - self.clock.time()
+        if delay > 0:
+            await self.clock.sleep(delay)
+        self._opened[key] = start
+        late = self.clock.time() - start
+        if late > 1:
+            print(f"Recording {description} {late:.0f}s late")
+        if not self._open:
+            self._capture_path = self.recorder.start()
+        else:
+            print(f"{description} overlaps a recording in progress; extending it")
+        self._open.add(key)
+        try:
+            remaining = stop - self.clock.time()
+            if remaining > 0:
+                await self.clock.sleep(remaining)
+        finally:
+            self._open.discard(key)
+            self._closed.append((key, start, self.clock.time()))
+            if not self._open:
+                path = self.recorder.stop() or self._capture_path
+                windows, self._closed = self._closed, []
+                if self.on_capture is not None:
+                    self.on_capture(path, windows)
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+
+def build_daily_plan(date, sunset_mins, lead=PRE_ROLL_S, tz=None):
+    """Returns a heap of (trigger epoch, key, description, duration) for date's events.
+
+    Each trigger is `lead` seconds before its event.
+
+    Event times are wall-clock times in tz (the host's timezone if None), so
+    the epochs follow DST changes. Sunset events are left out when there is
+    no sunset time.
+    """
+    midnight = datetime.datetime.combine(date, datetime.time(), tzinfo=tz)
+    plan = []
+    for key, description, seconds, from_sunset, duration in EVENTS:
+        if from_sunset:
+            if sunset_mins is None:
+                continue
+            seconds += sunset_mins * 60
+        event_time = midnight + datetime.timedelta(seconds=seconds)
+        plan.append((event_time.timestamp() - lead, key, description, duration))
+    heapq.heapify(plan)
+    return plan
+
+def next_midnight(date, tz=None):
+    return datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time(), tzinfo=tz).timestamp()
+
+async def sleep_until(clock, deadline, max_sleep=MAX_SLEEP_S):
+    """Sleeps until epoch `deadline`, or for max_sleep seconds if that is sooner.
+
+    Returns how many seconds the wall clock moved beyond the monotonic clock
+    while asleep; anything but ~0 means the system time was changed.
+    """
+    wall_start = clock.time()
+    mono_start = clock.monotonic()
+    remaining = min(deadline - wall_start, max_sleep)
+    if remaining > 0:
+        await clock.sleep(remaining)
+    return (clock.time() - wall_start) - (clock.monotonic() - mono_start)
+
+async def index_capture(index, path, windows, lead, recorder=None, site=None):
+    """Measures a finished capture off the event loop and adds its events to the index.
+
+    A clip the continuous listener still holds is measured once it closes.
+    site gives the schedule its call is checked against.
+    """
+    while recorder is not None and path is not None and getattr(recorder, 'open_clip', None) == path:
+        await asyncio.sleep(1)
+    rows = await asyncio.to_thread(measure_capture, path, windows, lead,
+                                   os.path.join(get_script_dir(), REFERENCE_DIR), site)
+    for key, scheduled, fields in rows:
+        index.add(key, scheduled, **fields)
+    index.flush()
+
+def unpack_push(data):
+    """Returns (kind, seq, controller epoch, name) of a controller datagram, or None."""
+    if len(data) <= PUSH_HEADER_SIZE:
+        return None
+    magic, version, kind, seq, sent = struct.unpack(PUSH_HEADER, data[:PUSH_HEADER_SIZE])
+    if magic != PUSH_MAGIC or version != PUSH_VERSION:
+        return None
+    try:
+        return kind, seq, sent, data[PUSH_HEADER_SIZE:].decode('ascii')
+    except UnicodeDecodeError:
+        return None
+
+class PushTriggerProtocol(asyncio.DatagramProtocol):
+    """Starts a recording window on `scheduler` for each event the controller announces.
+
+    A triggered event replaces its pending window from the daily plan; one
+    already recording is left alone. Button presses record under their
+    BTN-* message. Repeated copies of a datagram are ignored.
+
+    routes maps controller addresses to (scheduler, lead) for several
+    sites; datagrams from other addresses go to `scheduler`, or are
+    ignored if it is None.
+    """
+    def __init__(self, scheduler, lead=0, routes=None):
+        self.scheduler = scheduler
+        self.lead = lead
+        self.routes = routes or {}
+        self.durations = {key: (description, duration) for key, description, _, _, duration in EVENTS}
+        self._seen = []  # Recent (sender, kind, seq, sent), oldest first: seq restarts on reboot
+
+    def datagram_received(self, data, addr):
+        message = unpack_push(data)
+        if message is None:
+            return
+        kind, seq, sent, name = message
+        seen = (addr[0], kind, seq, sent)
+        if seen in self._seen:
+            return
+        self._seen = self._seen[-31:] + [seen]
+        self.trigger(kind, name, sent, addr[0])
+
+    def trigger(self, kind, name, sent, sender=None):
+        scheduler, lead = self.routes.get(sender, (self.scheduler, self.lead))
+        if scheduler is None:
+            print(f"Ignoring controller event {name} from unknown address {sender}")
+            return None
+        now = scheduler.clock.time()
+        if kind == PUSH_KIND_TRIGGER and PUSH_KEYS.get(name, name) in self.durations:
+            key = PUSH_KEYS.get(name, name)
+            description, duration = self.durations[key]
+        elif kind == PUSH_KIND_BUTTON and name in BUTTON_DURATIONS:
+            key, description, duration = name, f"{name} (manual)", BUTTON_DURATIONS[name]
+        else:
+            print(f"Ignoring unknown controller event {kind}:{name}")
+            return None
+        print(f"[{datetime.datetime.now()}] Controller sent {description} (clock offset {sent - now:+.0f}s)")
+        if scheduler.is_open(key):
+            return None
+        # Scheduled as if planned `lead` early, so the capture's event time is now
+        return scheduler.schedule(key, now - lead, now + duration, description)
+
+async def listen_for_pushes(scheduler, port=PUSH_PORT, host='0.0.0.0', lead=0, routes=None):
+    """Listens for controller datagrams on `port`. Returns the transport."""
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: PushTriggerProtocol(scheduler, lead, routes), local_addr=(host, port))
+    print(f"Listening for controller events on UDP port {transport.get_extra_info('sockname')[1]}")
+    return transport
+
+def index_segment(index, path, start, end):
+    """Adds audio found by the continuous listener to the index as a 'detected' event."""
+    index.add('detected', start, capture_path=path, duration=end - start, onset=start)
+    index.flush()
+
+def capture_lead(recorder):
+    """Seconds before each event to start `recorder`: a backend holding pre-roll audio needs none."""
+    return max(0, PRE_ROLL_S - recorder.pre_roll_s)
+
+async def monitor(scheduler, index=None, listener=None, push_port=None, site=None):
+    """Schedules each day's recordings on `scheduler`, replanning at midnight and after clock changes.
+
+    Each finished capture is recorded in `index` (an EventIndex) when given,
+    as is each segment `listener` (a ContinuousListener) detects. With
+    push_port, events the controller announces start recording on arrival.
+    site (a Site) gives the timezone and sunset table; by default the host's.
+    """
+    clock = scheduler.clock
+    site = site or Site()
+    label = f"{site.name}: " if site.name else ""
+    current_date = None
+    lead = capture_lead(scheduler.recorder)
+    if index is not None:
+        scheduler.on_capture = lambda path, windows: asyncio.ensure_future(
+            index_capture(index, path, windows, lead, scheduler.recorder, site))
+        if listener is not None:
+            # Segments end on the capture's reader thread
+            loop = asyncio.get_running_loop()
+            listener.on_segment = lambda *segment: loop.call_soon_threadsafe(index_segment, index, *segment)
+    if push_port is not None:
+        try:
+            await listen_for_pushes(scheduler, push_port, lead=lead)
+        except OSError as e:
+            print(f"Could not listen for controller events: {e}")
 
     while True:
-        now = datetime.datetime.now()
-        today = now.date()
-        
-        # Reset for new day
+        today = site.today(clock.time())
         if today != current_date:
-            print("New day detected. Resetting flags and reloading sunset.")
             current_date = today
-            day_num = get_day_number(current_date)
-            sunset_mins = get_sunset_minutes(day_num)
-            for k in triggered_events:
-                triggered_events[k] = False
-            
-            if sunset_mins:
+            sunset_mins = site.sunset_minutes(current_date)
+            if sunset_mins is not None:
                 sunset_time = datetime.time(sunset_mins // 60, sunset_mins % 60)
-                print(f"Today's sunset is at {sunset_time.strftime('%H:%M')}")
+                print(f"{label}Today's sunset is at {sunset_time.strftime('%H:%M')}")
             else:
-                print("Could not find sunset time for today.")
-
-        # Calculate current seconds past midnight
-        current_seconds = now.hour * 3600 + now.minute * 60 + now.second
-        
-        # Define target seconds for fixed events
-        # 07:55:00 -> 28500 seconds. Trigger 10s early: 28490
-        target_0755 = (7 * 60 + 55) * 60
-        if not triggered_events['0755'] and current_seconds >= (target_0755 - 10) and current_seconds < (target_0755 + 60):
-            print("Triggering 07:55 Event (First Call) - 10s early")
-            record_for_duration(30)
-            triggered_events['0755'] = True
-
-        # 08:00:00 -> 28800 seconds. Trigger 10s early: 28790
-        target_0800 = 8 * 3600
-        if not triggered_events['0800'] and current_seconds >= (target_0800 - 10) and current_seconds < (target_0800 + 60):
-            print("Triggering 08:00 Event (Colors) - 10s early")
-            record_for_duration(180)
-            triggered_events['0800'] = True
-
-        if sunset_mins is not None:
-            sunset_seconds = sunset_mins * 60
-            
-            # Sunset - 5 mins. Trigger 10s early.
-            target_sunset_minus_5 = sunset_seconds - (5 * 60)
-            if not triggered_events['sunset_minus_5'] and current_seconds >= (target_sunset_minus_5 - 10) and current_seconds < (target_sunset_minus_5 + 60):
-                print("Triggering Sunset-5 Event (First Call) - 10s early")
-                record_for_duration(30)
-                triggered_events['sunset_minus_5'] = True
-
-            # Sunset. Trigger 10s early.
-            if not triggered_events['sunset'] and current_seconds >= (sunset_seconds - 10) and current_seconds < (sunset_seconds + 60):
-                print("Triggering Sunset Event (Retreat) - 10s early")
-                record_for_duration(120)
-                triggered_events['sunset'] = True
-
-        # 22:00:00 -> 79200 seconds. Trigger 10s early: 79190
-        target_2200 = 22 * 3600
-        if not triggered_events['2200'] and current_seconds >= (target_2200 - 10) and current_seconds < (target_2200 + 60):
-            print("Triggering 22:00 Event (Taps) - 10s early")
-            record_for_duration(120)
-            triggered_events['2200'] = True
-
-        # Sleep 1 second for precision
-        time.sleep(1)
+                print(f"{label}Could not find sunset time for today.")
+            # Windows already open keep running; the rest are rescheduled from the new plan.
+            # A window whose end has passed is dropped; one in progress records what is left.
+            scheduler.cancel_pending()
+            now = clock.time()
+            left = 0
+            plan = build_daily_plan(current_date, sunset_mins, lead, site.tz)
+            while plan:
+                start, key, description, duration = heapq.heappop(plan)
+                if start + duration > now and scheduler.schedule(key, start, start + duration, description):
+                    left += 1
+            print(f"{label}{left} event(s) left today")
+
+        jump = await sleep_until(clock, next_midnight(current_date, site.tz))
+        if abs(jump) > CLOCK_JUMP_S:
+            print(f"{label}System clock changed by {jump:+.1f}s. Recomputing today's plan.")
+            current_date = None
+
+async def monitor_sites(sites, schedulers, indexes=None, listeners=None, push_port=None):
+    """Runs monitor() for every site as a task of one event loop.
+
+    schedulers (and optionally indexes and listeners) are in the order of
+    sites. One UDP listener serves every site, routing each datagram by the
+    controller address it came from.
+    """
+    indexes = indexes or [None] * len(sites)
+    listeners = listeners or [None] * len(sites)
+    if push_port is not None:
+        routes = {site.controller: (scheduler, capture_lead(scheduler.recorder))
+                  for site, scheduler in zip(sites, schedulers) if site.controller}
+        try:
+            await listen_for_pushes(None, push_port, routes=routes)
+        except OSError as e:
+            print(f"Could not listen for controller events: {e}")
+    await asyncio.gather(*(monitor(scheduler, index, listener, site=site)
+                           for site, scheduler, index, listener in zip(sites, schedulers, indexes, listeners)))
+
+async def run_sites(sites):
+    """Captures every site from its own sound card, all read by this event loop."""
+    loop = asyncio.get_running_loop()
+    recorders, listeners, indexes = [], [], []
+    try:
+        for site in sites:
+            clip_dir = os.path.join(get_script_dir(), CLIP_DIR, site.name)
+            recorder = RingBufferCapture(ArecordSource(device=site.device), clip_dir, PRE_ROLL_S)
+            recorder.attach(loop)
+            recorders.append(recorder)
+            listeners.append(open_listener(recorder))
+            os.makedirs(clip_dir, exist_ok=True)
+            indexes.append(EventIndex(os.path.join(clip_dir, INDEX_FILENAME), tz=site.tz))
+        await monitor_sites(sites, [RecordingScheduler(r) for r in recorders], indexes, listeners, PUSH_PORT)
+    finally:
+        for index in indexes:
+            index.close()
+        for recorder in recorders:
+            recorder.close()
+
+def open_recorder():
+    """Returns the configured recorder backend, falling back to audio-recorder without arecord."""
+    if CAPTURE_BACKEND == 'ring':
+        if ArecordSource.available():
+            recorder = RingBufferCapture(ArecordSource(), os.path.join(get_script_dir(), CLIP_DIR),
+                                         PRE_ROLL_S)
+            recorder.open()
+            return recorder
+        print("arecord not found. Falling back to audio-recorder.")
+    control_recorder('status') # Check status on startup
+    return AudioRecorderCLI()
+
+def open_listener(recorder):
+    """Attaches a ContinuousListener to a ring buffer recorder when configured and possible."""
+    if not CONTINUOUS_LISTEN or not isinstance(recorder, RingBufferCapture):
+        return None
+    if audio_capture.np is None:
+        print("NumPy not found. Recording scheduled events only.")
+        return None
+    listener = ContinuousListener(recorder, post_pad_s=POST_PAD_S)
+    recorder.listeners.append(listener)
+    return listener
+
+def main():
+    print("Starting Audio Monitor...")
+    sites_path = os.path.join(get_script_dir(), SITES_FILENAME)
+    if os.path.exists(sites_path):
+        sites = load_sites(sites_path)
+        if not ArecordSource.available():
+            print("Monitoring several sites needs arecord.")
+            return
+        print(f"Monitoring {len(sites)} site(s): {', '.join(site.name for site in sites)}")
+        asyncio.run(run_sites(sites))
+        return
+    recorder = open_recorder()
+    listener = open_listener(recorder)
+    index = EventIndex(os.path.join(get_script_dir(), INDEX_FILENAME))
+    try:
+        asyncio.run(monitor(RecordingScheduler(recorder), index, listener, PUSH_PORT))
+    finally:
+        index.close()
+        if isinstance(recorder, RingBufferCapture):
+            recorder.close()
 
 if __name__ == "__main__":
     main()
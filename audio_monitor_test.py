@@ -0,0 +1,346 @@
+# audio_monitor_test
+# Virtual-clock tests for the audio monitor's recording scheduler:
+#   python3 audio_monitor_test.py
+
+import asyncio
+import datetime
+import heapq
+import os
+import sys
+import tempfile
+import threading
+import time
+import zoneinfo
+
+import audio_monitor
+from audio_monitor import RecordingScheduler
+from checks import check, finish
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'controller'))
+import event_broadcast  # The controller's side of the push datagrams
+import sunset_table
+
+
+class VirtualClock:
+    """Wall/monotonic clock whose sleeps complete only when advance() reaches them."""
+    def __init__(self, wall=0.0):
+        self.wall = wall
+        self.mono = 0.0
+        self._waiters = []
+        self._seq = 0
+
+    def time(self):
+        return self.wall
+
+    def monotonic(self):
+        return self.mono
+
+    async def sleep(self, seconds):
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        heapq.heappush(self._waiters, (self.mono + max(0, seconds), self._seq, future))
+        await future
+
+    def jump(self, seconds):
+        """Steps the wall clock only, as an NTP correction would."""
+        self.wall += seconds
+
+    async def advance(self, seconds):
+        """Moves time forward, waking each sleeper at its own instant."""
+        end = self.mono + seconds
+        await settle()
+        while self._waiters and self._waiters[0][0] <= end:
+            when, _, future = heapq.heappop(self._waiters)
+            self.wall += when - self.mono
+            self.mono = when
+            if not future.done():
+                future.set_result(None)
+            await settle()
+        self.wall += end - self.mono
+        self.mono = end
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def shut_down(task, scheduler, clock):
+    """Stops a monitor task and lets its scheduler's windows end."""
+    task.cancel()
+    scheduler.cancel_pending()
+    await clock.advance(86400)
+
+
+class FakeRecorder:
+    def __init__(self, clock, pre_roll_s=0):
+        self.clock = clock
+        self.pre_roll_s = pre_roll_s
+        self.log = []
+
+    def start(self):
+        self.log.append(('start', self.clock.time()))
+
+    def stop(self):
+        self.log.append(('stop', self.clock.time()))
+
+    def captures(self):
+        starts = [t for cmd, t in self.log if cmd == 'start']
+        stops = [t for cmd, t in self.log if cmd == 'stop']
+        return list(zip(starts, stops))
+
+
+async def test_single_window():
+    clock = VirtualClock(1000)
+    recorder = FakeRecorder(clock)
+    s = RecordingScheduler(recorder, clock)
+    s.schedule('0755', 1100, 1130)
+    await clock.advance(99)
+    check('recorder idle before the window', recorder.log == [] and not s.is_recording())
+    await clock.advance(1)
+    check('recorder started at window start', recorder.log == [('start', 1100)] and s.is_recording())
+    await clock.advance(100)
+    check('recorder stopped at window end', recorder.captures() == [(1100, 1130)])
+
+
+async def test_overlapping_windows_merge():
+    clock = VirtualClock(0)
+    recorder = FakeRecorder(clock)
+    s = RecordingScheduler(recorder, clock)
+    s.schedule('0800', 100, 280)
+    s.schedule('extra', 200, 230)
+    s.schedule('late_overlap', 250, 400)
+    captures = []
+    s.on_capture = lambda path, windows: captures.append((path, windows))
+    await clock.advance(1000)
+    check('overlapping windows share one capture', recorder.captures() == [(100, 400)])
+    check('capture reports every window it covered',
+          captures == [(None, [('extra', 200, 230), ('0800', 100, 280), ('late_overlap', 250, 400)])])
+
+
+async def test_independent_windows():
+    # Short winter day: sunset-5 First Call and Retreat five minutes apart.
+    # Neither waits for the other, unlike the old blocking record_for_duration.
+    clock = VirtualClock(0)
+    recorder = FakeRecorder(clock)
+    s = RecordingScheduler(recorder, clock)
+    s.schedule('five_min_before_sunset', 59090, 59120)
+    s.schedule('sunset', 59390, 59510)
+    await clock.advance(60000)
+    check('separate windows record on time',
+          recorder.captures() == [(59090, 59120), (59390, 59510)])
+
+
+async def test_reschedule_and_cancel():
+    clock = VirtualClock(0)
+    recorder = FakeRecorder(clock)
+    s = RecordingScheduler(recorder, clock)
+    s.schedule('sunset', 500, 600)
+    s.schedule('sunset', 450, 550)
+    s.schedule('2200', 700, 800)
+    check('cancel pending window', s.cancel('2200'))
+    check('cancel unknown window', not s.cancel('2200'))
+    await clock.advance(1000)
+    check('rescheduled window replaces the old one', recorder.captures() == [(450, 550)])
+    check('re-scheduling an opened window is ignored', s.schedule('sunset', 450, 550) is None)
+
+
+async def test_monitor_day():
+    # A full local day from midnight through the next morning's Colors
+    midnight = datetime.datetime(2025, 6, 1).timestamp()
+    clock = VirtualClock(midnight)
+    recorder = FakeRecorder(clock)
+    s = RecordingScheduler(recorder, clock)
+    expected = sorted((start, start + duration) for start, _, _, duration in audio_monitor.build_daily_plan(
+        datetime.date(2025, 6, 1), audio_monitor.get_sunset_minutes(audio_monitor.get_day_number(
+            datetime.date(2025, 6, 1)))))
+    task = asyncio.ensure_future(audio_monitor.monitor(s))
+    await clock.advance(86400 + 8 * 3600 + 600)
+    await shut_down(task, s, clock)
+    captures = recorder.captures()
+    check('every event of the day recorded once, 10 s early', captures[:5] == expected)
+    check('next day planned after midnight', len(captures) == 7 and captures[5][0] > midnight + 86400)
+
+
+async def test_monitor_pre_roll_backend():
+    # A backend that keeps pre-roll audio is started at the event time itself
+    midnight = datetime.datetime(2025, 6, 1).timestamp()
+    clock = VirtualClock(midnight)
+    recorder = FakeRecorder(clock, pre_roll_s=audio_monitor.PRE_ROLL_S)
+    s = RecordingScheduler(recorder, clock)
+    task = asyncio.ensure_future(audio_monitor.monitor(s))
+    await clock.advance(9 * 3600)
+    await shut_down(task, s, clock)
+    check('no early trigger with a pre-roll backend',
+          [start for start, _ in recorder.captures()] == [midnight + 28500, midnight + 28800])
+
+
+async def test_monitor_clock_jump():
+    # NTP steps the clock back an hour after Colors: nothing is recorded twice,
+    # and forward past Retreat: Retreat is dropped, Taps still records on time
+    midnight = datetime.datetime(2025, 6, 1).timestamp()
+    clock = VirtualClock(midnight + 9 * 3600)
+    recorder = FakeRecorder(clock)
+    s = RecordingScheduler(recorder, clock)
+    sunset = audio_monitor.get_sunset_minutes(audio_monitor.get_day_number(datetime.date(2025, 6, 1)))
+    task = asyncio.ensure_future(audio_monitor.monitor(s))
+    await clock.advance(600)
+    clock.jump(-3600)
+    await clock.advance(3600 * 3)
+    check('no recording after stepping back past finished events', recorder.log == [])
+    clock.wall = midnight + sunset * 60 + 600
+    await clock.advance(22 * 3600 - sunset * 60 - 600 + 300)
+    await shut_down(task, s, clock)
+    taps = midnight + 22 * 3600 - audio_monitor.PRE_ROLL_S
+    check('after a forward step only later events record',
+          recorder.captures() == [(taps, taps + 120)])
+
+
+async def received(protocol, count):
+    """Waits (in real time) for the listener to have seen `count` datagrams."""
+    for _ in range(1000):  # Up to 5 s
+        if len(protocol._seen) >= count:
+            return True
+        await asyncio.sleep(0.005)
+    return False
+
+
+async def test_push_triggers():
+    # The controller's plan puts First Call 60 s earlier than ours: its datagram starts the capture
+    clock = VirtualClock(50000)
+    recorder = FakeRecorder(clock, pre_roll_s=audio_monitor.PRE_ROLL_S)
+    s = RecordingScheduler(recorder, clock)
+    s.schedule('sunset_minus_5', 50060, 50090)
+    transport = await audio_monitor.listen_for_pushes(s, port=0, host='127.0.0.1')
+    protocol = transport.get_protocol()
+    controller = event_broadcast.Broadcaster('127.0.0.1', transport.get_extra_info('sockname')[1])
+    check('controller sends over loopback', controller.send(event_broadcast.KIND_TRIGGER, 'five_min_before_sunset'))
+    check('datagram received', await received(protocol, 1))
+    await clock.advance(0)
+    check('capture starts on arrival', recorder.log == [('start', 50000)] and s.is_open('sunset_minus_5'))
+    controller.send(event_broadcast.KIND_TRIGGER, 'five_min_before_sunset')  # e.g. a retried send
+    await received(protocol, 2)
+    await clock.advance(200)
+    check('pending window replaced and repeats ignored', recorder.captures() == [(50000, 50030)])
+
+    controller.send(event_broadcast.KIND_BUTTON, 'BTN-TAPS')
+    controller.send(event_broadcast.KIND_BUTTON, 'BTN-Unknown')
+    await received(protocol, 4)
+    await clock.advance(200)
+    check('button press recorded for the call length', recorder.captures()[1:] == [(50200, 50320)])
+    controller.close()
+
+    # After a reboot the controller numbers its datagrams from 1 again
+    port = transport.get_extra_info('sockname')[1]
+    rebooted = event_broadcast.Broadcaster('127.0.0.1', port)
+    rebooted.send(event_broadcast.KIND_TRIGGER, 'five_min_before_sunset', when=int(time.time()) + 90)
+    await received(protocol, 5)
+    await clock.advance(200)
+    check('events after a reboot not taken for repeats', rebooted.seq == 1
+          and recorder.captures()[2:] == [(50400, 50430)])
+    rebooted.close()
+    protocol.datagram_received(b'not a controller datagram', ('127.0.0.1', 1))
+    check('unpack rejects foreign datagrams', audio_monitor.unpack_push(b'CMEV') is None
+          and audio_monitor.unpack_push(event_broadcast.pack(0, 7, 123, 'sunset')) == (0, 7, 123, 'sunset'))
+    transport.close()
+
+
+async def test_recorder_cli():
+    # A stand-in audio-recorder that takes a while: the event loop keeps running while it does
+    with tempfile.TemporaryDirectory() as tmp:
+        log = os.path.join(tmp, 'commands.log')
+        script = os.path.join(tmp, 'audio-recorder')
+        with open(script, 'w') as f:
+            f.write(f'#!/bin/sh\nsleep 0.2\necho "$2" >> {log}\n')
+        os.chmod(script, 0o755)
+        path = os.environ['PATH']
+        os.environ['PATH'] = tmp + os.pathsep + path
+        try:
+            recorder = audio_monitor.AudioRecorderCLI()
+            recorder.start()
+            recorder.stop()
+            check('start and stop return before the command runs', not os.path.exists(log))
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            ticker = asyncio.ensure_future(tick())
+            await recorder.drain()
+            ticker.cancel()
+            with open(log) as f:
+                check('commands sent in order', f.read().split() == ['start', 'stop'])
+            check('event loop ran while they did ({} ticks)'.format(ticks), ticks > 1)
+        finally:
+            os.environ['PATH'] = path
+
+
+async def test_multi_site():
+    # Two sites three timezones apart sharing one memory-mapped sunset table
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'shared.bin'), 'wb') as f:
+            f.write(sunset_table.pack_table([1200 + day % 60 for day in range(365)],
+                                            datetime.date(2026, 1, 1)))
+        sites_path = os.path.join(tmp, 'sites.csv')
+        with open(sites_path, 'w') as f:
+            f.write("name,timezone,sunset_table,device,controller\n"
+                    "fort_west,America/Los_Angeles,shared.bin,hw:1,10.0.0.2\n"
+                    "fort_east,America/New_York,shared.bin,hw:2,10.0.0.3\n")
+        sites = audio_monitor.load_sites(sites_path)
+        check('sites share one memory-mapped table',
+              sites[0].table is sites[1].table and isinstance(sites[0].table, memoryview))
+        check('site settings read', sites[1].device == 'hw:2' and sites[1].controller == '10.0.0.3')
+        day = datetime.date(2026, 3, 1)
+        clock = VirtualClock(datetime.datetime(2026, 3, 1, tzinfo=zoneinfo.ZoneInfo('America/New_York')).timestamp())
+        recorders = [FakeRecorder(clock, pre_roll_s=audio_monitor.PRE_ROLL_S) for _ in sites]
+        schedulers = [RecordingScheduler(r, clock) for r in recorders]
+        task = asyncio.ensure_future(audio_monitor.monitor_sites(sites, schedulers))
+        await clock.advance(86400 + 3 * 3600 - 60)
+        for site, recorder in zip(sites, recorders):
+            colors = datetime.datetime(2026, 3, 1, 8, tzinfo=site.tz).timestamp()
+            sunset = datetime.datetime(2026, 3, 1, tzinfo=site.tz).timestamp() + sites[0].table[59] * 60
+            starts = [start for start, _ in recorder.captures() if site.today(start) == day]
+            check(f'{site.name} records in its own timezone', len(starts) == 5 and starts[1] == colors
+                  and starts[3] == sunset)
+
+        protocol = audio_monitor.PushTriggerProtocol(None, routes={'10.0.0.3': (schedulers[1], 0)})
+        check('push routed to its site', protocol.trigger(0, '2200', 0, '10.0.0.3') is not None
+              and '2200' in schedulers[1]._tasks and '2200' not in schedulers[0]._tasks)
+        check('push from an unknown controller ignored', protocol.trigger(0, '2200', 0, '10.0.0.9') is None)
+        await shut_down(task, schedulers[0], clock)
+        schedulers[1].cancel_pending()
+
+        # Dozens of sites in one loop, without a thread each
+        threads = threading.active_count()
+        many = [audio_monitor.Site(f'site{i}', zoneinfo.ZoneInfo('America/Chicago'), sites[0].table,
+                                   sites[0].start_date) for i in range(50)]
+        clock = VirtualClock(datetime.datetime(2026, 6, 1, tzinfo=many[0].tz).timestamp())
+        recorders = [FakeRecorder(clock, pre_roll_s=audio_monitor.PRE_ROLL_S) for _ in many]
+        schedulers = [RecordingScheduler(r, clock) for r in recorders]
+        task = asyncio.ensure_future(audio_monitor.monitor_sites(many, schedulers))
+        await clock.advance(86400 - 60)
+        check('50 sites monitored in one thread',
+              threading.active_count() == threads and all(len(r.captures()) == 5 for r in recorders))
+        task.cancel()
+        await clock.advance(86400)
+
+
+async def run():
+    await test_single_window()
+    await test_overlapping_windows_merge()
+    await test_independent_windows()
+    await test_reschedule_and_cancel()
+    await test_monitor_day()
+    await test_monitor_pre_roll_backend()
+    await test_monitor_clock_jump()
+    await test_push_triggers()
+    await test_recorder_cli()
+    await test_multi_site()
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
+    finish()
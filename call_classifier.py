@@ -0,0 +1,319 @@
+"""Identify which bugle call is in a recorded clip (requires NumPy).
+
+The monitor records at the right times but that does not prove the right
+track played. This compares each clip against the five MP3s on the player's
+SD card and reports the call (or sequence: Star Spangled Banner then Carry
+On, Retreat then Carry On), a confidence and where in the clip it starts.
+
+Audio is reduced to a feature matrix: log energy in BANDS log-spaced
+frequency bands every HOP_S seconds. A clip is matched against a reference
+by normalized cross-correlation of their features over every time offset,
+computed in the frequency domain. The clip is transformed once per FFT
+size and shared by the references that need that size (usually all of
+them); each reference then costs its own transform, a multiply and one
+inverse FFT. The references' features are built once, saved as .npy files
+in the cache directory and memory-mapped on load, so classifying a clip
+costs a few milliseconds plus reading it.
+
+References are the player's MP3s (decoded with ffmpeg) or WAV copies,
+named as on the SD card: star_spangled_banner, carry_on, retreat, taps and
+first_call.
+
+Usage:
+    python3 call_classifier.py build-cache [--refs references]
+    python3 call_classifier.py classify [--refs references] recordings/*.wav
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import wave
+
+import numpy as np
+
+import clip_analysis
+from audio_capture import clip_start_time
+
+REFERENCE_NAMES = ('star_spangled_banner', 'carry_on', 'retreat', 'taps', 'first_call')
+# Tracks the player follows with another (sequence_btn1 and sequence_btn4 in mp3_player)
+SEQUENCES = {'star_spangled_banner': 'carry_on', 'retreat': 'carry_on'}
+# What each audio monitor event should sound like (controller UART command -> player button)
+EXPECTED_CALLS = {
+    '0755': ('first_call',),
+    '0800': ('star_spangled_banner', 'carry_on'),
+    'sunset_minus_5': ('first_call',),
+    'sunset': ('retreat', 'carry_on'),
+    '2200': ('taps',),
+}
+DEFAULT_REFERENCE_DIR = 'references'
+CACHE_SUBDIR = 'cache'
+FEATURE_VERSION = 1  # Bump when the feature parameters change to rebuild caches
+FEATURE_RATE = 16000
+FRAME = 1024
+HOP_S = 0.02
+BANDS = 24
+MIN_HZ = 150.0
+MAX_HZ = 5000.0
+MATCH_THRESHOLD = 0.5  # NCC below this is reported as no match
+SEQUENCE_SLACK_S = 3.0  # Gap allowed between the tracks of a sequence
+
+
+def read_wav_float(path):
+    """Return (mono float32 samples, sample rate) of a 16-bit WAV."""
+    samples, rate = clip_analysis.read_wav(path)
+    return samples.astype(np.float32), rate
+
+
+def decode_audio(path, rate=FEATURE_RATE):
+    """Return mono float32 samples of an audio file at `rate`.
+
+    WAV files are read directly; anything else is decoded with ffmpeg.
+    """
+    if path.lower().endswith('.wav'):
+        samples, source_rate = read_wav_float(path)
+        return resample(samples, source_rate, rate)
+    try:
+        out = subprocess.run(['ffmpeg', '-v', 'error', '-i', path, '-f', 's16le', '-ac', '1',
+                              '-ar', str(rate), '-'], stdout=subprocess.PIPE, check=True).stdout
+    except FileNotFoundError:
+        raise RuntimeError("ffmpeg is needed to decode {}".format(path))
+    return np.frombuffer(out, dtype='<i2').astype(np.float32)
+
+
+def resample(samples, source_rate, rate=FEATURE_RATE):
+    """Resample to `rate`, averaging blocks when the rates divide evenly."""
+    if source_rate == rate:
+        return samples
+    if source_rate % rate == 0:
+        factor = source_rate // rate
+        n = len(samples) // factor
+        return samples[:n * factor].reshape(n, factor).mean(axis=1)
+    n = int(len(samples) * rate / source_rate)
+    return np.interp(np.arange(n) * (source_rate / rate), np.arange(len(samples)), samples).astype(np.float32)
+
+
+def _band_matrix():
+    """(bins, BANDS) matrix summing rfft power into log-spaced bands."""
+    freqs = np.fft.rfftfreq(FRAME, 1.0 / FEATURE_RATE)
+    edges = np.geomspace(MIN_HZ, MAX_HZ, BANDS + 1)
+    band = np.searchsorted(edges, freqs, side='right') - 1
+    matrix = np.zeros((len(freqs), BANDS), dtype=np.float32)
+    inside = (band >= 0) & (band < BANDS)
+    matrix[np.flatnonzero(inside), band[inside]] = 1.0
+    return matrix
+
+
+_BANDS = _band_matrix()
+_WINDOW = np.hanning(FRAME).astype(np.float32)
+
+
+def features(samples):
+    """Log band energies, shape (BANDS, frames), of FEATURE_RATE samples."""
+    hop = int(FEATURE_RATE * HOP_S)
+    if len(samples) < FRAME:
+        return np.zeros((BANDS, 0), dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME)[::hop]
+    power = np.abs(np.fft.rfft(frames * _WINDOW, axis=1)) ** 2
+    return np.log10(power @ _BANDS + 1.0).T.astype(np.float32)
+
+
+def normalized_xcorr(clip, ref, spectra=None):
+    """Normalized cross-correlation of ref against clip at every offset.
+
+    Both are (BANDS, frames) with the clip at least as long as the ref. Value k
+    compares ref with the clip frames k .. k + len(ref) - 1, over all bands.
+    spectra, if given, is a dict of the clip's transforms by FFT size, filled
+    in as needed, so matching several references against one clip
+    transforms it once per size.
+    """
+    n_clip = clip.shape[1]
+    n_ref = ref.shape[1]
+    ref = ref - ref.mean(axis=1, keepdims=True)
+    ref_norm = np.sqrt(np.square(ref).sum())
+    size = 1 << (n_clip + n_ref - 1).bit_length()
+    if spectra is None:
+        spectra = {}
+    if size not in spectra:
+        spectra[size] = np.fft.rfft(clip, size, axis=1)
+    # Correlation summed over bands: one inverse FFT for all of them
+    spectrum = (spectra[size] * np.conj(np.fft.rfft(ref, size, axis=1))).sum(axis=0)
+    numerator = np.fft.irfft(spectrum, size)[:n_clip - n_ref + 1]
+    # Energy of each clip window about its per-band mean, from running sums
+    zero = np.zeros((clip.shape[0], 1))
+    s1 = np.concatenate([zero, np.cumsum(clip, axis=1, dtype=np.float64)], axis=1)
+    s2 = np.concatenate([zero, np.cumsum(np.square(clip, dtype=np.float64), axis=1)], axis=1)
+    win1 = s1[:, n_ref:] - s1[:, :-n_ref]
+    win2 = s2[:, n_ref:] - s2[:, :-n_ref]
+    energy = (win2 - win1 * win1 / n_ref).sum(axis=0)
+    return numerator / np.maximum(np.sqrt(np.maximum(energy, 0)) * ref_norm, 1e-9)
+
+
+def best_match(clip, ref, spectra=None):
+    """Return (ncc, frame offset) of ref's best alignment in clip.
+
+    A ref longer than the clip is matched by its opening (clip-length) part.
+    spectra caches the clip's transforms, as in normalized_xcorr().
+    """
+    if clip.shape[1] < 2:
+        return 0.0, 0
+    if ref.shape[1] > clip.shape[1]:
+        ref = ref[:, :clip.shape[1]]
+    scores = normalized_xcorr(clip, ref, spectra)
+    k = int(np.argmax(scores))
+    return float(scores[k]), k
+
+
+def find_references(ref_dir):
+    """Map reference name -> audio file in ref_dir (MP3 preferred, then WAV)."""
+    found = {}
+    for name in REFERENCE_NAMES:
+        for ext in ('.mp3', '.wav'):
+            path = os.path.join(ref_dir, name + ext)
+            if os.path.exists(path):
+                found[name] = path
+                break
+    return found
+
+
+def build_cache(ref_dir, cache_dir=None):
+    """Decode and featurize changed references into cache_dir. Returns names rebuilt."""
+    cache_dir = cache_dir or os.path.join(ref_dir, CACHE_SUBDIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, 'index.json')
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    rebuilt = []
+    for name, path in find_references(ref_dir).items():
+        st = os.stat(path)
+        key = [os.path.basename(path), st.st_size, st.st_mtime_ns, FEATURE_VERSION]
+        feature_path = os.path.join(cache_dir, name + '.npy')
+        if index.get(name) == key and os.path.exists(feature_path):
+            continue
+        np.save(feature_path, features(decode_audio(path)))
+        index[name] = key
+        rebuilt.append(name)
+    with open(index_path, 'w') as f:
+        json.dump(index, f, indent=1)
+    return rebuilt
+
+
+def load_references(ref_dir, cache_dir=None, build=True):
+    """Build the cache if needed, then memory-map each reference's features.
+
+    build=False only maps a cache already built, e.g. in worker processes
+    after their parent called build_cache(), so they never write it.
+    """
+    cache_dir = cache_dir or os.path.join(ref_dir, CACHE_SUBDIR)
+    if build:
+        build_cache(ref_dir, cache_dir)
+    refs = {}
+    for name in find_references(ref_dir):
+        refs[name] = np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode='r')
+    if not refs:
+        raise FileNotFoundError("No reference calls in {}".format(ref_dir))
+    return refs
+
+
+def classify_features(clip, refs):
+    """Identify the call in a clip's features.
+
+    Returns a dict: 'calls' is [(name, start seconds, ncc)] for the call and
+    any sequence partner found, in playing order; 'call' is their names
+    joined by '+', or None when nothing matches; 'confidence' is the lead
+    call's NCC; 'offset' is where it starts in the clip; 'scores' holds every
+    reference's best NCC.
+    """
+    spectra = {}  # The clip's transform by FFT size, shared by the references
+    matches = {name: best_match(clip, ref, spectra) for name, ref in refs.items()}
+    scores = {name: m[0] for name, m in matches.items()}
+    result = {'call': None, 'calls': [], 'confidence': 0.0, 'offset': None, 'scores': scores}
+    # The lead call is the best match that is not only the tail of a sequence,
+    # unless the tail is all there is
+    heads = [name for name in matches if name not in SEQUENCES.values()]
+    lead = max(heads or matches, key=lambda name: scores[name])
+    if scores[lead] < MATCH_THRESHOLD:
+        tail = max(matches, key=lambda name: scores[name])
+        if scores[tail] < MATCH_THRESHOLD:
+            return result
+        lead = tail
+    calls = [(lead, matches[lead][1] * HOP_S, scores[lead])]
+    follower = SEQUENCES.get(lead)
+    if follower in refs:
+        end = matches[lead][1] + refs[lead].shape[1]
+        slack = int(SEQUENCE_SLACK_S / HOP_S)
+        after = clip[:, max(0, end - slack):]
+        score, k = best_match(after, refs[follower])
+        if score >= MATCH_THRESHOLD:
+            calls.append((follower, (max(0, end - slack) + k) * HOP_S, score))
+    result.update(call='+'.join(name for name, _, _ in calls), calls=calls,
+                  confidence=calls[0][2], offset=calls[0][1])
+    return result
+
+
+def classify_clip(path, refs, site=None):
+    """classify_features() for a WAV clip, plus 'expected' from its event scheduled at site."""
+    samples, rate = read_wav_float(path)
+    result = classify_features(features(resample(samples, rate)), refs)
+    result['path'] = path
+    result['expected'] = None
+    try:
+        start = clip_start_time(path)
+    except ValueError:
+        return result  # Not named by the monitor, so no event to check against
+    event = clip_analysis.match_event(start, len(samples) / rate, site)
+    if event is not None:
+        result['event'] = event[2]
+        result['expected'] = '+'.join(EXPECTED_CALLS[event[1]])
+    return result
+
+
+def report(paths, refs):
+    """Print the call found in each clip, flagging clips that do not match their event."""
+    results = []
+    wrong = 0
+    for path in paths:
+        t0 = time.perf_counter()
+        try:
+            result = classify_clip(path, refs)
+        except (OSError, ValueError, wave.Error) as e:
+            print(f"{path}: {e}")
+            continue
+        elapsed = time.perf_counter() - t0
+        results.append(result)
+        if result['call'] is None:
+            found = "no call recognised"
+        else:
+            found = f"{result['call']} at {result['offset']:.2f}s (confidence {result['confidence']:.2f})"
+        flag = ''
+        if result['expected'] and result['call'] != result['expected']:
+            flag = f" -- expected {result['expected']}"
+            wrong += 1
+        print(f"{path}: {found}{flag} [{elapsed * 1000:.0f} ms]")
+    print(f"{len(results)} clip(s), {wrong} not the expected call")
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Identify the bugle call in recorded clips.")
+    parser.add_argument('--refs', default=DEFAULT_REFERENCE_DIR, help="reference MP3/WAV directory")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build-cache', help="decode references into the feature cache")
+    classify_parser = sub.add_parser('classify', help="classify clips")
+    classify_parser.add_argument('clips', nargs='+')
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'build-cache':
+        rebuilt = build_cache(args.refs)
+        print("Rebuilt: {}".format(', '.join(rebuilt) if rebuilt else "nothing, cache is current"))
+        return 0
+    results = report(args.clips, load_references(args.refs))
+    return 0 if results else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,122 @@
+# call_classifier_test
+# Classifies synthetic clips against synthetic reference calls:
+#   python3 call_classifier_test.py
+
+import datetime
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import call_classifier
+from audio_capture import clip_name
+from checks import check, finish, write_wav
+
+RATE = 48000
+# Bb bugle partials; every reference is a different tune over them
+PARTIALS = (233.08, 349.23, 466.16, 587.33, 698.46)
+
+
+def tune(seed, length_s):
+    rng = np.random.default_rng(seed)
+    out = []
+    total = 0
+    while total < length_s * RATE:
+        n = int(rng.choice((0.25, 0.5, 0.75, 1.0, 1.5)) * RATE)
+        t = np.arange(n) / RATE
+        note = np.sin(2 * np.pi * rng.choice(PARTIALS) * t) + 0.4 * np.sin(4 * np.pi * rng.choice(PARTIALS) * t)
+        envelope = np.minimum(1, t / 0.03) * np.minimum(1, (n / RATE - t) / 0.05)
+        out.append(note * envelope)
+        total += n
+    return np.concatenate(out)[:int(length_s * RATE)]
+
+
+REFS = {
+    'star_spangled_banner': tune(1, 40),
+    'carry_on': tune(2, 12),
+    'retreat': tune(3, 30),
+    'taps': tune(4, 25),
+    'first_call': tune(5, 15),
+}
+
+
+def make_clip(length_s, parts, seed=0):
+    """Noise with each (name, start seconds, gain) reference mixed in."""
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal(int(length_s * RATE)) * 200
+    for name, start, gain in parts:
+        i = int(start * RATE)
+        ref = REFS[name][:len(x) - i]
+        x[i:i + len(ref)] += ref * gain
+    return x
+
+
+def write_references(tmp):
+    ref_dir = os.path.join(tmp, 'references')
+    os.makedirs(ref_dir)
+    for name, x in REFS.items():
+        write_wav(os.path.join(ref_dir, name + '.wav'), x * 8000, RATE)
+    return ref_dir
+
+
+def test_classify(tmp):
+    refs = call_classifier.load_references(write_references(tmp))
+    result = call_classifier.classify_features(
+        call_classifier.features(call_classifier.resample(make_clip(40, [('taps', 10, 8000)]), RATE)), refs)
+    check('single call identified', result['call'] == 'taps')
+    check('confident match ({:.2f})'.format(result['confidence']), result['confidence'] > 0.8)
+    check('alignment offset within one frame', abs(result['offset'] - 10) <= call_classifier.HOP_S)
+    check('other calls score lower', max(v for k, v in result['scores'].items() if k != 'taps')
+          < result['confidence'] - 0.2)
+    clip = call_classifier.features(call_classifier.resample(make_clip(40, [('taps', 10, 8000)]), RATE))
+    spectra = {}
+    shared = [call_classifier.best_match(clip, ref, spectra) for ref in refs.values()]
+    check('clip transformed once for every reference ({} sizes)'.format(len(spectra)),
+          len(spectra) < len(refs) and shared == [call_classifier.best_match(clip, ref) for ref in refs.values()])
+
+    result = call_classifier.classify_features(call_classifier.features(call_classifier.resample(
+        make_clip(70, [('retreat', 10, 6000), ('carry_on', 40.5, 6000)], seed=1), RATE)), refs)
+    check('sequence identified', result['call'] == 'retreat+carry_on')
+    check('second track aligned', abs(result['calls'][1][1] - 40.5) <= call_classifier.HOP_S)
+
+    result = call_classifier.classify_features(call_classifier.features(call_classifier.resample(
+        make_clip(30, [], seed=2), RATE)), refs)
+    check('noise alone matches nothing', result['call'] is None)
+
+
+def test_wrong_track_flagged(tmp):
+    refs = call_classifier.load_references(write_references(tmp))
+    # Sunset recording where Taps played instead of Retreat + Carry On
+    sunset = datetime.datetime(2025, 6, 1, 20, 30).timestamp()
+    path = write_wav(os.path.join(tmp, clip_name(sunset - 10)), make_clip(40, [('taps', 10.4, 8000)]), RATE)
+    t0 = time.perf_counter()
+    results = call_classifier.report([path], refs)
+    elapsed = time.perf_counter() - t0
+    check('expected call from the schedule', results[0]['expected'] == 'retreat+carry_on')
+    check('wrong track reported', results[0]['call'] == 'taps')
+    print('INFO classified in {:.0f} ms'.format(elapsed * 1000))  # Reported only: host load varies
+
+
+def test_cache(tmp):
+    ref_dir = write_references(tmp)
+    cache_dir = os.path.join(ref_dir, call_classifier.CACHE_SUBDIR)
+    try:
+        call_classifier.load_references(ref_dir, os.path.join(ref_dir, 'unbuilt'), build=False)
+        check('build=False never writes a cache', False)
+    except FileNotFoundError:
+        check('build=False never writes a cache', not os.path.exists(os.path.join(ref_dir, 'unbuilt')))
+    refs = call_classifier.load_references(ref_dir)
+    check('cache current after first load', call_classifier.build_cache(ref_dir) == [])
+    check('references memory-mapped', all(isinstance(r, np.memmap) for r in refs.values()))
+    write_wav(os.path.join(ref_dir, 'taps.wav'), REFS['taps'] * 0.5 * 8000, RATE)
+    os.utime(os.path.join(ref_dir, 'taps.wav'), ns=(0, 1))
+    check('changed reference rebuilt alone', call_classifier.build_cache(ref_dir) == ['taps'])
+    check('cache index written', os.path.exists(os.path.join(cache_dir, 'index.json')))
+
+
+if __name__ == '__main__':
+    for test in (test_classify, test_wrong_track_flagged, test_cache):
+        with tempfile.TemporaryDirectory() as tmp:
+            test(tmp)
+    finish()
@@ -0,0 +1,36 @@
+"""check() and the failure count shared by the *_test.py scripts.
+
+Each script calls check() for every case and finish() at the end, which
+prints the count and exits non-zero if anything failed, so a test run can
+gate on the exit status. Runs under MicroPython too: copy this file to the
+controller with the controller's tests. write_wav() is for the host tests.
+"""
+import sys
+
+failures = 0
+
+
+def check(name, condition):
+    global failures
+    if not condition:
+        failures += 1
+    print('{} {}'.format('PASS' if condition else 'FAIL', name))
+    return condition
+
+
+def finish():
+    print('{} failure(s)'.format(failures))
+    sys.exit(1 if failures else 0)
+
+
+def write_wav(path, samples, rate, channels=1):
+    """16-bit WAV of samples (one value per frame, or frames x channels), clipped to full scale."""
+    import wave
+    import numpy as np
+    data = np.clip(np.asarray(samples), -32768, 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(data.tobytes())
+    return path
@@ -0,0 +1,231 @@
+"""Playback-latency analysis for the audio monitor's recorded clips (requires NumPy).
+
+For each clip it finds the first bugle onset and reports how long after the
+scheduled event time the MP3 player actually started, which measures the
+whole chain from the controller's trigger to audio out.
+
+Onset detection runs in two passes, both vectorized with NumPy:
+  1. A short-time energy envelope (10 ms frames) over the whole clip. The
+     noise floor is taken from the start of the clip, which is pre-roll, and
+     the first run of frames well above it locates the onset coarsely.
+  2. Spectral flux (rise in STFT magnitude between frames) over a short
+     window around that point refines it to a few milliseconds.
+Only the window around the onset goes through the FFT, so an hour of
+48 kHz audio analyses in a fraction of a second.
+
+Clips are WAV files named by audio_capture.clip_name(), which records the
+time of their first sample.
+
+Usage:
+    python3 clip_analysis.py report recordings/*.wav
+    python3 clip_analysis.py benchmark [--seconds 3600] [--rate 48000]
+"""
+import argparse
+import statistics
+import sys
+import time
+import wave
+
+import numpy as np
+
+import audio_monitor
+from audio_capture import clip_start_time
+
+HOP_S = 0.01  # Energy envelope frame
+NOISE_S = 1.0  # Start of the clip used to estimate the noise floor
+ONSET_RISE_DB = 15.0  # Energy above the noise floor that counts as sound
+MIN_ONSET_S = 0.05  # Sound must last this long to count as the onset
+FLUX_FRAME_S = 0.02  # Spectral flux STFT frame
+FLUX_HOP_S = 0.001
+REFINE_BEFORE_S = 0.1  # Spectral flux window around the coarse onset
+REFINE_AFTER_S = 0.05
+
+
+def read_wav(path):
+    """Return (int16 samples of the first channel, sample rate) of a 16-bit WAV."""
+    with wave.open(path, 'rb') as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path} is not 16-bit PCM")
+        channels = f.getnchannels()
+        rate = f.getframerate()
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype='<i2')
+    return data[::channels], rate
+
+
+def energy_envelope(samples, rate, hop_s=HOP_S):
+    """Mean-square energy in dB of consecutive hop_s frames."""
+    hop = max(1, int(rate * hop_s))
+    n = len(samples) // hop
+    frames = samples[:n * hop].reshape(n, hop)
+    energy = np.einsum('ij,ij->i', frames, frames, dtype=np.float32) / hop
+    return 10 * np.log10(energy + 1e-3)
+
+
+def spectral_flux(samples, frame, hop):
+    """Summed positive change in STFT magnitude between consecutive frames.
+
+    Value i is the flux arriving with frame i + 1, which starts at sample
+    (i + 1) * hop.
+    """
+    n = (len(samples) - frame) // hop + 1
+    if n < 2:
+        return np.zeros(0, dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, frame)[::hop][:n]
+    spectrum = np.abs(np.fft.rfft(frames.astype(np.float32) * np.hanning(frame).astype(np.float32), axis=1))
+    return np.maximum(np.diff(spectrum, axis=0), 0).sum(axis=1)
+
+
+def detect_onset(samples, rate):
+    """Seconds from the start of `samples` to the first onset, or None if there is none."""
+    envelope = energy_envelope(samples, rate)
+    noise_frames = max(1, int(NOISE_S / HOP_S))
+    if len(envelope) <= noise_frames:
+        return None
+    floor = np.median(envelope[:noise_frames])
+    loud = envelope > floor + ONSET_RISE_DB
+    run = max(1, int(MIN_ONSET_S / HOP_S))
+    # Frames starting a run of `run` loud frames
+    sustained = np.convolve(loud, np.ones(run, dtype=np.int32), mode='valid') == run
+    hits = np.flatnonzero(sustained)
+    if len(hits) == 0:
+        return None
+    hop = int(rate * HOP_S)
+    coarse = int(hits[0]) * hop
+
+    # Refine with spectral flux around the coarse onset
+    frame = int(rate * FLUX_FRAME_S)
+    flux_hop = max(1, int(rate * FLUX_HOP_S))
+    start = max(0, coarse - int(REFINE_BEFORE_S * rate) - frame)
+    window = samples[start:coarse + int(REFINE_AFTER_S * rate) + hop + frame]
+    flux = spectral_flux(window, frame, flux_hop)
+    if len(flux) == 0 or flux.max() <= 0:
+        return coarse / rate
+    first = int(np.flatnonzero(flux >= 0.5 * flux.max())[0])
+    # Flux reaches half its peak as the sound reaches the middle of the window
+    return (start + (first + 1) * flux_hop + frame // 2) / rate
+
+
+def rms_dbfs(samples):
+    """RMS level of int16 samples in dB relative to full scale."""
+    if len(samples) == 0:
+        return None
+    mean_square = np.einsum('i,i->', samples, samples, dtype=np.float64) / len(samples)
+    return float(10 * np.log10(mean_square / 32768.0 ** 2 + 1e-12))
+
+
+def measure_event(path, scheduled, duration=None):
+    """Onset and level of the event at epoch `scheduled` in a clip.
+
+    Analyses from 2 * NOISE_S before the event (so a clip holding several
+    merged events is measured per event) to `duration` seconds after it.
+    Returns a dict with 'onset' (epoch the audio started, or None),
+    'latency' (seconds after `scheduled`) and 'rms' (dBFS over the event).
+    """
+    samples, rate = read_wav(path)
+    start = clip_start_time(path)
+    event = int((scheduled - start) * rate)
+    first = max(0, event - int(2 * NOISE_S * rate))
+    last = len(samples) if duration is None else min(len(samples), event + int(duration * rate))
+    onset = detect_onset(samples[first:last], rate)
+    result = {'onset': None, 'latency': None, 'rms': rms_dbfs(samples[max(0, event):last])}
+    if onset is not None:
+        result['onset'] = start + first / rate + onset
+        result['latency'] = result['onset'] - scheduled
+    return result
+
+
+def scheduled_events(date, site=None):
+    """Return [(epoch, key, description)] of a day's events, at their exact times.
+
+    site (an audio_monitor.Site) gives the timezone and sunset table; by
+    default the host's timezone and the monitor's own table.
+    """
+    site = site or audio_monitor.Site()
+    plan = audio_monitor.build_daily_plan(date, site.sunset_minutes(date), lead=0, tz=site.tz)
+    return sorted((when, key, description) for when, key, description, _ in plan)
+
+
+def match_event(start, length, site=None):
+    """The scheduled (epoch, key, description) at `site` that falls in a clip's span, or None."""
+    site = site or audio_monitor.Site()
+    for event in scheduled_events(site.today(start), site):
+        if start <= event[0] < start + length:
+            return event
+    return None
+
+
+def analyze_clip(path, site=None):
+    """Return a dict describing a clip's onset and its latency from the event scheduled at site."""
+    samples, rate = read_wav(path)
+    start = clip_start_time(path)
+    length = len(samples) / rate
+    onset = detect_onset(samples, rate)
+    event = match_event(start, length, site)
+    result = {'path': path, 'start': start, 'length': length, 'onset': onset,
+              'key': event[1] if event else None, 'event': event[2] if event else None,
+              'scheduled': event[0] if event else None, 'latency': None,
+              'rms': rms_dbfs(samples)}
+    if onset is not None and event is not None:
+        result['latency'] = start + onset - event[0]
+    return result
+
+
+def report(paths):
+    """Print per-clip latencies and a summary; returns the analysis results."""
+    results = []
+    for path in paths:
+        try:
+            result = analyze_clip(path)
+        except (OSError, ValueError, wave.Error) as e:
+            print(f"{path}: {e}")
+            continue
+        results.append(result)
+        if result['event'] is None:
+            print(f"{path}: no scheduled event in this clip")
+        elif result['onset'] is None:
+            print(f"{path}: {result['event']}: no audio detected")
+        else:
+            print(f"{path}: {result['event']}: audio started {result['latency']:+.3f}s "
+                  f"from the scheduled time")
+    latencies = [r['latency'] for r in results if r['latency'] is not None]
+    if latencies:
+        print(f"{len(latencies)} clip(s): mean {statistics.mean(latencies):+.3f}s, "
+              f"median {statistics.median(latencies):+.3f}s, "
+              f"min {min(latencies):+.3f}s, max {max(latencies):+.3f}s")
+    return results
+
+
+def benchmark(seconds=3600, rate=48000):
+    """Time onset detection on `seconds` of synthetic audio with a tone near the end."""
+    rng = np.random.default_rng(0)
+    samples = (rng.standard_normal(seconds * rate) * 30).astype(np.int16)
+    onset = seconds - 5.0
+    t = np.arange(int(2 * rate)) / rate
+    i = int(onset * rate)
+    samples[i:i + len(t)] += (8000 * np.sin(2 * np.pi * 466.16 * t)).astype(np.int16)
+    t0 = time.perf_counter()
+    found = detect_onset(samples, rate)
+    elapsed = time.perf_counter() - t0
+    print(f"{seconds}s at {rate} Hz: onset {found:.4f}s (true {onset:.4f}s) in {elapsed:.3f}s")
+    return elapsed
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Measure playback latency in recorded clips.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    report_parser = sub.add_parser('report', help="report onset latency for clips")
+    report_parser.add_argument('clips', nargs='+')
+    bench_parser = sub.add_parser('benchmark', help="time onset detection on synthetic audio")
+    bench_parser.add_argument('--seconds', type=int, default=3600)
+    bench_parser.add_argument('--rate', type=int, default=48000)
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'benchmark':
+        benchmark(args.seconds, args.rate)
+        return 0
+    results = report(args.clips)
+    return 0 if results else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
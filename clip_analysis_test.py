@@ -0,0 +1,78 @@
+# clip_analysis_test
+# Onset detection and latency report on synthetic clips:
+#   python3 clip_analysis_test.py
+
+import datetime
+import os
+import tempfile
+import wave
+import zoneinfo
+
+import numpy as np
+
+import audio_monitor
+import clip_analysis
+from audio_capture import clip_name
+from checks import check, finish
+
+RATE = 48000
+
+
+def bugle_clip(length_s, onset_s, seed=0):
+    """Low noise with a Bb bugle tone (and harmonics) starting at onset_s."""
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal(int(length_s * RATE)) * 40
+    start = int(onset_s * RATE)
+    t = np.arange(len(x) - start) / RATE
+    tone = sum(np.sin(2 * np.pi * 233.08 * k * t) / k for k in (1, 2, 3, 4))
+    x[start:] += 5000 * tone * np.minimum(1, t / 0.02)
+    return x.astype(np.int16)
+
+
+def write_clip(directory, started, samples):
+    path = os.path.join(directory, clip_name(started))
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(samples.tobytes())
+    return path
+
+
+def test_detect_onset():
+    errors = [abs(clip_analysis.detect_onset(bugle_clip(20, onset, seed), RATE) - onset)
+              for seed, onset in enumerate((10.0, 10.0123, 2.5, 17.75))]
+    check('onset found within 5 ms ({:.1f} ms worst)'.format(max(errors) * 1000), max(errors) < 0.005)
+    check('no onset in noise alone', clip_analysis.detect_onset(bugle_clip(20, 20), RATE) is None)
+
+
+def test_latency_report():
+    colors = datetime.datetime(2025, 6, 1, 8, 0).timestamp()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Clip with 10 s of pre-roll; the player started 0.35 s after 08:00
+        path = write_clip(tmp, colors - 10, bugle_clip(30, 10.35))
+        stray = write_clip(tmp, colors + 3600, bugle_clip(5, 2))
+        results = clip_analysis.report([path, stray])
+    check('clip matched to Colors', results[0]['event'] == '08:00 Event (Colors)')
+    check('latency measured from the scheduled time', abs(results[0]['latency'] - 0.35) < 0.005)
+    check('clip without an event has no latency',
+          results[1]['event'] is None and results[1]['latency'] is None)
+
+
+def test_site_schedule():
+    # Events are matched in the site's timezone and from its own sunset table
+    tz = zoneinfo.ZoneInfo('America/New_York')
+    site = audio_monitor.Site('east', tz, [1080, 1081], datetime.date(2026, 3, 1))
+    colors = datetime.datetime(2026, 3, 1, 8, tzinfo=tz).timestamp()
+    event = clip_analysis.match_event(colors - 10, 30, site)
+    check('Colors matched at 08:00 site time', event is not None and event[:2] == (colors, '0800'))
+    retreat = datetime.datetime(2026, 3, 2, 18, 1, tzinfo=tz).timestamp()
+    event = clip_analysis.match_event(retreat - 10, 30, site)
+    check("Retreat matched from the site's table", event is not None and event[:2] == (retreat, 'sunset'))
+
+
+if __name__ == '__main__':
+    test_detect_onset()
+    test_latency_report()
+    test_site_schedule()
+    finish()
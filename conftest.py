@@ -0,0 +1,35 @@
+"""pytest support for the *_test.py scripts.
+
+The scripts run on their own (python3 <name>_test.py) and count failures
+through checks.check(); under pytest each test_* function fails if it
+added to that count. Tests taking `tmp` get a scratch directory, and the
+asyncio tests are run on a fresh event loop.
+"""
+import asyncio
+import inspect
+
+import pytest
+
+import checks
+
+collect_ignore = ['controller/ds3231_port_test.py']  # Hardware demo, runs on the board only
+
+
+@pytest.fixture
+def tmp(tmp_path):
+    return str(tmp_path)
+
+
+@pytest.fixture(autouse=True)
+def _checks_pass():
+    before = checks.failures
+    yield
+    assert checks.failures == before, '{} check(s) failed'.format(checks.failures - before)
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    if inspect.iscoroutinefunction(pyfuncitem.obj):
+        args = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+        asyncio.run(pyfuncitem.obj(**args))
+        return True
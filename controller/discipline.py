@@ -0,0 +1,91 @@
+"""Clock discipline: the RTC's drift measured at each NTP sync, and the poll interval it allows.
+
+Every sync steps the RTC to the right time, so the offset the next sync
+measures is what the RTC gained or lost in between: divided by the time
+between them it is the drift in ppm (positive when the RTC runs fast). A
+span only counts if nothing else set the RTC meanwhile (the DS3231 at
+boot, a manual set). Spans are averaged weighted by their length, as a
+longer one carries less of the measurement's error, and the weight is
+capped at MAX_WEIGHT_S so the estimate follows slow changes with
+temperature.
+
+The next sync is due when the drift, plus MARGIN_PPM for the estimate's
+own error, would have added up to MAX_ERROR_MS: a few hours for a good
+crystal, minutes for a poor one, within MIN_POLL_S..MAX_POLL_S. The
+interval at most doubles from one sync to the next, so one lucky span
+does not put the next sync a day away, and halves after a failed sync.
+The estimate is kept in DRIFT_FILENAME ("ppm;weight_s") so a reboot
+starts from it.
+"""
+DRIFT_FILENAME = 'drift.dat'
+DEFAULT_POLL_S = 3600  # Until the drift is known
+MIN_POLL_S = 600
+MAX_POLL_S = 86400
+MAX_ERROR_MS = 500  # Error allowed to build up between syncs
+MARGIN_PPM = 2.0
+MAX_WEIGHT_S = 2 * 86400
+MIN_SPAN_S = 60  # Shorter spans measure the NTP error more than the drift
+
+
+class Discipline:
+    def __init__(self, filename=DRIFT_FILENAME, max_error_ms=MAX_ERROR_MS):
+        self.filename = filename
+        self.max_error_ms = max_error_ms
+        self.drift_ppm = None  # Not measured yet
+        self.weight_s = 0
+        self.poll_s = DEFAULT_POLL_S
+        self._last = None  # (time of the last sync, RTC generation after it)
+        if self.load():
+            self.poll_s = self.target_poll_s()
+
+    def target_poll_s(self):
+        """Seconds until the drift would reach max_error_ms."""
+        if self.drift_ppm is None:
+            return DEFAULT_POLL_S
+        rate = abs(self.drift_ppm) + MARGIN_PPM
+        return int(max(MIN_POLL_S, min(MAX_POLL_S, self.max_error_ms * 1000 / rate)))
+
+    def synced(self, offset_us, now_s, generation_before, generation_after):
+        """Records a sync at now_s that found the RTC offset_us behind (true minus RTC).
+
+        generation_before and generation_after are time_logic.rtc_generation
+        before and after the sync set the RTC. Returns the new poll interval.
+        """
+        if self._last is not None and self._last[1] == generation_before:
+            span = now_s - self._last[0]
+            if span >= MIN_SPAN_S:
+                self._add(-offset_us / span, span)
+                self.save()
+        self._last = (now_s, generation_after)
+        self.poll_s = min(self.target_poll_s(), 2 * self.poll_s)
+        return self.poll_s
+
+    def missed(self):
+        """A sync failed: try again sooner. Returns the new poll interval."""
+        self.poll_s = max(MIN_POLL_S, self.poll_s // 2)
+        return self.poll_s
+
+    def _add(self, ppm, span):
+        if self.drift_ppm is None:
+            self.drift_ppm = ppm
+        else:
+            self.drift_ppm = (self.drift_ppm * self.weight_s + ppm * span) / (self.weight_s + span)
+        self.weight_s = min(MAX_WEIGHT_S, self.weight_s + span)
+
+    def load(self):
+        """Reads the saved estimate. Returns True if there was one."""
+        try:
+            with open(self.filename) as f:
+                ppm, weight = f.read().strip().split(';')
+            self.drift_ppm = float(ppm)
+            self.weight_s = int(weight)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def save(self):
+        try:
+            with open(self.filename, 'w') as f:
+                f.write('{:.3f};{}\n'.format(self.drift_ppm, self.weight_s))
+        except OSError as e:
+            print("Could not save drift estimate:", e)
@@ -0,0 +1,95 @@
+# discipline_test
+# Tests for discipline.py. Runs under MicroPython on the controller (with the repo's checks.py copied
+# alongside) or under CPython:
+#   micropython discipline_test.py      (or: python3 controller/discipline_test.py)
+
+import os
+import sys
+
+try:
+    import discipline
+    from checks import check, finish
+except ImportError:
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path[:0] = [here, os.path.dirname(here)]
+    import discipline
+    from checks import check, finish
+
+FILENAME = 'discipline_test.dat'
+HOUR = 3600
+
+
+def remove(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def fresh():
+    remove(FILENAME)
+    return discipline.Discipline(FILENAME)
+
+
+def test_measurement():
+    d = fresh()
+    check('default interval until the drift is known', d.drift_ppm is None and d.poll_s == discipline.DEFAULT_POLL_S)
+    d.synced(-250000, 1000, 0, 1)  # Boot: nothing to compare with
+    check('first sync measures nothing', d.drift_ppm is None and d.poll_s == discipline.DEFAULT_POLL_S)
+    d.synced(-36000, 1000 + HOUR, 1, 2)  # 36 ms fast after an hour
+    check('10 ppm fast measured', abs(d.drift_ppm - 10) < 1e-9 and d.weight_s == HOUR)
+    check('interval at most doubles', d.poll_s == 2 * HOUR)
+    d.synced(-144000, 1000 + 3 * HOUR, 2, 3)  # 20 ppm over two hours
+    check('spans weighted by length', abs(d.drift_ppm - (10 * 1 + 20 * 2) / 3) < 1e-9)
+    check('interval holds the error bound', d.poll_s == min(4 * HOUR, int(500000 / (d.drift_ppm + 2))))
+
+
+def test_spans_skipped():
+    d = fresh()
+    d.synced(0, 0, 0, 1)
+    d.synced(5000000, HOUR, 2, 3)  # Something else set the RTC in between
+    check('span with another RTC set ignored', d.drift_ppm is None)
+    d.synced(-1000, HOUR + 30, 3, 4)
+    check('span too short to measure ignored', d.drift_ppm is None)
+    d.synced(18000, 2 * HOUR + 30, 4, 5)
+    check('slow RTC gives negative ppm', abs(d.drift_ppm + 5) < 1e-9)
+
+
+def test_limits():
+    d = fresh()
+    for i in range(1, 12):
+        d.synced(-1389 * HOUR * (i > 1), i * HOUR, i, i + 1)  # Two minutes a day
+    check('poor crystal polls at the minimum', d.poll_s == discipline.MIN_POLL_S)
+    d = fresh()
+    t = 0
+    for i in range(12):
+        t += d.poll_s
+        d.synced(-d.poll_s // 2 if i else 0, t, i, i + 1)  # 0.5 ppm
+    check('good crystal polls at the maximum', d.poll_s == discipline.MAX_POLL_S)
+    check('weight capped so the estimate can follow temperature', d.weight_s == discipline.MAX_WEIGHT_S)
+    d.missed()
+    check('failed sync halves the interval', d.poll_s == discipline.MAX_POLL_S // 2)
+    for _ in range(10):
+        d.missed()
+    check('not below the minimum', d.poll_s == discipline.MIN_POLL_S)
+
+
+def test_persistence():
+    d = fresh()
+    d.synced(0, 0, 0, 1)
+    d.synced(-72000, 2 * HOUR, 1, 2)
+    again = discipline.Discipline(FILENAME)
+    check('estimate survives a reboot', abs(again.drift_ppm - 10) < 0.001 and again.weight_s == 2 * HOUR)
+    check('reboot starts from the interval it allows', again.poll_s == again.target_poll_s() == 41666)
+    with open(FILENAME, 'w') as f:
+        f.write('garbage\n')
+    check('unreadable file ignored', discipline.Discipline(FILENAME).drift_ppm is None)
+    remove(FILENAME)
+
+
+if __name__ == '__main__':
+    test_measurement()
+    test_spans_skipped()
+    test_limits()
+    test_persistence()
+    finish()
@@ -0,0 +1,112 @@
+# ds3231_calibration_test
+# Tests for the aging offset, temperature and calibration support in ds3231_port.py, against the
+# mpshim DS3231 register file on CPython (it needs control of time):
+#   python3 controller/ds3231_calibration_test.py
+
+import os
+import sys
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+import mpshim
+from checks import check, finish
+from mpshim import machine
+from mpshim.devices import FakeDS3231
+
+FILENAME = 'ds3231_calibration_test.dat'
+DAY = 86400
+
+
+def setup(drift_ppm=0.0):
+    """A fresh DS3231 driver on a fake running drift_ppm fast, and the fake."""
+    vclock = mpshim.VirtualClock(820454400)
+    mpshim.install(vclock)
+    with mpshim.controller_imports(here, ('ds3231_port',)):
+        import ds3231_port
+    fake = machine.i2c_devices[FakeDS3231.ADDRESS]
+    fake.drift_ppm = drift_ppm
+    return ds3231_port, ds3231_port.DS3231(machine.I2C(0, freq=100000)), fake, vclock
+
+
+def remove(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def test_registers():
+    ds3231_port, ds, fake, _ = setup()
+    check('aging offset written as two\'s complement', ds.set_aging(-5) == -5 and ds.get_aging() == -5
+          and fake.registers[FakeDS3231.AGING] == 0xFB)
+    writes = [entry for entry in machine.i2c_log if entry[0] == 'write']
+    check('conversion started so it applies at once',
+          writes[-1][2] == FakeDS3231.CONTROL and writes[-1][3][0] & FakeDS3231.CONV)
+    check('aging offset clamped to a byte', ds.set_aging(200) == 127 and ds.set_aging(-300) == -128)
+    readings = []
+    for temperature in (25.25, -3.5, 0.0):
+        fake.temperature = temperature
+        readings.append(ds.get_temperature())
+    check('temperature in quarter degrees, below zero too', readings == [25.25, -3.5, 0.0])
+
+
+def test_lead():
+    _, ds, fake, vclock = setup()
+    fake.offset = 0.25
+    lead = ds.lead_us(lambda: round(vclock.true * 1000000))
+    check('lead measured at a seconds transition ({} us)'.format(lead), abs(lead - 250000) < 2000)
+    fake.stopped = fake.now()
+    start = vclock.true
+    try:
+        ds.lead_us(lambda: round(vclock.true * 1000000))
+        raised = False
+    except OSError:
+        raised = True
+    waited = vclock.true - start
+    check('stopped oscillator raises OSError after {:.2f}s'.format(waited), raised and 1.1 <= waited < 1.2)
+
+
+def test_calibration():
+    ds3231_port, ds, fake, vclock = setup(drift_ppm=3.14)
+    remove(FILENAME)
+    cal = ds3231_port.Calibration(ds, FILENAME)
+
+    def compare(hours):
+        vclock.advance(hours * 3600)
+        return cal.observe(int(vclock.true), ds.lead_us(lambda: round(vclock.true * 1000000)))
+
+    check('first comparison only starts a span', compare(0) is None and cal._span == 0)
+    results = [compare(6) for _ in range(4)]
+    check('aging offset set after a day of spans ({})'.format(results), results[:3] == [None] * 3
+          and results[3] == 31 and ds.get_aging() == 31)
+    check('residual error under a step ({:+.3f} ppm)'.format(fake.ppm()), abs(fake.ppm()) < 0.05)
+    for _ in range(4):
+        compare(6)
+    check('calibrated DS3231 left alone', ds.get_aging() == 31 and len(cal.history) == 2
+          and abs(cal.history[-1][1]) < 0.05)
+
+    fake.temperature = 40.0
+    compare(6)
+    check('span across a temperature change skipped', cal._span == 0 and cal._last[2] == 40.0)
+    cal.reset()
+    compare(6)
+    check('reset starts a new span', cal._span == 0)
+
+    again = ds3231_port.Calibration(ds, FILENAME)
+    check('history kept in the file', [entry[4] for entry in again.history] == [31, 31]
+          and again.history[0][2] == 25.0 and abs(again.history[0][1] - 3.14) < 0.05)
+    remove(FILENAME)
+
+    ds3231_port, ds, fake, vclock = setup(drift_ppm=-1.5)
+    cal = ds3231_port.Calibration(ds, FILENAME)
+    compare(0)
+    compare(24)
+    check('slow DS3231 gets a negative aging offset', ds.get_aging() == -15)
+    remove(FILENAME)
+
+
+if __name__ == '__main__':
+    test_registers()
+    test_lead()
+    test_calibration()
+    finish()
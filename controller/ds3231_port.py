@@ -8,6 +8,11 @@ import utime
 import machine
 import sys
 DS3231_I2C_ADDR = 104
+AGING_REG = 0x10
+CONTROL_REG = 0x0e
+CONV = 0x20  # Control register: start a temperature conversion
+AGING_STEP_PPM = 0.1  # Frequency change per step of the aging offset, near 25C
+TRANSITION_TIMEOUT_MS = 1100  # A running oscillator ticks within a second
 
 try:
     rtc = machine.RTC()
@@ -96,11 +101,16 @@ class DS3231:
             self.ds3231.writeto_mem(DS3231_I2C_ADDR, 5, tobytes(dec2bcd(MM)))
             self.ds3231.writeto_mem(DS3231_I2C_ADDR, 6, tobytes(dec2bcd(YY-1900)))
 
-    # Wait until DS3231 seconds value changes before reading and returning data
+    # Wait until DS3231 seconds value changes before reading and returning data.
+    # Raises OSError if it has not changed after TRANSITION_TIMEOUT_MS: the
+    # oscillator is stopped (OSF set, EOSC, or a flat battery on backup power).
     def await_transition(self):
         self.ds3231.readfrom_mem_into(DS3231_I2C_ADDR, 0, self.timebuf)
         ss = self.timebuf[0]
+        t = utime.ticks_ms()
         while ss == self.timebuf[0]:
+            if utime.ticks_diff(utime.ticks_ms(), t) > TRANSITION_TIMEOUT_MS:
+                raise OSError('DS3231 seconds not advancing')
             self.ds3231.readfrom_mem_into(DS3231_I2C_ADDR, 0, self.timebuf)
         return self.timebuf
 
@@ -155,3 +165,99 @@ class DS3231:
         t = self.ds3231.readfrom_mem(DS3231_I2C_ADDR, 0x11, 2)
         i = t[0] << 8 | t[1]
         return self._twos_complement(i >> 6, 10) * 0.25
+
+    # Aging offset: signed, -128..127. Each step slows the oscillator by about
+    # AGING_STEP_PPM. A new value applies from the next temperature conversion,
+    # so one is started at once.
+    def get_aging(self):
+        v = self.ds3231.readfrom_mem(DS3231_I2C_ADDR, AGING_REG, 1)[0]
+        return self._twos_complement(v, 8)
+
+    def set_aging(self, value):
+        value = max(-128, min(127, int(value)))
+        self.ds3231.writeto_mem(DS3231_I2C_ADDR, AGING_REG, tobytes(value & 0xff))
+        control = self.ds3231.readfrom_mem(DS3231_I2C_ADDR, CONTROL_REG, 1)[0]
+        self.ds3231.writeto_mem(DS3231_I2C_ADDR, CONTROL_REG, tobytes(control | CONV))
+        return value
+
+    # Microseconds by which the DS3231 leads a reference clock. now_us() returns
+    # the reference time in microseconds (same epoch as utime); it is read
+    # just after a seconds transition of the DS3231, as in rtc_test.
+    def lead_us(self, now_us):
+        self.await_transition()
+        t = now_us()
+        return utime.mktime(self.convert()) * 1_000_000 - t
+
+
+# Aging offset calibration from successive comparisons with a reference (NTP).
+# observe() is given the reference time and the DS3231's lead_us() at each
+# comparison. The lead gained between two comparisons, over the seconds
+# between them, is the DS3231's error in ppm. Spans across more than
+# MAX_TEMP_STEP degrees are skipped: the chip's temperature compensation
+# leaves a residual that changes with temperature, which one aging offset
+# cannot correct. Once MIN_SPAN seconds of spans are in, the aging offset
+# is moved by the error over AGING_STEP_PPM and the result is appended to
+# history as (time, ppm, temperature, aging before, aging after), the last
+# HISTORY entries of which are kept in filename ("t;ppm;C;before;after"
+# lines). rebase() marks a new starting point after the time was written
+# in step with the reference; reset() forgets it after any other write.
+class Calibration:
+    MIN_SPAN = 86400
+    MAX_TEMP_STEP = 5.0
+    HISTORY = 32
+
+    def __init__(self, ds3231, filename='aging.dat'):
+        self.ds3231 = ds3231
+        self.filename = filename
+        self.history = []
+        self._last = None  # (time, lead in us, temperature) at the last comparison
+        self._gained = 0  # us gained over the spans counted at the current aging offset
+        self._span = 0
+        self.load()
+
+    def observe(self, now, lead_us):
+        # Returns the aging offset if this comparison completed a calibration, else None
+        temperature = self.ds3231.get_temperature()
+        last = self._last
+        self._last = (now, lead_us, temperature)
+        if last is None or now <= last[0] or abs(temperature - last[2]) > self.MAX_TEMP_STEP:
+            return None
+        self._gained += lead_us - last[1]
+        self._span += now - last[0]
+        if self._span < self.MIN_SPAN:
+            return None
+        ppm = self._gained / self._span
+        self._gained = 0
+        self._span = 0
+        before = self.ds3231.get_aging()
+        after = before
+        if abs(ppm) >= AGING_STEP_PPM / 2:
+            after = self.ds3231.set_aging(before + round(ppm / AGING_STEP_PPM))
+        self.history.append((now, ppm, temperature, before, after))
+        del self.history[:-self.HISTORY]
+        self.save()
+        return after
+
+    def rebase(self, now, lead_us=0):
+        self._last = (now, lead_us, self.ds3231.get_temperature())
+
+    def reset(self):
+        self._last = None
+
+    def load(self):
+        try:
+            with open(self.filename) as f:
+                for line in f:
+                    t, ppm, temperature, before, after = line.strip().split(';')
+                    self.history.append((int(t), float(ppm), float(temperature), int(before), int(after)))
+        except (OSError, ValueError):
+            pass
+        del self.history[:-self.HISTORY]
+
+    def save(self):
+        try:
+            with open(self.filename, 'w') as f:
+                for entry in self.history:
+                    f.write('{};{:.3f};{:.2f};{};{}\n'.format(*entry))
+        except OSError as e:
+            print('Could not save aging history:', e)
@@ -0,0 +1,77 @@
+"""UDP broadcast of the calls the controller triggers, for the audio monitor.
+
+main.py announces every UART command it sends and every BTN-* message the
+MP3 player reports, so audio_monitor.py can start capturing as the call
+starts instead of at its own idea of the schedule.
+
+Datagram: 12-byte header (magic, version, kind, sequence number, Unix
+epoch second) then the event key or button message in ASCII. Each
+datagram is sent REPEATS times with the same sequence number; the
+monitor ignores the copies. Sending never raises: without a network the
+announcement is dropped and the controller carries on.
+"""
+import socket
+import struct
+import time
+
+PORT = 5005
+ADDRESS = '255.255.255.255'
+MAGIC = b'CMEV'
+VERSION = 1
+KIND_TRIGGER = 0  # The controller sent an event's UART command; name is its key
+KIND_BUTTON = 1  # The MP3 player reported a button press; name is the BTN-* message
+HEADER = '!4sBBHI'
+HEADER_SIZE = 12
+REPEATS = 2  # Copies of each datagram, against a dropped packet
+
+# MicroPython counts from 2000; the datagram carries Unix time
+UNIX_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+
+
+def pack(kind, seq, when, name):
+    return struct.pack(HEADER, MAGIC, VERSION, kind, seq & 0xFFFF, when) + name.encode()
+
+
+def unpack(data):
+    """Return (kind, seq, when, name) of a datagram, or None if it is not one."""
+    if len(data) <= HEADER_SIZE:
+        return None
+    magic, version, kind, seq, when = struct.unpack(HEADER, data[:HEADER_SIZE])
+    if magic != MAGIC or version != VERSION:
+        return None
+    try:
+        return kind, seq, when, data[HEADER_SIZE:].decode()
+    except UnicodeError:
+        return None
+
+
+class Broadcaster:
+    def __init__(self, address=ADDRESS, port=PORT, repeats=REPEATS):
+        self.address = socket.getaddrinfo(address, port)[0][-1]
+        self.repeats = repeats
+        self.seq = 0
+        self._sock = None
+
+    def send(self, kind, name, when=None):
+        """Announce an event; returns True if the datagram was sent."""
+        if when is None:
+            when = int(time.time()) + UNIX_OFFSET
+        self.seq = (self.seq + 1) & 0xFFFF
+        data = pack(kind, self.seq, when, name)
+        try:
+            if self._sock is None:
+                self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                if hasattr(socket, 'SO_BROADCAST'):
+                    self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            for _ in range(self.repeats):
+                self._sock.sendto(data, self.address)
+            return True
+        except OSError as e:
+            print("Event broadcast failed:", e)
+            self.close()  # Reopened on the next send, e.g. after WiFi reconnects
+            return False
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
@@ -4,10 +4,16 @@ import ssd1306
 import time_logic  # Import own time_logic module
 import wifimgr
 import sunset  # Import own sunset module
+import schedule  # Compiled daily event plan
+import scheduler  # Next-event deadline heap
 import config    # Import config module for shared variables
+import event_broadcast  # UDP announcements for the audio monitor
 
 # User-defined variables
-utc_offset = -8 * 3600  # PST is UTC-8. Adjust for your timezone in seconds.
+# Local time zone as a POSIX TZ string: standard abbreviation and hours west
+# of UTC, DST abbreviation, then when DST starts and ends (see
+# time_logic.TimeZone). E.g. "EST5EDT,M3.2.0,M11.1.0", "CET-1CEST,M3.5.0,M10.5.0/3", "MST7".
+timezone = "PST8PDT,M3.2.0,M11.1.0"
 baud_rate = 9600
 
 # NTP configuration: prioritized list of servers to try for time sync.
@@ -22,6 +28,8 @@ ntp_retry_delay = 1
 # Whether to apply DST adjustments in local time calculations. Set in main.
 enable_dst = True
 
+tz = time_logic.TimeZone(timezone, enable_dst)
+
 # I2C and OLED setup using your specified pins
 i2c = I2C(scl=Pin(14), sda=Pin(47))
 oled_width = 128
@@ -36,6 +44,15 @@ except Exception as e:
 # UART setup for communication with the other ESP32
 uart2 = UART(2, baudrate=baud_rate, tx=Pin(41), rx=Pin(38)) #connect TX41 to RX21 on other ESP32 and RX38 to TX22 on other ESP32
 
+# Announces each event sent and each button played to the audio monitor
+broadcaster = event_broadcast.Broadcaster()
+
+# Called before each main-loop sleep with its length and when the loop next has
+# work of its own: the next event deadline (or None), NTP sync and WiFi retry,
+# in time.time() seconds. Returns the sleep to take. None on the device; the
+# host simulator (controller_sim.py) sets it to skip idle seconds.
+idle_hook = None
+
 # sync_ntp_time and formatting functions moved to time_logic.py and imported above.
 
 def main():
@@ -80,40 +97,24 @@ def main():
 
     # --- Main Clock Loop ---
     last_ntp_sync_time = time_logic.time.time()
-    ntp_sync_interval = 3600  # 1 hour in seconds
+    ntp_sync_interval = time_logic.drift.poll_s  # From the RTC's measured drift (discipline.py)
     
     last_wifi_retry_time = time_logic.time.time()
     wifi_retry_interval = 1800 # 30 minutes
     
-    first_call_morning_t = 7 * 60 + 55
-    mornning_colors_t = 8 * 60
-    taps_t = 22 * 60
-    
+    # Days outside the sunset table are computed and need the clock's zone
+    sunset.provider.tz = tz
 
-    start_date_tuple = sunset.START_DATE_TUPLE
-    day_num_today = sunset.get_day_number(start_date_tuple)
-    sunset_minutes = sunset.get_sunset_minutes(day_num_today)
-    
+    # One reading of the local time per pass, shared by the events and the display
+    clock = time_logic.Clock(tz)
+
+    # Today's events, kept in a deadline heap and rebuilt when the local date changes
+    events = scheduler.Scheduler(clock=clock.time)
+    events_day = None
+    sunset_minutes = None
     display_sunset_hrs = None
     display_sunset_mins = None
-    
-    if sunset_minutes is None:
-        print("Sunset data not found for today. Using default schedule.")
-        config.set_system_msg("Sunset data N/A")
-    else:
-        five_min_before_sunset = sunset_minutes - 5
-        display_sunset_hrs = sunset_minutes//60
-        display_sunset_mins = (sunset_minutes%60)
-        new_msg = f"Sunset: {display_sunset_hrs:02}:{display_sunset_mins:02}"
-        print("Initial sunset message:", new_msg)
-        config.set_system_msg(new_msg)
-    action_flags = {
-        '0755': False,
-        '0800': False,
-        'five_min_before_sunset': False,
-        'sunset': False,
-        '2200': False
-    }
+
     # OLED displayTimer setup
     displayTimer = 0
     
@@ -129,10 +130,10 @@ def main():
             wifimgr.start()
             
             
-        # Check for hourly NTP sync (only if connected)
+        # Check for the next NTP sync (only if connected)
         if wifimgr.wlan_sta.isconnected():
             if time_logic.time.time() - last_ntp_sync_time > ntp_sync_interval:
-                print("Hourly NTP sync triggered.")
+                print("NTP sync triggered.")
                 
                 # Check for custom NTP
                 custom_ntp = wifimgr.get_connected_ntp()
@@ -144,8 +145,9 @@ def main():
                 if time_logic.sync_ntp_time(current_ntp_hosts, ntp_retry_delay):
                     last_ntp_sync_time = time_logic.time.time()
                 else:
-                    print("Hourly NTP sync failed.")
-                    last_ntp_sync_time = time_logic.time.time()  # Avoid repeated attempts until next hour
+                    print("NTP sync failed.")
+                    last_ntp_sync_time = time_logic.time.time()  # Retry after the (shortened) interval
+                ntp_sync_interval = time_logic.drift.poll_s
         else:
             # WiFi Retry Logic (every 30 mins if not connected)
             if time_logic.time.time() - last_wifi_retry_time > wifi_retry_interval:
@@ -162,62 +164,57 @@ def main():
                         
                     if time_logic.sync_ntp_time(current_ntp_hosts, ntp_retry_delay):
                         last_ntp_sync_time = time_logic.time.time()
+                    ntp_sync_interval = time_logic.drift.poll_s
                 else:
                     print("WiFi retry failed.")
                 last_wifi_retry_time = time_logic.time.time()
         
-        # Get the current time with the timezone offset for display
-        t = time_logic.localtime_with_optional_dst(utc_offset, enable_dst=True)
-        current_minutes = time_logic.get_current_minutes_past_midnight(utc_offset, enable_dst=True)
-
-        if display_sunset_hrs is not None:
-            new_msg = f"Sunset: {display_sunset_hrs:02}:{display_sunset_mins:02}"
-            config.set_system_msg(new_msg)
-            # --- Time-based action logic ---
-        if not action_flags['0755'] and current_minutes == first_call_morning_t:
-            uart2.write("2\n")
-            action_flags['0755'] = True
-
-        if not action_flags['0800'] and current_minutes == mornning_colors_t:
-            uart2.write("0\n")
-            action_flags['0800'] = True
+        # This pass's time, for the schedule and the display alike
+        clock.tick()
+        t = clock.local
+        now = clock.now
 
-        if sunset_minutes is not None and not action_flags['five_min_before_sunset'] and current_minutes == five_min_before_sunset and sunset_switch:
-            uart2.write("2\n")
-            action_flags['five_min_before_sunset'] = True
-
-        if sunset_minutes is not None and not action_flags['sunset'] and current_minutes == sunset_minutes and sunset_switch:
-            uart2.write("3\n")
-            action_flags['sunset'] = True
-        
-        if not action_flags['2200'] and current_minutes == taps_t:
-            uart2.write("1\n")
-            action_flags['2200'] = True
-            
-            # Check if all daily actions have been completed
-        if all(action_flags.values() or time_logic.get_current_minutes_past_midnight(utc_offset) >= 23.9 * 60):
-            print("All daily actions sent. Waiting for midnight...")
-            # Sleep until the next day (e.g., reset flags at 00:01)
-            # You might use a more advanced timer or a deep sleep here.
-            while time_logic.get_current_minutes_past_midnight(utc_offset) < 1:
-                time_logic.time.sleep(60) # Wait in 1 minute increments near midnight
-            #todo : better way to wait until next day without busy waiting
-            # Reset flags for the new day
-            for key in action_flags:
-                action_flags[key] = False
-            # Re-fetch sunset time for the new day
-            day_num_today = sunset.get_day_number(sunset.START_DATE_TUPLE)
-            sunset_minutes = sunset.get_sunset_minutes(day_num_today)
-            if sunset_minutes is not None:
-                five_min_before_sunset = sunset_minutes - 5
+        # New local day (midnight, or the clock was set): load sunset and schedule its events
+        today = schedule.local_day_number(t)
+        if today != events_day:
+            events_day = today
+            sunset_minutes = sunset.provider.get_sunset_minutes(today)
+            print("Sunset cache:", sunset.provider.cached_days()[1], "days,", sunset.provider.memory_bytes(), "bytes")
+            if sunset_minutes is None:
+                display_sunset_hrs = None
+                print("Sunset data not found for today. Using default schedule.")
+                config.set_system_msg("Sunset data N/A")
+            else:
                 display_sunset_hrs = sunset_minutes//60
                 display_sunset_mins = (sunset_minutes%60)
                 new_msg = f"Sunset: {display_sunset_hrs:02}:{display_sunset_mins:02}"
                 print("Setting system msg to:", new_msg)
                 config.set_system_msg(new_msg)
-            else:
-                print("Setting system msg to: Sunset data N/A")
-                config.set_system_msg("Sunset data N/A")
+            events.clear()
+            for key, when, command in schedule.day_events(today, sunset_minutes, tz):
+                if when > now - events.tolerance:  # Skip events already over when the day starts
+                    events.add(key, when, command)
+            print("Scheduled events:", events.pending())
+
+        if display_sunset_hrs is not None:
+            new_msg = f"Sunset: {display_sunset_hrs:02}:{display_sunset_mins:02}"
+            config.set_system_msg(new_msg)
+
+        # --- Time-based action logic ---
+        # Events fire from the deadline heap, so a stalled loop catches up
+        # (within the scheduler's tolerance) instead of skipping them.
+        due, missed = events.poll(now)
+        for key, when, command in missed:
+            print("Missed event", key, "by", now - when, "seconds")
+        for key, when, command in due:
+            if key in schedule.SUNSET_EVENTS and not sunset_switch:
+                print("Skipping", key, "(Auto_Sunset off)")
+                continue
+            print("Sending event", key, "late by", now - when, "seconds")
+            uart2.write(command)
+            if wifimgr.wlan_sta.isconnected():
+                broadcaster.send(event_broadcast.KIND_TRIGGER, key)
+
        # Display time and date on OLED
         if oled:
             time_str = time_logic.format_time_str(t)
@@ -244,6 +241,8 @@ def main():
                         oled.text(received_data.decode().strip(), 0, 20)
                         oled.show()
                         displayTimer = time_logic.time.ticks_ms()
+                    if received_data.decode().strip().startswith("BTN-") and wifimgr.wlan_sta.isconnected():
+                        broadcaster.send(event_broadcast.KIND_BUTTON, received_data.decode().strip())
                     if received_data.decode().strip() == "Auto_Sunset_ON":
                         sunset_switch = True
                         print("Sunset switch state:", sunset_switch)
@@ -255,7 +254,13 @@ def main():
         if displayTimer > 0 and (time_logic.time.ticks_ms() - displayTimer) >= 5000:
             displayTimer = 0
 
-        time_logic.time.sleep(1)
+        # Wake for the next event, but at least once a second for the display and UART,
+        # counting from this pass's point in the second so the loop wakes as one begins
+        pause = max(0, events.time_until_next(max_wait=1) - clock.ms / 1000)
+        if idle_hook is not None:
+            pause = idle_hook(pause, events.next_deadline(), last_ntp_sync_time + ntp_sync_interval,
+                              last_wifi_retry_time + wifi_retry_interval)
+        time_logic.time.sleep(pause)
 
 # Run the main logic
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+"""Compiled daily event plan (schedule.bin) built by schedule_compiler.py.
+
+Each day's record holds the UTC epoch second of every event with the time
+zone, DST and sunset already applied, so the main loop only compares
+time.time() against one integer per event and evaluates no DST rule.
+
+File layout: 22-byte header (magic, start y/m/d, day count, events per day,
+time zone string length, epoch year, then the zone's standard and DST
+offsets as int32 seconds east of UTC), the zone's POSIX TZ string, then a
+12-byte record per day: the uint32 epoch of the first event (EVENT_KEYS
+order) and, for each other event, uint16 seconds after it (PLAN_NONE when
+the event has no time that day). The compiler writes a window of a year
+or two; a day outside it, or a plan built for another zone than main.py's,
+is computed instead.
+"""
+import struct
+import time
+
+import sunset
+
+PLAN_FILENAME = 'schedule.bin'
+PLAN_MAGIC = b'SPL2'
+PLAN_HEADER_SIZE = 22
+PLAN_NONE = 0xFFFF  # Event without a time that day
+
+# Event keys, the UART command each sends, and its local time as
+# (minutes past midnight, or minutes from sunset when the flag is True)
+EVENT_KEYS = ('0755', '0800', 'five_min_before_sunset', 'sunset', '2200')
+EVENT_COMMANDS = ("2\n", "0\n", "2\n", "3\n", "1\n")
+EVENT_TIMES = ((7 * 60 + 55, False), (8 * 60, False), (-5, True), (0, True), (22 * 60, False))
+# Only sent while the MP3 player's Auto_Sunset switch is on
+SUNSET_EVENTS = ('five_min_before_sunset', 'sunset')
+
+
+def local_day_number(t):
+    """Day number (from sunset.START_DATE_TUPLE) of a local time tuple."""
+    return sunset.days_from_civil(t[0], t[1], t[2]) - sunset.days_from_civil(*sunset.START_DATE_TUPLE[:3])
+
+
+def get_day_plan(day_number, tz):
+    """Return the day's event epochs (EVENT_KEYS order, None for no time), or None.
+
+    None if the plan file is missing, built for another epoch or another
+    time zone than tz (a time_logic.TimeZone), or does not cover the day.
+    """
+    try:
+        with open(PLAN_FILENAME, 'rb') as f:
+            header = f.read(PLAN_HEADER_SIZE)
+            if len(header) != PLAN_HEADER_SIZE or header[0:4] != PLAN_MAGIC:
+                print("Invalid schedule plan header")
+                return None
+            year, month, day, count, events, zone_len, epoch_year, std_offset, dst_offset = \
+                struct.unpack('<HBBHBBHii', header[4:])
+            if epoch_year != time.gmtime(0)[0] or events != len(EVENT_KEYS):
+                print("Schedule plan does not match this device")
+                return None
+            if (std_offset, dst_offset) != (tz.std_offset, tz.dst_offset) or f.read(zone_len) != tz.tz.encode():
+                print("Schedule plan is for another time zone")
+                return None
+            index = day_number - (sunset.days_from_civil(year, month, day)
+                                  - sunset.days_from_civil(*sunset.START_DATE_TUPLE[:3]))
+            if index < 0 or index >= count:
+                return None
+            size = 4 + 2 * (events - 1)
+            f.seek(PLAN_HEADER_SIZE + zone_len + index * size)
+            record = f.read(size)
+            if len(record) != size:
+                return None
+            values = struct.unpack('<I%dH' % (events - 1), record)
+            first = values[0]
+            return (first,) + tuple(None if after == PLAN_NONE else first + after for after in values[1:])
+    except OSError:
+        return None  # No plan uploaded
+
+
+def standard_epoch(year, month, day, minutes, tz):
+    """Epoch second at which a date's `minutes` past midnight fall in tz's standard time."""
+    epoch_day = sunset.days_from_civil(*time.gmtime(0)[:3])
+    return (sunset.days_from_civil(year, month, day) - epoch_day) * 86400 + minutes * 60 - tz.std_offset
+
+
+def local_minutes_to_epoch(year, month, day, minutes, tz):
+    """Epoch second at which the local wall clock on a date reads `minutes`.
+
+    tz is a time_logic.TimeZone; its DST rule is evaluated on the
+    standard-time hour.
+    """
+    ts = standard_epoch(year, month, day, minutes, tz)
+    shift = tz.dst_offset - tz.std_offset
+    if tz.rules and minutes * 60 >= shift and tz.dst_rule(year, month, day, (minutes * 60 - shift) // 3600):
+        return ts - shift  # The wall clock runs ahead of standard time
+    return ts
+
+
+def day_events(day_number, sunset_minutes, tz):
+    """Return [(key, epoch, command)] for a day's events, in EVENT_KEYS order.
+
+    The epochs come from the compiled plan when it covers the day and was
+    built for tz (a time_logic.TimeZone), else from EVENT_TIMES,
+    sunset_minutes and tz's rule. Sunset events are left out when there is
+    no sunset time.
+    """
+    plan = get_day_plan(day_number, tz)
+    if plan is None:
+        year, month, day = sunset.civil_from_days(
+            sunset.days_from_civil(*sunset.START_DATE_TUPLE[:3]) + day_number)
+        plan = []
+        for minutes, from_sunset in EVENT_TIMES:
+            if from_sunset:
+                if sunset_minutes is None:
+                    plan.append(None)
+                    continue
+                minutes += sunset_minutes
+            plan.append(local_minutes_to_epoch(year, month, day, minutes, tz))
+    return [(EVENT_KEYS[i], plan[i], EVENT_COMMANDS[i]) for i in range(len(EVENT_KEYS)) if plan[i] is not None]
@@ -0,0 +1,94 @@
+"""Next-event scheduler for the main loop. Runs on MicroPython and CPython.
+
+Events are kept in a min-heap keyed by their absolute epoch second, so the
+loop can ask for next_deadline() and sleep until then instead of comparing
+the clock against every event each second. An event fires once when the
+clock reaches it; if the loop stalled past it (NTP retries, WiFi scan, AP
+mode) it still fires on the next poll as long as it is no more than
+`tolerance` seconds late, and is reported as missed after that.
+"""
+try:
+    import heapq
+except ImportError:  # Older MicroPython ports
+    import uheapq as heapq
+import time
+
+DEFAULT_TOLERANCE_S = 300
+
+
+class Scheduler:
+    def __init__(self, tolerance=DEFAULT_TOLERANCE_S, clock=time.time):
+        self.tolerance = tolerance
+        self.clock = clock
+        self._heap = []
+        self._seq = 0  # Keeps heap order stable for events at the same second
+        self._fired = {}  # key -> epoch it last fired (or was missed) for
+
+    def add(self, key, when, payload=None):
+        """Schedule `key` at epoch `when`.
+
+        Re-adding a key replaces its pending time. Adding a key for a time it
+        has already fired (or been missed) for is ignored, so a plan can be
+        rebuilt at any point without repeating events.
+        """
+        if self._fired.get(key) == when:
+            return False
+        self.remove(key)
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, key, payload))
+        return True
+
+    def remove(self, key):
+        """Drop a pending event. Returns True if it was scheduled."""
+        for i, entry in enumerate(self._heap):
+            if entry[2] == key:
+                self._heap.pop(i)
+                heapq.heapify(self._heap)
+                return True
+        return False
+
+    def clear(self):
+        """Drop all pending events (fired history is kept)."""
+        self._heap = []
+
+    def pending(self):
+        """Return [(when, key, payload)] in firing order."""
+        return [(e[0], e[2], e[3]) for e in sorted(self._heap)]
+
+    def next_deadline(self):
+        """Epoch of the earliest pending event, or None."""
+        return self._heap[0][0] if self._heap else None
+
+    def time_until_next(self, now=None, max_wait=None):
+        """Seconds to sleep before the next event (0 if one is due).
+
+        Capped at max_wait; None when nothing is pending and max_wait is None.
+        """
+        deadline = self.next_deadline()
+        if deadline is None:
+            return max_wait
+        if now is None:
+            now = self.clock()
+        wait = max(0, deadline - now)
+        return wait if max_wait is None else min(wait, max_wait)
+
+    def poll(self, now=None):
+        """Pop every event whose time has come.
+
+        Returns (due, missed): lists of (key, when, payload). due holds events
+        within the tolerance window, in time order; missed holds events the
+        loop reached more than `tolerance` seconds late.
+        """
+        if now is None:
+            now = self.clock()
+        due = []
+        missed = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            when, _, key, payload = heapq.heappop(heap)
+            self._fired[key] = when
+            if now - when <= self.tolerance:
+                due.append((key, when, payload))
+            else:
+                missed.append((key, when, payload))
+        return due, missed
@@ -0,0 +1,119 @@
+# scheduler_test
+# Simulated-clock tests for scheduler.py. Runs under MicroPython (with the repo's checks.py copied
+# alongside) or CPython:
+#   micropython scheduler_test.py      (or: python3 controller/scheduler_test.py)
+
+try:
+    from checks import check, finish
+except ImportError:  # CPython: checks.py is at the repo root
+    import os
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from checks import check, finish
+from scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_order_and_deadline():
+    clock = FakeClock(1000)
+    s = Scheduler(clock=clock)
+    check('empty scheduler has no deadline', s.next_deadline() is None)
+    check('empty wait is max_wait', s.time_until_next(max_wait=1) == 1)
+    s.add('b', 1300)
+    s.add('a', 1100)
+    s.add('c', 1200)
+    check('deadline is earliest event', s.next_deadline() == 1100)
+    check('wait until earliest event', s.time_until_next() == 100)
+    check('wait capped by max_wait', s.time_until_next(max_wait=1) == 1)
+    check('pending in time order', [k for _, k, _ in s.pending()] == ['a', 'c', 'b'])
+
+
+def test_fires_once():
+    clock = FakeClock(0)
+    s = Scheduler(clock=clock)
+    s.add('taps', 100, '1\n')
+    check('not due early', s.poll() == ([], []))
+    clock.now = 100
+    due, missed = s.poll()
+    check('due on time', due == [('taps', 100, '1\n')] and missed == [])
+    check('not due again', s.poll() == ([], []))
+    check('re-adding a fired event is ignored', not s.add('taps', 100, '1\n'))
+    check('nothing pending after re-add', s.next_deadline() is None)
+    check('same key on a later day is accepted', s.add('taps', 100 + 86400))
+
+
+def test_catch_up_after_stall():
+    clock = FakeClock(0)
+    s = Scheduler(tolerance=300, clock=clock)
+    s.add('0755', 1000)
+    s.add('0800', 1300)
+    clock.now = 1090  # Loop stalled through 0755 by 90 s
+    due, missed = s.poll()
+    check('late event within tolerance still fires', [k for k, _, _ in due] == ['0755'])
+    clock.now = 1700  # Stalled 400 s past 0800
+    due, missed = s.poll()
+    check('event beyond tolerance reported missed', due == [] and [k for k, _, _ in missed] == ['0800'])
+
+
+def test_several_due_at_once():
+    clock = FakeClock(0)
+    s = Scheduler(clock=clock)
+    s.add('sunset', 500)
+    s.add('five_min_before_sunset', 300)
+    clock.now = 510
+    due, _ = s.poll()
+    check('events due together fire in time order',
+          [k for k, _, _ in due] == ['five_min_before_sunset', 'sunset'])
+
+
+def test_replace_and_remove():
+    s = Scheduler(clock=FakeClock(0))
+    s.add('sunset', 500)
+    s.add('sunset', 450)
+    check('re-adding a pending key replaces it', s.pending() == [(450, 'sunset', None)])
+    check('remove pending key', s.remove('sunset') and s.next_deadline() is None)
+    check('remove unknown key', not s.remove('sunset'))
+
+
+def test_simulated_day():
+    # A day of the main loop: sleep until the next deadline (at most 1 s),
+    # with occasional long stalls. Every event must fire exactly once.
+    clock = FakeClock(0)
+    s = Scheduler(tolerance=300, clock=clock)
+    times = {'0755': 28500, '0800': 28800, 'five_min_before_sunset': 61080,
+             'sunset': 61380, '2200': 79200}
+    for key, when in times.items():
+        s.add(key, when)
+    stalls = {28400: 150, 61000: 200}  # e.g. NTP retries, WiFi scan
+    fired = []
+    wakeups = 0
+    while clock.now < 86400:
+        due, missed = s.poll()
+        fired += [(k, clock.now - w) for k, w, _ in due + missed]
+        wakeups += 1
+        stall = stalls.pop(int(clock.now), 0)
+        clock.sleep(stall if stall else (s.time_until_next(max_wait=3600) or 3600))
+    keys = [k for k, _ in fired]
+    check('every event fired once over a simulated day', sorted(keys) == sorted(times))
+    check('stalled events fired late, within tolerance', max(late for _, late in fired) <= 300)
+    check('loop woke only around events ({} wakeups)'.format(wakeups), wakeups < 40)
+
+
+if __name__ == '__main__':
+    test_order_and_deadline()
+    test_fires_once()
+    test_catch_up_after_stall()
+    test_several_due_at_once()
+    test_replace_and_remove()
+    test_simulated_day()
+    finish()
@@ -150,10 +150,11 @@ class SDCard:
         # create and send the command
         buf = self.cmdbuf
         buf[0] = 0x40 | cmd
-        buf[1] = arg >> 24
-        buf[2] = arg >> 16
-        buf[3] = arg >> 8
-        buf[4] = arg
+        # Masked: MicroPython truncates bytearray stores, CPython raises
+        buf[1] = (arg >> 24) & 0xFF
+        buf[2] = (arg >> 16) & 0xFF
+        buf[3] = (arg >> 8) & 0xFF
+        buf[4] = arg & 0xFF
         buf[5] = crc
         self.spi.write(buf)
 
@@ -0,0 +1,181 @@
+"""SNTP client that asks every server at once. Runs on MicroPython and CPython.
+
+query() sends one request to each host from a single non-blocking UDP
+socket and collects the answers with select.poll, so dead or slow servers
+cost nothing once a good one has answered. Each answer gives the clock
+offset and round-trip delay (RFC 4330); the one with the shortest delay
+is kept, as its offset has the smallest error. Since every request leaves
+at the same moment, the first valid answer is almost always the quickest:
+query() waits GRACE_MS after it for any that spent less time in the
+server, then stops.
+
+Local timestamps come from ticks_us() against one reading of the RTC, so
+the offset is in microseconds, not whole seconds as with ntptime.
+Requests carry their send time as the transmit timestamp, which servers
+echo back; answers that do not echo one of ours are ignored. Host names
+are resolved first, one at a time (getaddrinfo blocks); a name that does
+not resolve is skipped.
+"""
+import socket
+import struct
+import time
+try:
+    import select
+except ImportError:  # Older MicroPython ports
+    import uselect as select
+
+NTP_PORT = 123
+PACKET_SIZE = 48
+# NTP counts from 1900; MicroPython from 2000, CPython from 1970
+NTP_DELTA = 3155673600 if time.gmtime(0)[0] == 2000 else 2208988800
+TIMEOUT_MS = 1000
+GRACE_MS = 20  # Wait after the first answer for one with a shorter delay
+
+if hasattr(time, 'ticks_us'):
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+else:  # CPython
+    def ticks_us():
+        return time.perf_counter_ns() // 1000
+
+    def ticks_diff(end, start):
+        return end - start
+
+if hasattr(time, 'time_ns'):
+    def time_us():
+        return time.time_ns() // 1000
+else:  # Older ports: whole seconds only
+    def time_us():
+        return time.time() * 1000000
+
+
+class Sample:
+    """One server's answer. offset_us is true minus local time, delay_us the round trip.
+
+    received_us and received_ticks are the local time and ticks_us() when
+    it arrived, which now_us() carries forward.
+    """
+    def __init__(self, host, offset_us, delay_us, stratum, received_us, received_ticks=None):
+        self.host = host
+        self.offset_us = offset_us
+        self.delay_us = delay_us
+        self.stratum = stratum
+        self.received_us = received_us
+        self.received_ticks = received_ticks
+
+    def now_us(self):
+        """True time now in epoch microseconds, from the answer and ticks_us() since."""
+        return self.received_us + self.offset_us + ticks_diff(ticks_us(), self.received_ticks)
+
+    def __repr__(self):
+        return "Sample({!r}, offset {} us, delay {} us, stratum {})".format(
+            self.host, self.offset_us, self.delay_us, self.stratum)
+
+
+def to_ntp(us):
+    """(seconds, fraction) NTP timestamp of a device epoch time in microseconds."""
+    seconds, us = divmod(us, 1000000)
+    return (seconds + NTP_DELTA) & 0xFFFFFFFF, (us << 32) // 1000000
+
+
+def from_ntp(seconds, fraction):
+    """Device epoch microseconds of an NTP timestamp."""
+    if seconds < 0x80000000:  # Era 1: after 2036-02-07
+        seconds += 0x100000000
+    return (seconds - NTP_DELTA) * 1000000 + ((fraction * 1000000) >> 32)
+
+
+def request(transmit_us, tag=0):
+    """Client request whose transmit timestamp is transmit_us, with tag in its low bits."""
+    packet = bytearray(PACKET_SIZE)
+    packet[0] = 0x23  # Leap indicator 0, version 4, mode 3 (client)
+    seconds, fraction = to_ntp(transmit_us)
+    struct.pack_into('!II', packet, 40, seconds, (fraction & 0xFFFFFF00) | (tag & 0xFF))
+    return packet
+
+
+def parse(data, host, sent_us, received_us, received_ticks=None):
+    """Sample from a server's answer, or None if it is not a usable one.
+
+    sent_us and received_us are the local times the request left and the
+    answer arrived.
+    """
+    if len(data) < PACKET_SIZE:
+        return None
+    leap, mode, stratum = data[0] >> 6, data[0] & 7, data[1]
+    if mode != 4 or leap == 3 or not 1 <= stratum <= 15:  # Not a server, unsynchronised, or kiss-o'-death
+        return None
+    seconds, fraction = struct.unpack_from('!II', data, 40)
+    if not seconds and not fraction:
+        return None
+    received = from_ntp(*struct.unpack_from('!II', data, 32))  # At the server
+    transmitted = from_ntp(seconds, fraction)
+    offset = ((received - sent_us) + (transmitted - received_us)) // 2
+    delay = (received_us - sent_us) - (transmitted - received)
+    return Sample(host, offset, delay, stratum, received_us, received_ticks)
+
+
+def resolve(hosts, port=NTP_PORT):
+    """[(address, host)] of the hosts that resolve, without duplicates."""
+    addresses = []
+    for host in hosts:
+        try:
+            address = socket.getaddrinfo(host, port)[0][-1]
+        except (OSError, IndexError) as e:
+            print("NTP host {} not resolved: {}".format(host, e))
+            continue
+        if address not in [a for a, _ in addresses]:
+            addresses.append((address, host))
+    return addresses
+
+
+def query(hosts, port=NTP_PORT, timeout_ms=TIMEOUT_MS, grace_ms=GRACE_MS):
+    """Ask every host at once. Returns the Sample with the shortest delay, or None."""
+    addresses = resolve(hosts, port)
+    if not addresses:
+        return None
+    base_us = time_us()
+    base_ticks = ticks_us()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    pending = {}  # Transmit timestamp -> (host, local send time)
+    best = None
+    try:
+        sock.setblocking(False)
+        for tag, (address, host) in enumerate(addresses):
+            sent_us = base_us + ticks_diff(ticks_us(), base_ticks)
+            packet = request(sent_us, tag)
+            try:
+                sock.sendto(packet, address)
+            except OSError as e:
+                print("NTP request to {} failed: {}".format(host, e))
+                continue
+            pending[bytes(packet[40:48])] = (host, sent_us)
+
+        poller = select.poll()
+        poller.register(sock, select.POLLIN)
+        deadline = timeout_ms
+        while pending:
+            left = deadline - ticks_diff(ticks_us(), base_ticks) // 1000
+            if left <= 0 or not poller.poll(left):
+                break
+            while pending:
+                try:
+                    data, _ = sock.recvfrom(PACKET_SIZE + 16)
+                except OSError:
+                    break  # Nothing more waiting
+                received_ticks = ticks_us()
+                received_us = base_us + ticks_diff(received_ticks, base_ticks)
+                entry = pending.pop(bytes(data[24:32]), None)  # Our transmit time, echoed
+                if entry is None:
+                    continue
+                sample = parse(data, entry[0], entry[1], received_us, received_ticks)
+                if sample is None:
+                    print("Unusable NTP answer from", entry[0])
+                    continue
+                if best is None:
+                    deadline = min(deadline, (received_us - base_us) // 1000 + grace_ms)
+                if best is None or sample.delay_us < best.delay_us:
+                    best = sample
+    finally:
+        sock.close()
+    return best
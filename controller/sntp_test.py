@@ -0,0 +1,125 @@
+# sntp_test
+# Tests for sntp.py against stand-in NTP servers on the loopback interface (127.0.0.x), one thread each.
+# Runs under CPython from the repo root:
+#   python3 controller/sntp_test.py
+
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [here, os.path.dirname(here)]
+import sntp
+from checks import check, finish
+
+
+class Server:
+    """NTP server on address:port whose clock runs offset_s ahead, delay_s away on the network.
+
+    kind 'dead' never answers, 'kod' sends a kiss-o'-death (stratum 0) and
+    'stranger' answers without echoing the request's transmit timestamp.
+    """
+    def __init__(self, address, port, offset_s=0.0, delay_s=0.0, kind='ok'):
+        self.offset_s = offset_s
+        self.delay_s = delay_s
+        self.kind = kind
+        self.requests = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((address, port))
+        self.sock.settimeout(0.05)
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _stamp(self):
+        return sntp.to_ntp((time.time_ns() // 1000) + int(self.offset_s * 1000000))
+
+    def _serve(self):
+        while self.running:
+            try:
+                data, client = self.sock.recvfrom(64)
+            except socket.timeout:
+                continue
+            self.requests += 1
+            if self.kind == 'dead':
+                continue
+            time.sleep(self.delay_s / 2)  # On the way there
+            answer = bytearray(48)
+            answer[0] = 0x24  # Version 4, server
+            answer[1] = 0 if self.kind == 'kod' else 2
+            answer[24:32] = b'\x00' * 8 if self.kind == 'stranger' else data[40:48]
+            struct.pack_into('!IIII', answer, 32, *(self._stamp() * 2))
+            time.sleep(self.delay_s / 2)  # On the way back
+            self.sock.sendto(answer, client)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+
+
+def servers(*specs):
+    """Servers on 127.0.0.1, .2, ... sharing one port, from (offset_s, delay_s, kind) specs."""
+    started = []
+    port = 0
+    for i, spec in enumerate(specs):
+        server = Server('127.0.0.{}'.format(i + 1), port, *spec)
+        port = server.port
+        started.append(server)
+    return started, ['127.0.0.{}'.format(i + 1) for i in range(len(specs))], port
+
+
+def timed_query(specs, timeout_ms=sntp.TIMEOUT_MS):
+    started, hosts, port = servers(*specs)
+    try:
+        t0 = time.perf_counter()
+        sample = sntp.query(hosts, port, timeout_ms)
+        return sample, time.perf_counter() - t0, started
+    finally:
+        for server in started:
+            server.stop()
+
+
+def test_timestamps():
+    ok = True
+    for us in (820454400123456, 1262304000000001, 0):  # 2026, 2040 (NTP era 1), the epoch
+        ok = ok and abs(sntp.from_ntp(*sntp.to_ntp(us)) - us) <= 1
+    check('NTP timestamps round-trip to the microsecond, past 2036 too', ok)
+    packet = sntp.request(820454400123456, tag=7)
+    check('request is a version 4 client packet carrying its tag', len(packet) == 48 and packet[0] == 0x23
+          and packet[47] == 7)
+
+
+def test_fastest_wins():
+    sample, elapsed, started = timed_query([(5.0, 0.150, 'ok'), (2.5, 0.010, 'ok'), (0, 0, 'dead')])
+    check('every host asked once', [server.requests for server in started] == [1, 1, 1])
+    check('shortest round trip chosen', sample is not None and sample.host == '127.0.0.2')
+    check('offset measured to a few ms ({:+.4f}s)'.format(sample.offset_us / 1e6 - 2.5),
+          abs(sample.offset_us - 2500000) < 5000)
+    check('delay excludes time in the server ({} us)'.format(sample.delay_us), 5000 <= sample.delay_us < 40000)
+    check('returns soon after the first answer, not at the timeout ({:.3f}s)'.format(elapsed), elapsed < 0.120)
+    check('now_us carries the answer forward', abs(sample.now_us() - (time.time_ns() // 1000 + 2500000)) < 5000)
+
+
+def test_bad_answers():
+    sample, _, _ = timed_query([(9.0, 0, 'kod'), (9.0, 0, 'stranger'), (-1.0, 0.030, 'ok')])
+    check("kiss-o'-death and unmatched answers ignored", sample is not None and sample.host == '127.0.0.3'
+          and abs(sample.offset_us + 1000000) < 5000)
+
+
+def test_no_answer():
+    sample, elapsed, _ = timed_query([(0, 0, 'dead'), (0, 0, 'dead')], timeout_ms=300)
+    check('no answer gives None at the timeout ({:.3f}s)'.format(elapsed), sample is None and 0.28 < elapsed < 0.6)
+    check('duplicate hosts asked once', len(sntp.resolve(['127.0.0.1', '127.0.0.1', '127.0.0.2'])) == 2)
+
+
+if __name__ == '__main__':
+    test_timestamps()
+    test_fastest_wins()
+    test_bad_answers()
+    test_no_answer()
+    finish()
@@ -1,9 +1,48 @@
-import utime
+try:
+    import utime
+except ImportError:  # CPython host tools (sunset_table.py) only use the date-free helpers
+    import time as utime
+import struct
+from array import array
 
 # Start date for your data, as a utime tuple
 START_DATE_TUPLE = (2025, 1, 1, 0, 0, 0, 0, 0)
 SECONDS_IN_DAY = 86400
 
+CSV_FILENAME = 'sunset_data.csv'
+# Packed table built from the CSV by sunset_table.py on the host:
+# 10-byte header (magic, start y/m/d, count) then one uint16 per day.
+TABLE_FILENAME = 'sunset_data.bin'
+TABLE_MAGIC = b'SUN1'
+TABLE_HEADER_SIZE = 10
+TABLE_RECORD_SIZE = 2
+# Delta-encoded table, also built by sunset_table.py: 12-byte header (magic,
+# start y/m/d, count, keyframe interval, delta bits), an index of
+# (keyframe minutes, block byte offset) uint16 pairs, then the blocks. Each
+# block holds interval-1 signed deltas, MSB first; the most negative delta
+# code is an escape followed by the absolute 16-bit value.
+DELTA_TABLE_FILENAME = 'sunset_data.sdt'
+DELTA_MAGIC = b'SUND'
+DELTA_HEADER_SIZE = 12
+DELTA_INDEX_ENTRY_SIZE = 4
+
+# Days kept in RAM either side of the requested day by the shared provider.
+# None keeps the whole table (about 14 KB for 20 years).
+CACHE_WINDOW_DAYS = None
+
+# Where sunset comes from: 'table' (sunset_data.sdt / .bin / .csv only), 'solar'
+# (computed on the device, no table needed) or 'auto' (table, computed for
+# days outside it).
+SUNSET_MODE = 'auto'
+
+# Site for the computed sunset. These match the location sunset_data.csv was
+# generated for. SITE_UTC_OFFSET_MINUTES is its standard offset, used when no
+# time zone is given (host tools); main.py gives the provider its TimeZone,
+# whose offsets are used instead.
+SITE_LATITUDE = 38.32
+SITE_LONGITUDE = -122.94  # East positive
+SITE_UTC_OFFSET_MINUTES = -8 * 60
+
 def get_day_number(start_date_tuple):
     """Calculates the number of days since the start_date."""
     start_seconds = utime.mktime(start_date_tuple)
@@ -11,10 +50,193 @@ def get_day_number(start_date_tuple):
     seconds_in_day = 86400
     return (today_seconds - start_seconds) // seconds_in_day
 
-def get_sunset_minutes(day_number):
+def days_from_civil(year, month, day):
+    """Days since 1970-01-01 for a proleptic Gregorian date (integer only)."""
+    if month <= 2:
+        year -= 1
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def civil_from_days(days):
+    """Inverse of days_from_civil: return (year, month, day)."""
+    days += 719468
+    era = days // 146097
+    doe = days - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = mp + 3 if mp < 10 else mp - 9
+    year = yoe + era * 400 + (1 if month <= 2 else 0)
+    return year, month, day
+
+
+def weekday(year, month, day):
+    """Sakamoto's algorithm: return weekday 0=Sunday ... 6=Saturday."""
+    t = [0, 3, 2, 5, 0, 3, 5, 1, 4, 6, 2, 4]
+    y = year
+    if month < 3:
+        y -= 1
+    return (y + y // 4 - y // 100 + y // 400 + t[month - 1] + day) % 7
+
+
+def nth_weekday_of_month(year, month, weekday_target, n):
+    """Return the day number of the n-th weekday_target in the month.
+    weekday_target: 0=Sunday
+    """
+    for d in range(1, 8):
+        if weekday(year, month, d) == weekday_target:
+            return d + (n - 1) * 7
+    return None
+
+
+def is_dst_us(year, month, day, hour=0):
+    """Determine if US DST rules (current) are in effect for the given date/time.
+    Spring forward: 2 AM jumps to 3 AM (2:00-2:59 never happens)
+    Fall back: At 2 AM falls back to 1 AM (1:00-1:59 happens twice)
+    """
+    start_day = nth_weekday_of_month(year, 3, 0, 2)  # 2nd Sunday in March
+    end_day = nth_weekday_of_month(year, 11, 0, 1)   # 1st Sunday in November
+    
+    if month == 11 and day == end_day and hour == 1: #comparing base utc offset hour not dst adjusted hour
+            # At exactly 2 AM dst, fall back to 1 AM standard time
+            return False
+    
+    #this works for all other times including spring forward gap
+    now = year * 1000000 + month * 10000 + day * 100 + hour  #Year gets multiplied by 1,000,000 (6 decimal places)
+    start = year * 1000000 + 3 * 10000 + start_day * 100 + 2 #Month gets multiplied by 10,000 (4 decimal places)
+    end = year * 1000000 + 11 * 10000 + end_day * 100 + 2 #Day gets multiplied by 100 (2 decimal places)
+    #Hour stays as is. Now we can compare a number instead of multiple fields
+    return start <= now < end  
+
+
+def _read_table_header(f):
+    """Return (start_day_number, count) from a packed table header, or None if invalid.
+
+    start_day_number is the first record's day counted from START_DATE_TUPLE.
+    """
+    header = f.read(TABLE_HEADER_SIZE)
+    if len(header) != TABLE_HEADER_SIZE or header[0:4] != TABLE_MAGIC:
+        return None
+    year, month, day, count = struct.unpack('<HBBH', header[4:])
+    start = days_from_civil(year, month, day) - days_from_civil(*START_DATE_TUPLE[:3])
+    return start, count
+
+
+def get_sunset_minutes_bin(day_number):
+    """Retrieves sunset time from the packed table by seeking to one record.
+
+    Returns None if the day is outside the table. Raises OSError if the
+    table is missing and ValueError if it is not a sunset table.
+    """
+    with open(TABLE_FILENAME, 'rb') as f:
+        header = _read_table_header(f)
+        if header is None:
+            raise ValueError("Invalid sunset table header")
+        table_start, count = header
+        # The table may start later than START_DATE_TUPLE; shift the index to match.
+        index = day_number - table_start
+        if index < 0 or index >= count:
+            return None
+        f.seek(TABLE_HEADER_SIZE + index * TABLE_RECORD_SIZE)
+        record = f.read(TABLE_RECORD_SIZE)
+        if len(record) != TABLE_RECORD_SIZE:
+            return None
+        return record[0] | (record[1] << 8)
+
+
+def _read_delta_header(f):
+    """Return (start_day_number, count, interval, bits) from a delta table header."""
+    header = f.read(DELTA_HEADER_SIZE)
+    if len(header) != DELTA_HEADER_SIZE or header[0:4] != DELTA_MAGIC:
+        raise ValueError("Invalid delta sunset table header")
+    year, month, day, count, interval, bits = struct.unpack('<HBBHBB', header[4:])
+    start = days_from_civil(year, month, day) - days_from_civil(*START_DATE_TUPLE[:3])
+    return start, count, interval, bits
+
+
+def _decode_delta_block(buf, bits, value, n, out=None):
+    """Decode a block's first n values starting from its keyframe value.
+
+    Appends each value to out when given. Returns the n-th value.
+    """
+    escape = 1 << (bits - 1)  # Code of the most negative delta
+    mask = (1 << bits) - 1
+    acc = 0
+    nacc = 0
+    pos = 0
+    if out is not None:
+        out.append(value)
+    for _ in range(n - 1):
+        while nacc < bits:
+            acc = (acc << 8) | buf[pos]
+            pos += 1
+            nacc += 8
+        nacc -= bits
+        code = (acc >> nacc) & mask
+        if code == escape:
+            while nacc < 16:
+                acc = (acc << 8) | buf[pos]
+                pos += 1
+                nacc += 8
+            nacc -= 16
+            value = (acc >> nacc) & 0xFFFF
+        else:
+            value += code - (1 << bits) if code > escape else code
+        acc &= (1 << nacc) - 1
+        if out is not None:
+            out.append(value)
+    return value
+
+
+def _read_delta_blocks(f, count, interval, first_block, last_block):
+    """Return (keyframes, offsets, stream) for blocks first_block..last_block."""
+    blocks = (count + interval - 1) // interval
+    f.seek(DELTA_HEADER_SIZE + first_block * DELTA_INDEX_ENTRY_SIZE)
+    entries = last_block - first_block + 1
+    more = last_block + 1 < blocks  # Next block's offset marks where the stream ends
+    index = f.read((entries + (1 if more else 0)) * DELTA_INDEX_ENTRY_SIZE)
+    keyframes = []
+    offsets = []
+    for i in range(entries + (1 if more else 0)):
+        keyframe, offset = struct.unpack('<HH', index[i * 4:i * 4 + 4])
+        keyframes.append(keyframe)
+        offsets.append(offset)
+    f.seek(DELTA_HEADER_SIZE + blocks * DELTA_INDEX_ENTRY_SIZE + offsets[0])
+    if more:
+        stream = f.read(offsets[-1] - offsets[0])
+    else:
+        stream = f.read()
+    return keyframes[:entries], offsets[:entries], stream
+
+
+def get_sunset_minutes_delta(day_number):
+    """Retrieves sunset time from the delta table.
+
+    Seeks to the day's keyframe and decodes at most interval-1 deltas.
+    Returns None if the day is outside the table. Raises OSError if the
+    table is missing and ValueError if it is not a delta table.
+    """
+    with open(DELTA_TABLE_FILENAME, 'rb') as f:
+        table_start, count, interval, bits = _read_delta_header(f)
+        index = day_number - table_start
+        if index < 0 or index >= count:
+            return None
+        block, position = divmod(index, interval)
+        keyframes, offsets, stream = _read_delta_blocks(f, count, interval, block, block)
+        if position == 0:
+            return keyframes[0]
+        return _decode_delta_block(stream, bits, keyframes[0], position + 1)
+
+
+def get_sunset_minutes_csv(day_number):
     """Retrieves sunset time (minutes past midnight) from CSV."""
     try:
-        with open('sunset_data.csv', 'r') as csvfile:
+        with open(CSV_FILENAME, 'r') as csvfile:
             next(csvfile)  # Skip header
             for line in csvfile:
                 parts = line.strip().split(',')
@@ -25,6 +247,315 @@ def get_sunset_minutes(day_number):
         print(f"Error reading CSV: {e}")
         return None
 
+
+def get_sunset_minutes(day_number):
+    """Retrieves sunset time (minutes past midnight).
+
+    Uses the delta table or the packed table, whichever is present, and
+    falls back to the CSV otherwise.
+    """
+    for lookup in (get_sunset_minutes_delta, get_sunset_minutes_bin):
+        try:
+            return lookup(day_number)
+        except OSError:
+            pass  # Table not uploaded, try the next format
+        except Exception as e:
+            print(f"Error reading sunset table: {e}")
+    return get_sunset_minutes_csv(day_number)
+
+# --- Computed sunset (NOAA solar position, fixed point) ---
+# Angles are integer micro-degrees and sines/cosines are Q16 (65536 == 1.0),
+# so a day's sunset costs a few dozen integer operations and no floats.
+_FP_ONE = 65536
+_UDEG = 1_000_000
+# sin(d degrees) * 65536 for d = 0..90
+_SIN_TABLE = (
+    0, 1144, 2287, 3430, 4572, 5712, 6850, 7987, 9121, 10252,
+    11380, 12505, 13626, 14742, 15855, 16962, 18064, 19161, 20252, 21336,
+    22415, 23486, 24550, 25607, 26656, 27697, 28729, 29753, 30767, 31772,
+    32768, 33754, 34729, 35693, 36647, 37590, 38521, 39441, 40348, 41243,
+    42126, 42995, 43852, 44695, 45525, 46341, 47143, 47930, 48703, 49461,
+    50203, 50931, 51643, 52339, 53020, 53684, 54332, 54963, 55578, 56175,
+    56756, 57319, 57865, 58393, 58903, 59396, 59870, 60326, 60764, 61183,
+    61584, 61966, 62328, 62672, 62997, 63303, 63589, 63856, 64104, 64332,
+    64540, 64729, 64898, 65048, 65177, 65287, 65376, 65446, 65496, 65526,
+    65536,
+)
+_COS_ZENITH = -953  # cos(90.833 deg): sun's upper limb on the horizon with refraction
+_J2000_DAYS = days_from_civil(2000, 1, 1)
+_TICKS_PER_DAY = 10000  # Time unit for the solar model: 1/10000 day (8.64 s)
+_TICKS_PER_CENTURY = 36525 * _TICKS_PER_DAY
+
+
+def _sin_fp(a):
+    """sin of a micro-degree angle, Q16."""
+    a %= 360 * _UDEG
+    sign = 1
+    if a >= 180 * _UDEG:
+        a -= 180 * _UDEG
+        sign = -1
+    if a > 90 * _UDEG:
+        a = 180 * _UDEG - a
+    i, frac = divmod(a, _UDEG)
+    v = _SIN_TABLE[i]
+    if frac:
+        v += (_SIN_TABLE[i + 1] - v) * frac // _UDEG
+    return sign * v
+
+
+def _cos_fp(a):
+    return _sin_fp(a + 90 * _UDEG)
+
+
+def _acos_fp(x):
+    """acos of a Q16 value in [-1, 1], in micro-degrees."""
+    if x < 0:
+        return 180 * _UDEG - _acos_fp(-x)
+    # acos(x) = 90 - asin(x); find asin by bisecting the sine table
+    lo, hi = 0, 90
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if _SIN_TABLE[mid] <= x:
+            lo = mid
+        else:
+            hi = mid
+    s0, s1 = _SIN_TABLE[lo], _SIN_TABLE[hi]
+    asin = lo * _UDEG + (x - s0) * _UDEG // (s1 - s0)
+    return 90 * _UDEG - asin
+
+
+def _isqrt(n):
+    if n <= 0:
+        return 0
+    x = 1 << ((n.bit_length() + 1) // 2)
+    while True:
+        y = (x + n // x) // 2
+        if y >= x:
+            return x
+        x = y
+
+
+def solar_sunset_minutes(year, month, day, latitude=SITE_LATITUDE, longitude=SITE_LONGITUDE,
+                         utc_offset_minutes=SITE_UTC_OFFSET_MINUTES):
+    """Compute sunset for a date in local standard minutes past midnight.
+
+    Uses the NOAA solar position equations in fixed point. Returns None
+    when the sun does not set or rise that day (polar day or night).
+    """
+    lat = int(latitude * _UDEG)
+    lon = int(longitude * _UDEG)
+    # Evaluate the sun's position at local solar noon of the date
+    t = ((days_from_civil(year, month, day) - _J2000_DAYS) * _TICKS_PER_DAY
+         - lon * _TICKS_PER_DAY // (360 * _UDEG))
+
+    l0 = 280_466_460 + t * 98_564_736 // _UDEG           # Geometric mean longitude
+    m = 357_529_110 + t * 98_560_028 // _UDEG            # Mean anomaly
+    ecc = 16_708_634 - 42_037 * t // _TICKS_PER_CENTURY  # Orbit eccentricity * 1e9
+    sin_m = _sin_fp(m)
+    center = (sin_m * (1_914_602 - 4_817 * t // _TICKS_PER_CENTURY)
+              + _sin_fp(2 * m) * 19_993 + _sin_fp(3 * m) * 289) // _FP_ONE
+    omega = 125_040_000 - t * 529_538 // 100_000
+    apparent = l0 + center - 5_690 - 4_780 * _sin_fp(omega) // _FP_ONE
+    obliquity = 23_439_291 - 13_004 * t // _TICKS_PER_CENTURY + 2_560 * _cos_fp(omega) // _FP_ONE
+
+    # Declination, kept as its sine and cosine
+    sin_decl = _sin_fp(obliquity) * _sin_fp(apparent) // _FP_ONE
+    cos_decl = _isqrt(_FP_ONE * _FP_ONE - sin_decl * sin_decl)
+
+    # Equation of time in radians (Q16), then in 1/1000 minute
+    cos_obl = _cos_fp(obliquity)
+    y = (_FP_ONE - cos_obl) * _FP_ONE // (_FP_ONE + cos_obl)  # tan^2(obliquity / 2)
+    e = ecc * _FP_ONE // 1_000_000_000
+    sin_2l0 = _sin_fp(2 * l0)
+    eq = (y * sin_2l0
+          - 2 * e * sin_m
+          + 4 * e * y * sin_m // _FP_ONE * _cos_fp(2 * l0) // _FP_ONE
+          - y * y // _FP_ONE * _sin_fp(4 * l0) // 2
+          - 5 * e * e // _FP_ONE * _sin_fp(2 * m) // 4) // _FP_ONE
+    eq_time = eq * 229_183 // _FP_ONE
+
+    # Hour angle of sunset
+    num = _COS_ZENITH * _FP_ONE - _sin_fp(lat) * sin_decl
+    den = _cos_fp(lat) * cos_decl
+    if den == 0:
+        return None
+    cos_ha = num * _FP_ONE // den
+    if cos_ha > _FP_ONE or cos_ha < -_FP_ONE:
+        return None
+    hour_angle = _acos_fp(cos_ha)
+
+    # UTC minutes (1/1000 minute units): 4 minutes of time per degree
+    sunset = 720_000 - 4 * lon // 1000 - eq_time + 4 * hour_angle // 1000
+    return (sunset + 500) // 1000 + utc_offset_minutes
+
+
+def get_sunset_minutes_solar(day_number, dst_rule=None, utc_offset_minutes=SITE_UTC_OFFSET_MINUTES,
+                             dst_minutes=60):
+    """Compute sunset minutes past local midnight for a day number, without the table.
+
+    utc_offset_minutes is the standard offset. dst_rule(year, month, day,
+    hour) -> bool (e.g. is_dst_us) adds dst_minutes when daylight
+    saving is in effect at sunset; None means standard time.
+    """
+    year, month, day = civil_from_days(days_from_civil(*START_DATE_TUPLE[:3]) + day_number)
+    minutes = solar_sunset_minutes(year, month, day, utc_offset_minutes=utc_offset_minutes)
+    if minutes is None:
+        return None
+    if dst_rule is not None and dst_rule(year, month, day, minutes // 60):
+        minutes += dst_minutes
+    return minutes
+
+
+class SunsetProvider:
+    """Sunset table held in RAM as an array('H') of minutes past midnight.
+
+    The table (delta, packed or CSV, in that order of preference) is loaded
+    from disk the first time a day is requested, after which lookups are a
+    single index. With window set, only the days within window of the
+    requested day are kept; asking for a day outside that range reloads the
+    window around it. mode is one of the SUNSET_MODE values. Computed days
+    are in tz (a time_logic.TimeZone), or standard time at
+    SITE_UTC_OFFSET_MINUTES without one.
+    """
+
+    def __init__(self, window=None, mode=SUNSET_MODE, tz=None):
+        self.window = window
+        self.mode = mode
+        self.tz = tz
+        self._data = None
+        self._first_day = 0
+        self._count = None  # Days in the source table, once known
+
+    def _load_range_bin(self, lo, hi):
+        with open(TABLE_FILENAME, 'rb') as f:
+            header = _read_table_header(f)
+            if header is None:
+                raise ValueError("Invalid sunset table header")
+            offset, count = header
+            self._count = count + offset
+            lo = max(lo, offset)
+            hi = min(hi, offset + count)
+            if hi <= lo:
+                return lo, array('H')
+            f.seek(TABLE_HEADER_SIZE + (lo - offset) * TABLE_RECORD_SIZE)
+            return lo, array('H', f.read((hi - lo) * TABLE_RECORD_SIZE))
+
+    def _load_range_delta(self, lo, hi):
+        with open(DELTA_TABLE_FILENAME, 'rb') as f:
+            offset, count, interval, bits = _read_delta_header(f)
+            self._count = count + offset
+            lo = max(lo, offset)
+            hi = min(hi, offset + count)
+            if hi <= lo:
+                return lo, array('H')
+            first_block = (lo - offset) // interval
+            last_block = (hi - 1 - offset) // interval
+            keyframes, offsets, stream = _read_delta_blocks(f, count, interval, first_block, last_block)
+        data = array('H')
+        base = offsets[0]
+        for i in range(len(keyframes)):
+            block = first_block + i
+            n = min(interval, count - block * interval)
+            _decode_delta_block(memoryview(stream)[offsets[i] - base:], bits, keyframes[i], n, data)
+        skip = lo - offset - first_block * interval
+        if skip or len(data) > hi - lo:
+            data = data[skip:skip + hi - lo]
+        return lo, data
+
+    def _load_range_csv(self, lo, hi):
+        data = array('H')
+        first = None
+        last = -1
+        with open(CSV_FILENAME, 'r') as csvfile:
+            next(csvfile)  # Skip header
+            for line in csvfile:
+                parts = line.strip().split(',')
+                if len(parts) != 2:
+                    continue
+                day = last = int(parts[0])
+                if day < lo:
+                    continue
+                if day >= hi:
+                    break
+                if first is None:
+                    first = day
+                elif day != first + len(data):
+                    raise ValueError("Gap in sunset CSV at day {}".format(day))
+                data.append(int(parts[1]))
+            else:
+                self._count = last + 1  # Read to the end, so the table size is known
+        return (lo if first is None else first), data
+
+    def _load(self, day_number):
+        if self.window is None:
+            lo, hi = 0, 0x10000
+        else:
+            lo, hi = day_number - self.window, day_number + self.window + 1
+        self._data = None  # Release the old window before reading the new one
+        for load in (self._load_range_delta, self._load_range_bin):
+            try:
+                self._first_day, self._data = load(lo, hi)
+                return
+            except OSError:
+                pass  # Table not uploaded, try the next format
+        self._first_day, self._data = self._load_range_csv(lo, hi)
+
+    def get_sunset_minutes(self, day_number):
+        """Return sunset minutes past local midnight for day_number, or None.
+
+        Depending on mode, days missing from the table are computed instead.
+        """
+        minutes = None
+        if self.mode != 'solar':
+            minutes = self._get_table_minutes(day_number)
+        if minutes is None and self.mode != 'table':
+            minutes = self._get_solar_minutes(day_number)
+        return minutes
+
+    def _get_solar_minutes(self, day_number):
+        tz = self.tz
+        if tz is None:
+            return get_sunset_minutes_solar(day_number)
+        return get_sunset_minutes_solar(day_number, tz.dst_rule if tz.rules else None, tz.std_offset // 60,
+                                        (tz.dst_offset - tz.std_offset) // 60)
+
+    def _get_table_minutes(self, day_number):
+        if day_number < 0 or (self._count is not None and day_number >= self._count):
+            return None
+        data = self._data
+        index = day_number - self._first_day
+        if data is None or not 0 <= index < len(data):
+            if data is not None and self.window is None:
+                return None  # Whole table is loaded; the day is not in it
+            try:
+                self._load(day_number)
+            except Exception as e:
+                print(f"Error loading sunset data: {e}")
+                self._data = None
+                return None
+            data = self._data
+            index = day_number - self._first_day
+            if not 0 <= index < len(data):
+                return None
+        return data[index]
+
+    def memory_bytes(self):
+        """Bytes used by the resident table (0 until first use)."""
+        if self._data is None:
+            return 0
+        return len(self._data) * TABLE_RECORD_SIZE
+
+    def cached_days(self):
+        """Return (first_day, count) of the days currently in RAM."""
+        if self._data is None:
+            return None, 0
+        return self._first_day, len(self._data)
+
+
+# Shared provider used by main.py
+provider = SunsetProvider(CACHE_WINDOW_DAYS, SUNSET_MODE)
+
+
 def get_sunset_time_tuple(utc_offset_s):
     """
     Calculates and returns the sunset time for today as a utime tuple,
@@ -1,9 +1,11 @@
-"""Time-related helpers: NTP sync, DS3231 integration, and DST-aware localtime."""
-import ntptime
+"""Time-related helpers: NTP sync, DS3231 integration, time zones and DST-aware localtime."""
 import time
 from machine import Pin, I2C, RTC
 #import ds3231  # Assuming ds3231.py is in the same directory
-from ds3231_port import DS3231
+from ds3231_port import DS3231, Calibration
+import discipline
+import sntp
+from sunset import days_from_civil, is_dst_us, weekday
 
 # DS3231 and I2C setup (using the pins from main.py)
 I2C_SCL = 14
@@ -12,29 +14,93 @@ I2C_FREQ = 100000
 rtc_i2c = I2C(0, scl=Pin(I2C_SCL), sda=Pin(I2C_SDA), freq=I2C_FREQ)
 ds = DS3231(rtc_i2c)
 
+# Counts the times this module has set the RTC, so a Clock knows to re-read it
+rtc_generation = 0
+
+# The RTC's drift, measured at each NTP sync, and when the next sync is due
+drift = discipline.Discipline()
+
+# The DS3231's aging offset, calibrated from its lead over NTP time at each sync
+aging = Calibration(ds)
+DS3231_MAX_LEAD_US = 50000  # Rewrite the DS3231 once it has strayed this far from NTP time
+
+
+def _rtc_was_set():
+    global rtc_generation
+    rtc_generation += 1
+
 def sync_ntp_time(ntp_hosts, ntp_retry_delay=0):
     """Sync RTC with NTP and update the DS3231.
-    
+
+    Every host is asked at once and the answer with the shortest round
+    trip is used (see sntp.py). If none answers, they are all asked once
+    more after ntp_retry_delay seconds. The offset found goes to `drift`,
+    whose poll_s says when to sync next. The DS3231 is compared with NTP
+    time for its aging calibration (`aging`), and rewritten only once it
+    has strayed more than DS3231_MAX_LEAD_US.
     Returns True on success, False if all hosts fail.
     """
-    for host in ntp_hosts:
-        ntptime.host = host
+    for attempt in range(2 if ntp_retry_delay > 0 else 1):
+        if attempt:
+            time.sleep(ntp_retry_delay)
+        print("Asking NTP hosts:", ", ".join(ntp_hosts))
         try:
-            print("Trying NTP host:", host)
-            ntptime.settime()
-            # Get the new time from the internal RTC
-            (year, month, mday, hour, minute, second, weekday, yearday) = time.gmtime()
-            # Set the DS3231 with the new time
-            ds.set_time((year, month, mday, hour, minute, second, weekday, yearday))
-            print("Time synchronized via NTP and written to DS3231.")
+            sample = sntp.query(ntp_hosts)
+        except OSError as e:
+            print("NTP query failed:", e)
+            sample = None
+        if sample is not None:
+            print("NTP time from {} ({} ms round trip); RTC was {} ms off.".format(
+                sample.host, sample.delay_us // 1000, sample.offset_us // 1000))
+            lead = _ds3231_lead_us(sample)
+            generation = rtc_generation
+            set_time_us(sample, write_ds=lead is None or abs(lead) > DS3231_MAX_LEAD_US)
+            drift.synced(sample.offset_us, time.time(), generation, rtc_generation)
+            print("Time synchronized via NTP.")
+            if drift.drift_ppm is not None:
+                print("RTC drift {:.2f} ppm; next NTP sync in {} s.".format(drift.drift_ppm, drift.poll_s))
             return True
-        except Exception as e:
-            print("NTP sync failed for {}: {}".format(host, e))
-            if ntp_retry_delay > 0:
-                time.sleep(ntp_retry_delay)
+    drift.missed()
     print("All NTP hosts failed. Check your internet connection or DNS.")
     return False
 
+
+def _ds3231_lead_us(sample):
+    """The DS3231's lead over NTP time in microseconds (None if unreadable), given to `aging`.
+
+    Waits for the DS3231's next seconds transition, up to
+    ds3231_port.TRANSITION_TIMEOUT_MS; a stopped oscillator gives None.
+    """
+    try:
+        lead = ds.lead_us(sample.now_us)
+        calibrated = aging.observe(sample.now_us() // 1000000, lead)
+    except OSError as e:
+        print("DS3231 not compared with NTP:", e)
+        return None
+    print("DS3231 leads NTP time by {:.1f} ms.".format(lead / 1000))
+    if calibrated is not None:
+        print("DS3231 ran {:+.2f} ppm; aging offset now {}.".format(aging.history[-1][1], calibrated))
+    return lead
+
+
+def set_time_us(sample, write_ds=True):
+    """Sets the RTC to the microsecond from an sntp.Sample, then the DS3231 on the next second.
+
+    The DS3231 keeps whole seconds and restarts its count to the next one
+    when its seconds register is written, so it is written as a second
+    begins rather than up to a second late. write_ds=False leaves it
+    running, so its aging calibration sees long spans.
+    """
+    seconds, us = divmod(sample.now_us(), 1000000)
+    year, month, mday, hour, minute, second, weekday, _ = time.gmtime(seconds)
+    RTC().datetime((year, month, mday, weekday, hour, minute, second, us))
+    _rtc_was_set()
+    if write_ds:
+        time.sleep_us(1000000 - us)
+        ds.set_time(time.gmtime(seconds + 1))
+        aging.rebase(seconds + 1)
+
+
 def get_rtc_time_and_set_internal_rtc():
     #year,month,mday,hour,minute,second,weekday, yearday = 2025, 11, 2, 8, 59, 55 ,7, 305 #test end dst
     #ds.set_time((year, month, mday, hour, minute, second, weekday, yearday))
@@ -52,7 +118,8 @@ def get_rtc_time_and_set_internal_rtc():
         (year, month, mday, hour, minute, second, weekday, yearday) = ds_time
         rtc = RTC()
         # The weekday returned by DS3231 is 1-7, while MicroPython's RTC is 0-6
-        rtc.datetime((year, month, mday, weekday - 1, hour, minute, second, yearday))
+        rtc.datetime((year, month, mday, weekday - 1, hour, minute, second, 0))  # Subseconds are microseconds
+        _rtc_was_set()
         print(time.gmtime())
         print(time.localtime())
         print("Time read from DS3231 and set on internal RTC.")
@@ -75,56 +142,296 @@ def format_date_str(t):
     return f"{month:02d}/{mday:02d}/{year}"
 
 
-def weekday(year, month, day):
-    """Sakamoto's algorithm: return weekday 0=Sunday ... 6=Saturday."""
-    t = [0, 3, 2, 5, 0, 3, 5, 1, 4, 6, 2, 4]
-    y = year
-    if month < 3:
-        y -= 1
-    return (y + y // 4 - y // 100 + y // 400 + t[month - 1] + day) % 7
+# --- Time zones ---
+US_RULES = ",M3.2.0,M11.1.0"  # 2nd Sunday in March to 1st Sunday in November, 02:00
+_EPOCH_DAY = days_from_civil(*time.gmtime(0)[:3])
+_FOREVER = 1 << 62
+_YEARS_CACHED = 8
+
+
+def _tz_name(tz, pos):
+    """Zone abbreviation at pos: letters, or anything between < and >."""
+    if tz[pos:pos + 1] == '<':
+        end = tz.find('>', pos)
+        if end < 0:
+            raise ValueError("unterminated <name> in TZ " + tz)
+        return tz[pos + 1:end], end + 1
+    end = pos
+    while end < len(tz) and tz[end].isalpha():
+        end += 1
+    if end - pos < 3:
+        raise ValueError("bad zone name in TZ " + tz)
+    return tz[pos:end], end
+
+
+def _tz_time(tz, pos):
+    """[+-]hh[:mm[:ss]] at pos, in seconds."""
+    sign = 1
+    if tz[pos:pos + 1] in ('+', '-'):
+        sign = -1 if tz[pos] == '-' else 1
+        pos += 1
+    seconds = 0
+    for unit in (3600, 60, 1):
+        end = pos
+        while end < len(tz) and tz[end].isdigit():
+            end += 1
+        if end == pos:
+            raise ValueError("bad time in TZ " + tz)
+        seconds += int(tz[pos:end]) * unit
+        pos = end
+        if unit == 1 or tz[pos:pos + 1] != ':':
+            break
+        pos += 1
+    return sign * seconds, pos
+
+
+def _tz_rule(tz, pos):
+    """,Mm.w.d[/time], ,Jn[/time] or ,n[/time] at pos: ((kind, a, b, c), seconds), pos."""
+    if tz[pos:pos + 1] != ',':
+        raise ValueError("expected ,rule in TZ " + tz)
+    pos += 1
+    end = pos
+    while end < len(tz) and tz[end] not in ',/':
+        end += 1
+    field = tz[pos:end]
+    try:
+        if field[:1] == 'M':
+            m, w, d = (int(x) for x in field[1:].split('.'))
+            if not (1 <= m <= 12 and 1 <= w <= 5 and 0 <= d <= 6):
+                raise ValueError
+            rule = ('M', m, w, d)
+        elif field[:1] == 'J':
+            rule = ('J', int(field[1:]), 0, 0)
+            if not 1 <= rule[1] <= 365:
+                raise ValueError
+        else:
+            rule = ('N', int(field), 0, 0)
+            if not 0 <= rule[1] <= 365:
+                raise ValueError
+    except ValueError:
+        raise ValueError("bad rule {} in TZ {}".format(field, tz))
+    seconds = 7200
+    if tz[end:end + 1] == '/':
+        seconds, end = _tz_time(tz, end + 1)
+    return (rule, seconds), end
+
+
+def _rule_day(rule, year):
+    """Day number (days_from_civil) a transition rule falls on in a year."""
+    kind, a, b, c = rule
+    if kind == 'M':
+        first = days_from_civil(year, a, 1)
+        day = first + (c - (first + 4) % 7) % 7 + (b - 1) * 7  # 1970-01-01 was a Thursday
+        length = days_from_civil(year + a // 12, a % 12 + 1, 1) - first
+        while day - first >= length:  # Week 5 means the last one
+            day -= 7
+        return day
+    jan1 = days_from_civil(year, 1, 1)
+    if kind == 'J':  # 1-365, February 29 never counted
+        leap = year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+        return jan1 + a - 1 + (1 if leap and a >= 60 else 0)
+    return jan1 + a
+
+
+class TimeZone:
+    """Local time for a POSIX TZ string, e.g. "PST8PDT,M3.2.0,M11.1.0".
 
+    The string is the standard abbreviation and offset, then optionally the
+    DST abbreviation, its offset (default an hour ahead) and when DST starts
+    and ends: Mm.w.d (day d, 0=Sunday, of week w of month m; week 5 is the
+    last), Jn (day 1-365, never counting February 29) or n (day 0-365), each
+    with an optional /time of the local clock (default 02:00; may be
+    negative or past 24). Offsets in the string count west of UTC as POSIX
+    has it; std_offset and utcoffset() count east, like utc_offset in
+    main.py. A DST abbreviation without rules gets the US rules.
+    enable_dst=False keeps standard time all year.
 
-def nth_weekday_of_month(year, month, weekday_target, n):
-    """Return the day number of the n-th weekday_target in the month.
-    weekday_target: 0=Sunday
+    The string is parsed once. Each year's two transitions are computed on
+    first use and cached, and the span between transitions around the last
+    time converted is kept, so converting a time within it is two
+    comparisons.
     """
-    for d in range(1, 8):
-        if weekday(year, month, d) == weekday_target:
-            return d + (n - 1) * 7
-    return None
+    def __init__(self, tz, enable_dst=True):
+        self.tz = tz
+        self.std_name, pos = _tz_name(tz, 0)
+        offset, pos = _tz_time(tz, pos)
+        self.std_offset = -offset
+        self.dst_name = None
+        self.dst_offset = self.std_offset
+        self.rules = None  # ((rule, seconds), (rule, seconds)) for the DST start and end
+        if pos < len(tz):
+            self.dst_name, pos = _tz_name(tz, pos)
+            self.dst_offset = self.std_offset + 3600
+            if pos < len(tz) and tz[pos] != ',':
+                offset, pos = _tz_time(tz, pos)
+                self.dst_offset = -offset
+            rules = tz[pos:] or US_RULES
+            start, pos = _tz_rule(rules, 0)
+            end, pos = _tz_rule(rules, pos)
+            if pos != len(rules):
+                raise ValueError("trailing characters in TZ " + tz)
+            self.rules = (start, end)
+        if not enable_dst:
+            self.dst_name = None
+            self.dst_offset = self.std_offset
+            self.rules = None
+        self._years = {}  # year -> (DST start, DST end), epoch seconds UTC
+        self._lo = -_FOREVER  # The span [_lo, _hi) has offset _offset
+        self._hi = _FOREVER if self.rules is None else -_FOREVER
+        self._offset = self.std_offset
+
+    def transitions(self, year):
+        """(DST start, DST end) of a year as epoch seconds, or None without DST."""
+        if self.rules is None:
+            return None
+        cached = self._years.get(year)
+        if cached is None:
+            if len(self._years) >= _YEARS_CACHED:
+                self._years.clear()
+            (start, start_time), (end, end_time) = self.rules
+            # The start is given in standard time, the end in daylight time
+            cached = ((_rule_day(start, year) - _EPOCH_DAY) * 86400 + start_time - self.std_offset,
+                      (_rule_day(end, year) - _EPOCH_DAY) * 86400 + end_time - self.dst_offset)
+            self._years[year] = cached
+        return cached
+
+    def utcoffset(self, ts):
+        """Seconds east of UTC in effect at epoch second ts."""
+        if self._lo <= ts < self._hi:
+            return self._offset
+        # Transitions of the year either side too: a span can cross New Year
+        year = time.gmtime(ts + self.std_offset)[0]
+        points = []
+        for y in (year - 1, year, year + 1):
+            start, end = self.transitions(y)
+            points.append((start, self.dst_offset))
+            points.append((end, self.std_offset))
+        points.sort()
+        for i in range(len(points) - 1, -1, -1):
+            if points[i][0] <= ts:
+                self._lo, self._offset = points[i]
+                self._hi = points[i + 1][0] if i + 1 < len(points) else _FOREVER
+                return self._offset
+        self._lo, self._hi, self._offset = -_FOREVER, points[0][0], points[-1][1]
+        return self._offset
+
+    def next_transition(self, ts):
+        """Epoch second of the first offset change after ts (far in the future without DST)."""
+        if not self._lo <= ts < self._hi:
+            self.utcoffset(ts)
+        return self._hi
+
+    def isdst(self, ts):
+        return self.utcoffset(ts) != self.std_offset
+
+    def localtime(self, ts=None):
+        """localtime tuple of the zone's wall clock at ts (default now)."""
+        if ts is None:
+            ts = time.time()
+        return time.localtime(ts + self.utcoffset(ts))
+
+    def dst_rule(self, year, month, day, hour=0):
+        """Whether DST is in effect at a standard-time hour of a local date.
+
+        Same signature and meaning as is_dst_us, for schedule.day_events and
+        sunset.SunsetProvider, which add dst_offset - std_offset when it holds.
+        """
+        return self.isdst((days_from_civil(year, month, day) - _EPOCH_DAY) * 86400
+                          + hour * 3600 - self.std_offset)
+
+
+ANCHOR_MAX_MS = 86400000  # Re-read the RTC at least daily, well inside ticks_diff's range
 
+if hasattr(time, 'time_ns'):
+    def _time_ms():
+        return time.time_ns() // 1000000
+else:  # Older ports: whole seconds only
+    def _time_ms():
+        return time.time() * 1000
 
-def is_dst_us(year, month, day, hour=0):
-    """Determine if US DST rules (current) are in effect for the given date/time.
-    Spring forward: 2 AM jumps to 3 AM (2:00-2:59 never happens)
-    Fall back: At 2 AM falls back to 1 AM (1:00-1:59 happens twice)
+
+class Clock:
+    """The local time for one main-loop pass, shared by the scheduler and the display.
+
+    tick() takes the pass's reading. The RTC is read once as an anchor;
+    later ticks add the ticks_ms() elapsed since and step the hour, minute
+    and second from the local midnight found at the anchor, so a pass costs
+    no RTC read, localtime() or DST evaluation. The date and the zone's
+    offset are worked out again (and the anchor re-read) only when the
+    local day ends, the offset changes, a day of ticks has passed, or this
+    module has set the RTC (NTP, DS3231, manual time).
+
+    After tick(): now is the epoch second, ms the milliseconds into it,
+    local the localtime tuple and minutes the minutes past local midnight.
+    Give the scheduler clock.time so it sees the same second as the loop.
     """
-    start_day = nth_weekday_of_month(year, 3, 0, 2)  # 2nd Sunday in March
-    end_day = nth_weekday_of_month(year, 11, 0, 1)   # 1st Sunday in November
-    
-    if month == 11 and day == end_day and hour == 1: #comparing base utc offset hour not dst adjusted hour
-            # At exactly 2 AM dst, fall back to 1 AM standard time
-            return False
-    
-    #this works for all other times including spring forward gap
-    now = year * 1000000 + month * 10000 + day * 100 + hour  #Year gets multiplied by 1,000,000 (6 decimal places)
-    start = year * 1000000 + 3 * 10000 + start_day * 100 + 2 #Month gets multiplied by 10,000 (4 decimal places)
-    end = year * 1000000 + 11 * 10000 + end_day * 100 + 2 #Day gets multiplied by 100 (2 decimal places)
-    #Hour stays as is. Now we can compare a number instead of multiple fields
-    return start <= now < end  
+    def __init__(self, tz):
+        self.tz = tz
+        self.now = 0
+        self.ms = 0
+        self.local = None
+        self.minutes = 0
+        self._generation = -1  # rtc_generation at the anchor
+        self._anchor_ticks = 0
+        self._anchor_ms = 0
+        self._midnight = 0  # Epoch second the wall clock read 00:00:00 at the current offset
+        self._until = 0  # Next local midnight or offset change
+
+    def time(self):
+        return self.now
+
+    def tick(self):
+        elapsed = time.ticks_diff(time.ticks_ms(), self._anchor_ticks)
+        if elapsed < 0 or elapsed >= ANCHOR_MAX_MS or self._generation != rtc_generation:
+            return self._anchor()
+        now_ms = self._anchor_ms + elapsed
+        now = now_ms // 1000
+        self.ms = now_ms - now * 1000
+        if now != self.now:
+            if now >= self._until:
+                return self._anchor()
+            self.now = now
+            seconds = now - self._midnight
+            self.minutes = seconds // 60
+            t = self.local
+            self.local = (t[0], t[1], t[2], seconds // 3600, self.minutes % 60, seconds % 60, t[6], t[7])
+        return self
+
+    def _anchor(self):
+        self._generation = rtc_generation
+        self._anchor_ticks = time.ticks_ms()
+        self._anchor_ms = _time_ms()
+        now = self._anchor_ms // 1000
+        self.now = now
+        self.ms = self._anchor_ms - now * 1000
+        self.local = time.localtime(now + self.tz.utcoffset(now))
+        seconds = self.local[3] * 3600 + self.local[4] * 60 + self.local[5]
+        self.minutes = seconds // 60
+        self._midnight = now - seconds
+        self._until = min(self._midnight + 86400, self.tz.next_transition(now))
+        return self
+
+
+def us_time_zone(utc_offset_seconds):
+    """TimeZone with the current US DST rules at a standard offset (seconds east)."""
+    west = -utc_offset_seconds
+    sign = '-' if west < 0 else ''
+    west = abs(west)
+    return TimeZone("STD{}{}:{:02d}:{:02d}DST{}".format(
+        sign, west // 3600, west // 60 % 60, west % 60, US_RULES))
+
+
+_us_zones = {}
 
 
 def localtime_with_optional_dst(utc_offset_seconds, enable_dst=True):
-    """Return a localtime tuple adjusted for utc_offset_seconds and optional DST."""
-    ts = time.time()
-    base = time.localtime(ts + utc_offset_seconds)
+    """Return a localtime tuple adjusted for utc_offset_seconds and optional US DST."""
     if not enable_dst:
-        return base
-
-    y, m, d, hh = base[0], base[1], base[2], base[3]
-    if is_dst_us(y, m, d, hh):
-        return time.localtime(ts + utc_offset_seconds + 3600)
-    return base
+        return time.localtime(time.time() + utc_offset_seconds)
+    zone = _us_zones.get(utc_offset_seconds)
+    if zone is None:
+        zone = _us_zones[utc_offset_seconds] = us_time_zone(utc_offset_seconds)
+    return zone.localtime()
 
 
 def set_manual_time(year, month, day, hour, minute, second):
@@ -142,6 +449,7 @@ def set_manual_time(year, month, day, hour, minute, second):
         yearday = 0 # Not strictly needed for basic timekeeping
         
         ds.set_time((year, month, day, hour, minute, second, ds_weekday, yearday))
+        aging.reset()  # Not in step with NTP time
         
         rtc = RTC()
         # MicroPython RTC: 0=Monday, 6=Sunday. 
@@ -150,6 +458,7 @@ def set_manual_time(year, month, day, hour, minute, second):
         mp_weekday = (wd - 1) % 7
         
         rtc.datetime((year, month, day, mp_weekday, hour, minute, second, 0))
+        _rtc_was_set()
         print(f"Manual time set: {year}-{month}-{day} {hour}:{minute}:{second}")
         return True
     except Exception as e:
@@ -164,9 +473,13 @@ def get_current_minutes_past_midnight(utc_offset_s, enable_dst=True):
 
 __all__ = [
     "sync_ntp_time",
+    "set_time_us",
     "get_rtc_time_and_set_internal_rtc",
     "format_time_str",
     "format_date_str",
+    "TimeZone",
+    "Clock",
+    "us_time_zone",
     "localtime_with_optional_dst",
     "get_current_minutes_past_midnight",
     "set_manual_time",
@@ -0,0 +1,194 @@
+# time_logic_test
+# Time zone tests for time_logic.py. Runs under MicroPython on the controller (with the repo's
+# checks.py copied alongside), or under CPython on the mpshim stand-ins from the repo root:
+#   micropython time_logic_test.py      (or: python3 controller/time_logic_test.py)
+
+import sys
+
+try:
+    import machine  # noqa: F401
+except ImportError:
+    import os
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(here))
+    import mpshim
+    vclock = mpshim.VirtualClock(0)
+    mpshim.install(vclock)
+    with mpshim.controller_imports(here, ('time_logic', 'ds3231_port', 'sunset')):
+        import time_logic
+        import time
+else:
+    import time
+    import time_logic
+    vclock = None  # Real time on the device
+
+from checks import check, finish
+from sunset import civil_from_days, days_from_civil
+
+EPOCH_DAY = days_from_civil(*time.gmtime(0)[:3])
+HOUR = 3600
+
+
+def utc(year, month, day, hour=0, minute=0, second=0):
+    """Epoch second of a UTC date and time."""
+    return (days_from_civil(year, month, day) - EPOCH_DAY) * 86400 + hour * HOUR + minute * 60 + second
+
+
+# (TZ string, year, DST start and end in UTC, standard and DST offset in hours)
+ZONES = (
+    ("PST8PDT,M3.2.0,M11.1.0", 2026, utc(2026, 3, 8, 10), utc(2026, 11, 1, 9), -8, -7),
+    ("EST5EDT", 2026, utc(2026, 3, 8, 7), utc(2026, 11, 1, 6), -5, -4),  # US rules by default
+    ("GMT0BST,M3.5.0/1,M10.5.0", 2026, utc(2026, 3, 29, 1), utc(2026, 10, 25, 1), 0, 1),
+    ("CET-1CEST,M3.5.0,M10.5.0/3", 2026, utc(2026, 3, 29, 1), utc(2026, 10, 25, 1), 1, 2),
+    ("AEST-10AEDT,M10.1.0,M4.1.0/3", 2026, utc(2026, 10, 3, 16), utc(2026, 4, 4, 16), 10, 11),
+    ("NZST-12NZDT,M9.5.0,M4.1.0/3", 2026, utc(2026, 9, 26, 14), utc(2026, 4, 4, 14), 12, 13),
+    ("<-04>4<-03>,M9.1.6/24,M4.1.6/24", 2026, utc(2026, 9, 6, 4), utc(2026, 4, 5, 3), -4, -3),
+)
+
+
+def test_transitions():
+    for tz_string, year, start, end, std, dst in ZONES:
+        tz = time_logic.TimeZone(tz_string)
+        check('{} {} transitions'.format(tz_string, year), tz.transitions(year) == (start, end))
+        edges_ok = True
+        for ts, before, after in ((start, std, dst), (end, dst, std)):
+            edges_ok = edges_ok and tz.utcoffset(ts - 1) == before * HOUR and tz.utcoffset(ts) == after * HOUR
+        check('{} offsets either side of each transition'.format(tz_string), edges_ok)
+
+
+def test_wall_clock():
+    tz = time_logic.TimeZone("PST8PDT,M3.2.0,M11.1.0")
+    start, end = tz.transitions(2026)
+    check('spring forward skips 02:00-02:59',
+          tz.localtime(start - 1)[3:6] == (1, 59, 59) and tz.localtime(start)[3:6] == (3, 0, 0))
+    check('fall back repeats 01:00-01:59',
+          tz.localtime(end - 1)[3:6] == (1, 59, 59) and tz.localtime(end)[3:6] == (1, 0, 0)
+          and tz.localtime(end - HOUR)[3:6] == (1, 0, 0))
+    check('isdst', tz.isdst(start) and not tz.isdst(end) and not tz.isdst(start - 1))
+    tz = time_logic.TimeZone("AEST-10AEDT,M10.1.0,M4.1.0/3")
+    check('southern summer spans New Year', tz.isdst(utc(2026, 12, 31, 23)) and tz.isdst(utc(2027, 1, 1, 1))
+          and tz.localtime(utc(2026, 12, 31, 13))[:4] == (2027, 1, 1, 0))
+
+
+def test_fixed_offsets():
+    for tz_string, offset in (("MST7", -7 * HOUR), ("UTC0", 0), ("<+0530>-5:30", 19800), ("IST-5:30", 19800),
+                              ("PST8PDT,M3.2.0,M11.1.0", -8 * HOUR)):
+        tz = time_logic.TimeZone(tz_string, enable_dst=not tz_string.startswith('PST'))
+        check('{} fixed at {}s'.format(tz_string, offset), tz.transitions(2026) is None and all(
+            tz.utcoffset(utc(2026, month, 15)) == offset for month in range(1, 13)))
+    tz = time_logic.TimeZone("<+0530>-5:30")
+    check('quoted and minute offsets parsed', tz.std_name == '+0530'
+          and tz.localtime(utc(2026, 1, 1))[3:5] == (5, 30))
+
+
+def test_julian_rules():
+    tz = time_logic.TimeZone("AAA3BBB,J60/2,J300/2")  # J60 is March 1 in every year
+    check('Jn skips February 29', tz.transitions(2028)[0] == utc(2028, 3, 1, 5)
+          and tz.transitions(2027)[0] == utc(2027, 3, 1, 5))
+    tz = time_logic.TimeZone("AAA3BBB,59,300")  # Day 59 counts February 29
+    check('n counts February 29', tz.transitions(2028)[0] == utc(2028, 2, 29, 5)
+          and tz.transitions(2027)[0] == utc(2027, 3, 1, 5))
+
+
+def test_bad_strings():
+    bad = 0
+    for tz_string in ("", "PST", "P8", "PST8PDT,M3.2.0", "PST8PDT,M13.2.0,M11.1.0", "PST8PDT,M3.2.0,M11.1.0x",
+                      "<PST8"):
+        try:
+            time_logic.TimeZone(tz_string)
+        except ValueError:
+            bad += 1
+    check('malformed TZ strings raise ValueError', bad == 7)
+
+
+def test_us_compatibility():
+    # The zone engine agrees with is_dst_us, which evaluates the standard-time hour
+    tz = time_logic.us_time_zone(-8 * HOUR)
+    same = True
+    for year in range(2025, 2031):
+        for day in range(days_from_civil(year, 1, 1), days_from_civil(year + 1, 1, 1)):
+            y, m, d = civil_from_days(day)
+            for hour in range(24):
+                if tz.dst_rule(y, m, d, hour) != time_logic.is_dst_us(y, m, d, hour):
+                    same = False
+    check('dst_rule matches is_dst_us for every hour of 2025-2030', same)
+
+    clock_ok = True
+    for ts in range(utc(2026, 1, 1), utc(2027, 1, 1), 1800):
+        base = time.localtime(ts - 8 * HOUR)
+        expected = time.localtime(ts - 7 * HOUR) if time_logic.is_dst_us(*base[:4]) else base
+        clock_ok = clock_ok and tz.localtime(ts) == expected
+    check('localtime matches the is_dst_us computation through 2026', clock_ok)
+
+
+def test_cache():
+    tz = time_logic.TimeZone("CET-1CEST,M3.5.0,M10.5.0/3")
+    for year in range(2025, 2055):
+        tz.utcoffset(utc(year, 7, 1))
+    check('transition cache stays bounded', len(tz._years) <= time_logic._YEARS_CACHED)
+    ts = utc(2026, 7, 1)
+    tz.utcoffset(ts)
+    check('span around the last time converted is kept', tz._lo <= ts + 86400 < tz._hi
+          and tz._lo == utc(2026, 3, 29, 1) and tz._hi == utc(2026, 10, 25, 1))
+    check('next transition', tz.next_transition(ts) == utc(2026, 10, 25, 1)
+          and tz.next_transition(utc(2026, 10, 25, 1)) == utc(2027, 3, 28, 1)
+          and time_logic.TimeZone("UTC0").next_transition(ts) > utc(2100, 1, 1))
+
+
+def _clock_agrees(clock, tz):
+    clock.tick()
+    now_ms = time_logic._time_ms()
+    t = tz.localtime(now_ms // 1000)  # A separate TimeZone from the clock's
+    return (clock.now == now_ms // 1000 and clock.ms == now_ms % 1000 and clock.local == t
+            and clock.minutes == t[3] * 60 + t[4])
+
+
+def test_clock():
+    tz = time_logic.TimeZone("PST8PDT,M3.2.0,M11.1.0")
+    reference = time_logic.TimeZone("PST8PDT,M3.2.0,M11.1.0")
+    clock = time_logic.Clock(tz)
+    if vclock is None:
+        agrees = True
+        for _ in range(30):
+            agrees = agrees and _clock_agrees(clock, reference)
+            time.sleep_ms(100)
+        check('clock snapshot agrees with the RTC over 3 s', agrees)
+        return
+
+    anchors = [0]
+    utcoffset = tz.utcoffset
+
+    def counting(ts):
+        anchors[0] += 1
+        return utcoffset(ts)
+    tz.utcoffset = counting
+    # Both DST changes and New Year, in 250 ms steps for five hours from just before local midnight
+    for day in ((2026, 3, 8), (2026, 11, 1), (2027, 1, 1)):
+        vclock.true = float(utc(*day) + 6 * HOUR)
+        vclock.offset = 0.0
+        time_logic._rtc_was_set()  # As NTP would after the jump
+        anchors[0] = 0
+        agrees = True
+        for _ in range(5 * 4 * 3600):
+            agrees = agrees and _clock_agrees(clock, reference)
+            vclock.advance(0.25)
+        check('clock snapshot matches localtime every 250 ms around {}-{:02d}-{:02d}'.format(*day), agrees)
+        # The first tick, local midnight, and the offset change (not at New Year)
+        check('date worked out only at the changes ({} times)'.format(anchors[0]), anchors[0] <= 3)
+
+    time_logic.set_manual_time(2026, 7, 4, 12, 0, 0)
+    clock.tick()
+    check('clock follows the RTC when time_logic sets it', clock.now == utc(2026, 7, 4, 12) == time.time())
+    tz.utcoffset = utcoffset
+
+
+if __name__ == '__main__':
+    test_transitions()
+    test_wall_clock()
+    test_fixed_offsets()
+    test_julian_rules()
+    test_bad_strings()
+    test_us_compatibility()
+    test_cache()
+    test_clock()
+    finish()
@@ -0,0 +1,213 @@
+"""Times the controller's hot paths on CPython, against the mpshim stand-ins.
+
+Each case calls a controller function over a spread of inputs (a year of
+days or hours, blocks across the card) for at least MIN_ROUND_S a round,
+and reports the best of a few rounds in microseconds per call. The DS3231 and the SD card are the
+mpshim fakes behind the real drivers, so those cases time the driver's own
+work plus a little bus emulation; the OLED tick is main.py's display
+block, where the stand-in display draws nothing. The numbers are only
+comparable on the same host: save them with --json and check a later run
+with --compare to catch regressions, not to predict ESP32 timings.
+
+Usage:
+    python3 controller_bench.py [--only NAME] [--repeat 5] [--json bench.json]
+                                [--compare baseline.json] [--threshold 1.25]
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+import mpshim
+import schedule_compiler
+from controller_sim import CONTROLLER_DIR
+from mpshim import machine, ssd1306
+from mpshim.devices import FakeSDCard
+
+START = datetime.date(2026, 1, 1)
+UTC_OFFSET = -8 * 3600  # main.py's utc_offset
+SD_SPI_ID = 1
+SD_CS_PIN = 5
+MIN_ROUND_S = 0.05
+THRESHOLD = 1.25  # Slowdown reported as a regression by --compare
+
+
+@contextlib.contextmanager
+def controller():
+    """The controller modules, imported afresh on the stand-ins at START."""
+    clock = mpshim.VirtualClock(schedule_compiler.wall_to_epoch(START, 0))
+    mpshim.install(clock)
+    machine.record_i2c = False  # Keep the log from growing over a million reads
+    machine.spi_devices[SD_SPI_ID] = FakeSDCard()
+    cwd = os.getcwd()
+    os.chdir(CONTROLLER_DIR)  # Sunset tables are opened by bare name
+    try:
+        with mpshim.controller_imports(CONTROLLER_DIR, mpshim.CONTROLLER_MODULES):
+            import config, sdcard, sunset, time_logic
+        yield clock, {'config': config, 'sdcard': sdcard, 'sunset': sunset, 'time_logic': time_logic}
+    finally:
+        os.chdir(cwd)
+        machine.record_i2c = True
+
+
+def oled_tick(oled, uart, config, time_logic, t, display_timer=0):
+    """The display block of main.py's loop."""
+    time_str = time_logic.format_time_str(t)
+    date_str = time_logic.format_date_str(t)
+    oled.fill(0)
+    if not (uart.any() and display_timer == 0):
+        oled.text(config.get_system_msg(), 0, 0)
+    oled.size = 4
+    oled.text(time_str, 0, 20)
+    oled.size = 1
+    oled.text(date_str, 0, 50)
+    oled.show()
+
+
+def cases(clock, modules):
+    """{name: (function of one input, inputs)} for every benchmark."""
+    config, sdcard, sunset, time_logic = (modules[name] for name in ('config', 'sdcard', 'sunset', 'time_logic'))
+    start = clock.true
+    year_days = list(range(0, 365))
+    year_hours = []
+    for day in year_days:
+        d = START + datetime.timedelta(days=day)
+        year_hours.extend((d.year, d.month, d.day, hour) for hour in range(0, 24, 6))
+    year_times = [start + day * 86400 + 3600 * (day % 24) for day in year_days]
+
+    def localtime_at(ts):
+        clock.true = ts
+        return time_logic.localtime_with_optional_dst(UTC_OFFSET, True)
+
+    card = sdcard.SDCard(machine.SPI(SD_SPI_ID), machine.Pin(SD_CS_PIN))
+    block = bytearray(512)
+    blocks = bytearray(8 * 512)
+    sd_blocks = list(range(0, card.sectors - 8, card.sectors // 64))
+
+    oled = ssd1306.SSD1306_I2C(128, 64, machine.I2C(0))
+    uart = machine.UART(2)
+    config.set_system_msg("Sunset: 17:02")
+    now = time_logic.localtime_with_optional_dst(UTC_OFFSET, True)
+
+    def separate_calls(_):
+        # main.py's loop before the Clock: local time, minutes past midnight and the epoch second
+        clock.advance(1)
+        return (time_logic.localtime_with_optional_dst(UTC_OFFSET, True),
+                time_logic.get_current_minutes_past_midnight(UTC_OFFSET, True), time_logic.time.time())
+
+    snapshot = time_logic.Clock(time_logic.us_time_zone(UTC_OFFSET))
+
+    def clock_tick(_):
+        clock.advance(1)
+        return snapshot.tick()
+
+    resident = sunset.SunsetProvider()
+    resident.get_sunset_minutes(0)  # Load outside the timed loop
+    return {
+        'sunset.get_sunset_minutes': (sunset.get_sunset_minutes, year_days),
+        'sunset.provider.get_sunset_minutes': (resident.get_sunset_minutes, year_days),
+        'time_logic.is_dst_us': (lambda args: time_logic.is_dst_us(*args), year_hours),
+        'time_logic.localtime_with_optional_dst': (localtime_at, year_times),
+        'DS3231.get_time': (lambda _: time_logic.ds.get_time(), range(100)),
+        'SDCard.readblocks': (lambda n: card.readblocks(n, block), sd_blocks),
+        'SDCard.readblocks x8': (lambda n: card.readblocks(n, blocks), sd_blocks),
+        'pass time, separate calls': (separate_calls, range(100)),
+        'pass time, Clock.tick': (clock_tick, range(100)),
+        'oled tick': (lambda t: oled_tick(oled, uart, config, time_logic, t), [now]),
+    }
+
+
+def _time_per_call(fn, inputs, repeat, min_round_s=MIN_ROUND_S):
+    """Best-of-repeat seconds per call of fn(x) over inputs.
+
+    Each round passes over the inputs as many times as fit in min_round_s,
+    so short cases are not lost in timer noise.
+    """
+    best = None
+    for _ in range(repeat):
+        calls = 0
+        t0 = time.perf_counter()
+        while True:
+            for x in inputs:
+                fn(x)
+            calls += len(inputs)
+            elapsed = time.perf_counter() - t0
+            if elapsed >= min_round_s:
+                break
+        best = elapsed / calls if best is None else min(best, elapsed / calls)
+    return best
+
+
+def run(only=None, repeat=5, min_round_s=MIN_ROUND_S):
+    """{case name: microseconds per call}."""
+    results = {}
+    with contextlib.redirect_stdout(sys.stderr):  # The controller prints on some paths
+        with controller() as (clock, modules):
+            for name, (fn, inputs) in cases(clock, modules).items():
+                if only is None or name in only:
+                    results[name] = 1e6 * _time_per_call(fn, inputs, repeat, min_round_s)
+    return results
+
+
+def save(path, results):
+    record = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_implementation() + ' ' + platform.python_version(),
+        'machine': platform.machine(),
+        'results_us': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(record, f, indent=1, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)['results_us']
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """[(name, baseline us, now us, ratio)] for every case, and the names slower than threshold."""
+    rows = []
+    regressions = []
+    for name in results:
+        if name in baseline:
+            ratio = results[name] / baseline[name] if baseline[name] else float('inf')
+            rows.append((name, baseline[name], results[name], ratio))
+            if ratio > threshold:
+                regressions.append(name)
+    return rows, regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Time the controller's hot paths against the MicroPython stand-ins.")
+    parser.add_argument('--only', action='append', help="run only this case (repeatable)")
+    parser.add_argument('--repeat', type=int, default=5, help="rounds per case, best one counts")
+    parser.add_argument('--json', help="save the results to this file")
+    parser.add_argument('--compare', help="compare with results saved by --json")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help="slowdown ratio reported as a regression (default %(default)s)")
+    args = parser.parse_args(argv[1:])
+
+    results = run(args.only, args.repeat)
+    width = max(len(name) for name in results)
+    for name, us in results.items():
+        print("{:<{}} {:10.2f} us".format(name, width, us))
+    if args.json:
+        save(args.json, results)
+        print("Saved to", args.json)
+    if args.compare:
+        rows, regressions = compare(results, load(args.compare), args.threshold)
+        print("Against {}:".format(args.compare))
+        for name, before, now, ratio in rows:
+            print("  {:<{}} {:10.2f} -> {:10.2f} us  x{:.2f}{}".format(
+                name, width, before, now, ratio, '  REGRESSION' if name in regressions else ''))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
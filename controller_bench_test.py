@@ -0,0 +1,86 @@
+# controller_bench_test
+# Checks the mpshim bus fakes behind the real controller drivers, and the benchmark's JSON round trip:
+#   python3 controller_bench_test.py
+
+import os
+import tempfile
+
+import controller_bench
+import mpshim
+from checks import check, finish
+from controller_sim import CONTROLLER_DIR
+from mpshim import machine, utime
+from mpshim.devices import FakeDS3231, FakeSDCard
+
+
+def test_sd_card():
+    mpshim.install(mpshim.VirtualClock(0))
+    card = FakeSDCard(4096)
+    for block in range(card.blocks):
+        card.image[block * 512:block * 512 + 4] = block.to_bytes(4, 'big')
+    machine.spi_devices[1] = card
+    with mpshim.controller_imports(CONTROLLER_DIR, ('sdcard',)):
+        import sdcard
+    sd = sdcard.SDCard(machine.SPI(1), machine.Pin(5))
+    check('card initialises as SDHC with its size from the CSD', sd.sectors == 4096 and sd.cdv == 1)
+
+    buf = bytearray(512)
+    sd.readblocks(4000, buf)
+    check('single block read', buf[:4] == (4000).to_bytes(4, 'big') and card.reads == 1)
+    buf = bytearray(4 * 512)
+    sd.readblocks(10, buf)
+    check('multiple block read stops at CMD12',
+          [int.from_bytes(buf[i * 512:i * 512 + 4], 'big') for i in range(4)] == [10, 11, 12, 13]
+          and card.reads == 5)
+
+    sd.writeblocks(20, bytearray(b'\x11' * 512 + b'\x22' * 512))
+    back = bytearray(1024)
+    sd.readblocks(20, back)
+    check('written blocks read back', back == bytearray(b'\x11' * 512 + b'\x22' * 512) and card.writes == 2)
+
+    try:
+        sd.readblocks(card.blocks, bytearray(512))
+        check('read past the end fails with EIO', False)
+    except OSError as e:
+        check('read past the end fails with EIO', e.args[0] == 5)
+
+    machine.spi_devices.clear()
+    check('empty bus reads 0xFF', machine.SPI(1).read(3) == b'\xff\xff\xff')
+
+
+def test_i2c_recording():
+    mpshim.install(mpshim.VirtualClock(820000000))
+    with mpshim.controller_imports(CONTROLLER_DIR, ('ds3231_port',)):
+        import ds3231_port
+    ds = ds3231_port.DS3231(machine.I2C(0))
+    del machine.i2c_log[:]
+    t = ds.get_time()
+    check('DS3231 read logged', machine.i2c_log == [('read', FakeDS3231.ADDRESS, 0, bytes(ds.timebuf))]
+          and t[:6] == utime.gmtime()[:6])
+    ds.set_time((2026, 1, 2, 3, 4, 5, 5, 0))
+    check('DS3231 writes logged', [entry[0] for entry in machine.i2c_log[1:]] == ['write'] * 7
+          and ds.get_time()[:6] == (2026, 1, 2, 3, 4, 5))
+    machine.record_i2c = False
+    ds.get_time()
+    machine.record_i2c = True
+    check('recording can be turned off', len(machine.i2c_log) == 9)
+
+
+def test_benchmark():
+    results = controller_bench.run(repeat=1, min_round_s=0.001)
+    check('every case timed', len(results) == 10 and all(us > 0 for us in results.values()))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.json')
+        controller_bench.save(path, results)
+        saved = controller_bench.load(path)
+    check('results round-trip through JSON', saved == results)
+    slower = dict(results, **{'oled tick': results['oled tick'] * 2})
+    rows, regressions = controller_bench.compare(slower, saved)
+    check('compare flags a slowdown only where there is one', regressions == ['oled tick'] and len(rows) == 10)
+
+
+if __name__ == '__main__':
+    test_sd_card()
+    test_i2c_recording()
+    test_benchmark()
+    finish()
@@ -0,0 +1,265 @@
+"""Runs the controller's main loop (controller/main.py) on CPython in simulated time.
+
+The controller modules are imported against the mpshim stand-ins for
+machine, utime, socket, select, network and ssd1306, all driven by one
+virtual clock, so a year of the real main loop -- WiFi and NTP at boot, the
+midnight reset, DST changes, the deadline heap and the UART writes --
+runs in seconds. Every byte written to the MP3 player's UART is logged
+with the time it was really sent, which the RTC can be wrong about. Each
+of main.py's NTP hosts answers from the reference time after its entry in
+NTP_RTT_S.
+
+To get through a year quickly the main loop's one-second sleeps are
+stretched to the next moment anything can happen: an event deadline, a
+whole hour (local midnight and the DST changes fall on one, as main.py's
+zone is whole hours), the next NTP sync or WiFi retry, queued UART input, or
+at most MAX_SKIP_S. --exact runs every second instead.
+
+The UART log is compared with a golden schedule compiled independently by
+schedule_compiler.compile_plan(): every event must be sent once, with the
+right command, at its exact second. --no-plan hides controller/schedule.bin
+so the controller computes each day's times itself.
+
+Usage:
+    python3 controller_sim.py run [--start 2026-01-01] [--days 365] [--no-plan] [--exact] [--log uart.log]
+    python3 controller_sim.py benchmark [--days 365]
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import os
+import sys
+import tempfile
+import time
+
+import mpshim
+import schedule_compiler
+import sunset_table
+from mpshim import machine, network, usocket
+from mpshim.devices import FakeDS3231
+
+CONTROLLER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'controller')
+EPOCH = schedule_compiler.EPOCH  # MicroPython's 2000 epoch
+MAX_SKIP_S = 600
+# The loop's Clock counts whole ticks_ms() from a millisecond reading of the
+# RTC, so its second can begin this much before the RTC's
+CLOCK_RESOLUTION_S = 0.002
+SSID = 'colors-sim'
+PASSWORD = 'simulated'
+NTP_RTT_S = (0.045, 0.018, 0.012, 0.080)  # Round trip to each NTP host in turn
+
+
+def format_epoch(ts):
+    return (EPOCH + datetime.timedelta(seconds=ts)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class RecordingBroadcaster:
+    """Stands in for main.broadcaster, so a simulation sends nothing on the network."""
+    def __init__(self, clock):
+        self.clock = clock
+        self.sent = []  # (RTC time, kind, name)
+
+    def send(self, kind, name, when=None):
+        self.sent.append((self.clock.now(), kind, name))
+        return True
+
+
+class Simulation:
+    """One run of main.main() from boot at local midnight of `start` for `days` days."""
+    def __init__(self, start, days, use_plan=True, auto_sunset=True, exact=False, drift_ppm=0.0,
+                 online=True, ds3231_ppm=0.0, plan_path=None):
+        self.start_date = start
+        self.days = days
+        self.use_plan = use_plan
+        self.plan_path = plan_path  # In place of controller/schedule.bin
+        self.auto_sunset = auto_sunset
+        self.exact = exact
+        self.online = online  # Whether the access point is reachable
+        self.ds3231_ppm = ds3231_ppm  # DS3231 crystal error with its aging offset at 0
+        self.start = schedule_compiler.wall_to_epoch(start, 0)
+        self.end = schedule_compiler.wall_to_epoch(start + datetime.timedelta(days=days), 0)
+        self.clock = mpshim.VirtualClock(self.start, self.end, drift_ppm)
+        self.uart_log = []  # (reference time, bytes) written to the MP3 player
+        self.broadcasts = []
+        self.drift = None  # time_logic's Discipline at the end
+        self.aging = None  # time_logic's DS3231 Calibration at the end
+        self.output = ''  # What the controller printed
+        self.elapsed = 0.0
+
+    def run(self):
+        clock = self.clock
+        mpshim.install(clock)
+        network.access_points[SSID] = PASSWORD
+        network.up = self.online
+        machine.i2c_devices[FakeDS3231.ADDRESS].drift_ppm = self.ds3231_ppm
+        output = io.StringIO()
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            profiles = os.path.join(tmp, 'wifi.dat')
+            with open(profiles, 'w') as f:
+                f.write('{};{}\n'.format(SSID, PASSWORD))
+            os.chdir(CONTROLLER_DIR)  # The controller opens its data files by bare name
+            try:
+                with contextlib.redirect_stdout(output):
+                    with mpshim.controller_imports(CONTROLLER_DIR):
+                        import main
+                    self._prepare(main, profiles, tmp)
+                    t0 = time.perf_counter()
+                    try:
+                        main.main()
+                    except mpshim.SimulationEnd:
+                        pass
+                    self.elapsed = time.perf_counter() - t0
+            finally:
+                os.chdir(cwd)
+        self.output = output.getvalue()
+        self.uart_log = machine.uarts[2].written
+        self.broadcasts = main.broadcaster.sent
+        self.drift = sys.modules['time_logic'].drift
+        self.aging = sys.modules['time_logic'].aging
+        return self
+
+    def _prepare(self, main, profiles, tmp):
+        sys.modules['wifimgr'].NETWORK_PROFILES = profiles
+        sys.modules['time_logic'].drift.filename = os.path.join(tmp, 'drift.dat')
+        sys.modules['time_logic'].aging.filename = os.path.join(tmp, 'aging.dat')
+        for i, host in enumerate(main.ntp_hosts):
+            usocket.ntp_servers[host] = ('10.0.123.{}'.format(i + 1), NTP_RTT_S[i % len(NTP_RTT_S)])
+        if not self.use_plan:
+            sys.modules['schedule'].PLAN_FILENAME = os.path.join(tmp, 'no_schedule.bin')
+        elif self.plan_path is not None:
+            sys.modules['schedule'].PLAN_FILENAME = self.plan_path
+        main.broadcaster = RecordingBroadcaster(self.clock)
+        if self.auto_sunset:
+            machine.uarts[2].feed(self.start, 'Auto_Sunset_ON\n')  # The player's switch is on
+        if not self.exact:
+            main.idle_hook = self._skip
+
+    def _skip(self, seconds, deadline, ntp_due, wifi_due):
+        """main.idle_hook: stretches a main-loop sleep to the next moment anything can happen.
+
+        main.py passes its own timers: the next event deadline, and when the
+        next NTP sync and the WiFi retry fall due.
+        """
+        if seconds > 1:
+            return seconds
+        rtc = self.clock.now()
+        wake = [MAX_SKIP_S, 3600 - rtc % 3600]
+        # main.py acts once time.time() - last > interval; a timer already past
+        # is the one not in use (NTP while offline, the WiFi retry while online)
+        wake.append(ntp_due + 1 - rtc)
+        wake.append(wifi_due + 1 - rtc)
+        arrival = machine.uarts[2].next_input()
+        if arrival is not None:
+            wake.append(arrival - self.clock.true)
+        wake = min(w for w in wake if w > 0)
+        if deadline is not None:
+            wake = min(wake, deadline - rtc)
+        return max(seconds, wake)
+
+    def uart_lines(self):
+        """The UART log as text, one write per line."""
+        return ['{:.3f} {} {!r}'.format(ts, format_epoch(ts), data) for ts, data in self.uart_log]
+
+
+def golden_schedule(start_date, days, auto_sunset=True):
+    """[(epoch, command bytes, key)] the controller should send, from schedule_compiler."""
+    first, minutes = sunset_table.read_delta_table(os.path.join(CONTROLLER_DIR, 'sunset_data.sdt'))
+    offset = (start_date - first).days
+    plan = schedule_compiler.compile_plan(minutes[offset:] if offset >= 0 else [], start_date, days)
+    schedule = sys.modules.get('schedule')
+    if schedule is None or not hasattr(schedule, 'EVENT_COMMANDS'):
+        with mpshim.controller_imports(CONTROLLER_DIR, ('schedule', 'sunset')):
+            import schedule
+    golden = []
+    for record in plan:
+        for key, command, when in zip(schedule.EVENT_KEYS, schedule.EVENT_COMMANDS, record):
+            if when is not None and (auto_sunset or key not in schedule.SUNSET_EVENTS):
+                golden.append((when, command.encode(), key))
+    return sorted(golden)
+
+
+def compare(uart_log, golden, tolerance=0):
+    """Matches UART writes to golden events. Returns a dict of the differences.
+
+    matched counts events sent once with the right command during their
+    second (from CLOCK_RESOLUTION_S before it), give or take `tolerance`
+    seconds; missing and unexpected list the rest; max_error is the
+    largest timing error among the matched.
+    """
+    sent = sorted((ts, data) for ts, data in uart_log)
+    used = [False] * len(sent)
+    missing = []
+    max_error = 0.0
+    for when, command, key in golden:
+        for i, (ts, data) in enumerate(sent):
+            if (not used[i] and data == command
+                    and when - tolerance - CLOCK_RESOLUTION_S <= ts < when + 1 + tolerance):
+                used[i] = True
+                max_error = max(max_error, abs(ts - when))
+                break
+        else:
+            missing.append((when, command, key))
+    unexpected = [entry for entry, u in zip(sent, used) if not u]
+    return {'matched': len(golden) - len(missing), 'missing': missing, 'unexpected': unexpected,
+            'max_error': max_error}
+
+
+def report(sim, result):
+    print("Simulated {} day(s) from {} in {:.2f}s ({:.0f} days/s, {} loop sleeps)".format(
+        sim.days, sim.start_date, sim.elapsed, sim.days / sim.elapsed if sim.elapsed else 0, sim.clock.slept))
+    print("UART writes: {}; NTP answers: {}; broadcasts: {}".format(
+        len(sim.uart_log), len(usocket.replies), len(sim.broadcasts)))
+    print("Golden schedule: {} matched, {} missing, {} unexpected, max error {:.3f}s".format(
+        result['matched'], len(result['missing']), len(result['unexpected']), result['max_error']))
+    for when, command, key in result['missing']:
+        print("  missing    {} {:>22} {!r}".format(format_epoch(when), key, command))
+    for ts, data in result['unexpected']:
+        print("  unexpected {} {!r}".format(format_epoch(ts), data))
+    return not result['missing'] and not result['unexpected']
+
+
+def benchmark(days=365, start=datetime.date(2026, 1, 1)):
+    """Simulated days per second of the main loop, with and without the compiled plan."""
+    rates = {}
+    for use_plan in (True, False):
+        sim = Simulation(start, days, use_plan=use_plan).run()
+        rates[use_plan] = days / sim.elapsed
+        print("{:>12}: {} days in {:.2f}s = {:.0f} days/s ({:.1f} us per loop pass)".format(
+            'plan' if use_plan else 'computed', days, sim.elapsed, rates[use_plan],
+            sim.elapsed / sim.clock.slept * 1e6))
+    return rates
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Simulate the controller's main loop on CPython.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', help="simulate and compare the UART log with the golden schedule")
+    run_parser.add_argument('--start', type=datetime.date.fromisoformat, default=datetime.date(2026, 1, 1))
+    run_parser.add_argument('--days', type=int, default=365)
+    run_parser.add_argument('--no-plan', action='store_true', help="hide schedule.bin")
+    run_parser.add_argument('--sunset-off', action='store_true', help="leave the Auto_Sunset switch off")
+    run_parser.add_argument('--exact', action='store_true', help="run every second of the main loop")
+    run_parser.add_argument('--log', help="write the UART log to this file")
+    run_parser.add_argument('--verbose', action='store_true', help="show the controller's output")
+    bench_parser = sub.add_parser('benchmark', help="simulated days per second")
+    bench_parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'benchmark':
+        benchmark(args.days)
+        return 0
+    sim = Simulation(args.start, args.days, use_plan=not args.no_plan, auto_sunset=not args.sunset_off,
+                     exact=args.exact).run()
+    if args.verbose:
+        print(sim.output)
+    if args.log:
+        with open(args.log, 'w') as f:
+            f.write('\n'.join(sim.uart_lines()) + '\n')
+    golden = golden_schedule(args.start, args.days, not args.sunset_off)
+    return 0 if report(sim, compare(sim.uart_log, golden)) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
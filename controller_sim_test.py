@@ -0,0 +1,187 @@
+# controller_sim_test
+# Runs controller/main.py in simulated time and checks its UART output against the golden schedule:
+#   python3 controller_sim_test.py
+
+import contextlib
+import datetime
+import io
+import os
+import sys
+import tempfile
+
+import mpshim
+import schedule_compiler
+import sunset_table
+from checks import check, finish
+from controller_sim import CONTROLLER_DIR, Simulation, compare, golden_schedule
+from mpshim import machine, usocket
+from mpshim.devices import FakeDS3231
+
+
+def matches_golden(sim, auto_sunset=True, tolerance=0):
+    result = compare(sim.uart_log, golden_schedule(sim.start_date, sim.days, auto_sunset), tolerance)
+    return not result['missing'] and not result['unexpected'], result
+
+
+def test_year():
+    sim = Simulation(datetime.date(2026, 1, 1), 365).run()
+    ok, result = matches_golden(sim)
+    check('a year of events sent once each at the exact second', ok and result['matched'] == 5 * 365)
+    check('a simulated year takes seconds ({:.1f}s)'.format(sim.elapsed), sim.elapsed < 30)
+    check('events announced to the monitor', len(sim.broadcasts) == len(sim.uart_log))
+    check('compiled plan accepted', 'Schedule plan' not in sim.output and 'schedule plan' not in sim.output)
+
+
+def test_dst_without_plan():
+    # Without schedule.bin the controller computes each day, across both DST changes
+    for start in (datetime.date(2026, 3, 1), datetime.date(2026, 10, 25)):
+        sim = Simulation(start, 14, use_plan=False).run()
+        check('computed times match the golden schedule from {}'.format(start), matches_golden(sim)[0])
+
+
+def test_plan_file():
+    # Every day's epochs, compiled for a window rather than the whole sunset table
+    path = os.path.join(CONTROLLER_DIR, 'schedule.bin')
+    start, _, plan = schedule_compiler.read_plan(path)
+    first = (start - sunset_table.START_DATE).days
+    minutes = schedule_compiler.load_sunset_minutes()[first:]
+    check('plan holds every compiled epoch ({} days)'.format(len(plan)),
+          plan == schedule_compiler.compile_plan(minutes, start, len(plan)))
+    check('plan is 12 bytes a day ({} bytes)'.format(os.path.getsize(path)),
+          os.path.getsize(path) < 12 * len(plan) + 64)
+    with mpshim.controller_imports(CONTROLLER_DIR, ('schedule', 'sunset')):
+        import schedule
+    schedule.PLAN_FILENAME = path
+    tz = schedule_compiler.default_zone()
+    check('controller reads the compiled epochs',
+          [schedule.get_day_plan(first + day, tz) for day in (0, 100, len(plan) - 1)]
+          == [plan[day] for day in (0, 100, len(plan) - 1)]
+          and schedule.get_day_plan(first + len(plan), tz) is None)
+    no_sunset = schedule_compiler.pack_plan([plan[0][:2] + (None, None) + plan[0][4:]], start)
+    check('an event without a time is packed as none',
+          schedule_compiler.unpack_plan(no_sunset[-schedule_compiler.PLAN_RECORD_SIZE:])
+          == [plan[0][:2] + (None, None) + plan[0][4:]])
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        checked = schedule_compiler.main(['schedule_compiler.py', 'check', '--years', '1', '--out', path])
+        with tempfile.TemporaryDirectory() as tmp:
+            europe = os.path.join(tmp, 'schedule.bin')
+            schedule_compiler.main(['schedule_compiler.py', 'build', '--start', '2026-01-01', '--years', '1',
+                                    '--timezone', 'CET-1CEST,M3.5.0,M10.5.0/3', '--out', europe])
+            refused = schedule_compiler.main(['schedule_compiler.py', 'check', '--out', europe])
+    check('the original runtime fires at the compiled epochs', checked == 0 and '0 mismatches' in out.getvalue())
+    check('zones the original runtime cannot express are not checked',
+          refused == 1 and 'only has the US DST rules' in out.getvalue())
+
+
+def test_plan_for_another_zone():
+    # A plan built for New York is ignored by a controller set to main.py's Pacific zone
+    start = datetime.date(2026, 3, 1)
+    minutes = sunset_table.read_csv(sunset_table.DEFAULT_CSV)[(start - sunset_table.START_DATE).days:]
+    eastern = schedule_compiler.time_zone('EST5EDT,M3.2.0,M11.1.0')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'schedule.bin')
+        with open(path, 'wb') as f:
+            f.write(schedule_compiler.pack_plan(schedule_compiler.compile_plan(minutes, start, 14, eastern),
+                                                start, eastern))
+        sim = Simulation(start, 14, plan_path=path).run()
+    check('plan for another zone ignored', 'Schedule plan is for another time zone' in sim.output
+          and matches_golden(sim)[0])
+
+
+def test_computed_zones():
+    # Computed days follow the zone's own offsets, here a half-hour DST shift
+    with mpshim.controller_imports(CONTROLLER_DIR, ('schedule', 'sunset')):
+        import schedule
+        import sunset
+    schedule.PLAN_FILENAME = os.path.join(CONTROLLER_DIR, 'no_schedule.bin')
+    lord_howe = schedule_compiler.time_zone('<+1030>-10:30<+11>-11,M10.1.0,M4.1.0')
+    start = datetime.date(2026, 1, 1)
+    first = (start - sunset_table.START_DATE).days
+    minutes = sunset_table.read_csv(sunset_table.DEFAULT_CSV)[first:first + 365]
+    plan = schedule_compiler.compile_plan(minutes, start, 365, lord_howe)
+    computed = [tuple(when for _, when, _ in schedule.day_events(first + i, minutes[i], lord_howe))
+                for i in range(365)]
+    check('computed days match the compiler in a half-hour DST zone', computed == plan)
+    eastern = schedule_compiler.time_zone('EST5EDT,M3.2.0,M11.1.0')
+    july = (datetime.date(2026, 7, 1) - sunset_table.START_DATE).days
+    provider = sunset.SunsetProvider(mode='solar', tz=eastern)
+    check('computed sunset in the zone given',
+          provider.get_sunset_minutes(july) == sunset.solar_sunset_minutes(2026, 7, 1, utc_offset_minutes=-300) + 60)
+
+
+def test_exact_matches_skipping():
+    start = datetime.date(2026, 11, 1)  # Fall back: 01:00-01:59 happens twice
+    exact = Simulation(start, 1, exact=True).run()
+    fast = Simulation(start, 1).run()
+    seconds = [[(int(ts), data) for ts, data in sim.uart_log] for sim in (exact, fast)]
+    check('stretched sleeps give the same UART log as every second', seconds[0] == seconds[1]
+          and len(exact.uart_log) == 5 and exact.clock.slept > 80000)
+
+
+def test_sunset_switch_off():
+    sim = Simulation(datetime.date(2026, 6, 1), 7, auto_sunset=False).run()
+    ok, result = matches_golden(sim, auto_sunset=False)
+    check('sunset events held while Auto_Sunset is off', ok and result['matched'] == 3 * 7)
+
+
+def test_ntp_discipline():
+    # A fast RTC, stepped back at each sync from the NTP host with the shortest round trip
+    sim = Simulation(datetime.date(2026, 5, 1), 2, drift_ppm=100).run()
+    check('each sync asks every NTP host at once', len(usocket.replies) % 4 == 0
+          and {host for _, host in usocket.replies[:4]} == set(usocket.ntp_servers))
+    check('fastest NTP host used', 'from time.cloudflare.com' in sim.output and ' from pool.ntp.org' not in sim.output)
+    since_sync = sim.clock.true - usocket.replies[-1][0]
+    check('RTC set to the millisecond ({:+.6f}s)'.format(sim.clock.offset - since_sync * 100e-6),
+          abs(sim.clock.offset - since_sync * 100e-6) < 0.001)
+    ds = machine.i2c_devices[FakeDS3231.ADDRESS]
+    check('DS3231 written on the second ({:+.6f}s)'.format(ds.offset), abs(ds.offset) < 0.001)
+    check('drift measured ({:.2f} ppm)'.format(sim.drift.drift_ppm), abs(sim.drift.drift_ppm - 100) < 0.1)
+    gaps = [b[0] - a[0] for a, b in zip(usocket.replies[::4], usocket.replies[4::4])]
+    check('syncs every {:.0f}s to hold {} ms'.format(gaps[-1], sim.drift.max_error_ms),
+          abs(gaps[-1] - sim.drift.target_poll_s()) < 5)
+    ok, result = matches_golden(sim, tolerance=1)
+    check('events within the error bound ({:.3f}s)'.format(result['max_error']),
+          ok and result['max_error'] <= sim.drift.max_error_ms / 1000)
+
+    # A good crystal needs few syncs; the interval grows to it by doubling
+    sim = Simulation(datetime.date(2026, 5, 1), 3, drift_ppm=3).run()
+    gaps = [round((b[0] - a[0]) / 3600) for a, b in zip(usocket.replies[::4], usocket.replies[4::4])]
+    check('poll interval stretched for a 3 ppm RTC ({} h)'.format(gaps), gaps == [1, 2, 4, 8, 16, 24]
+          and matches_golden(sim, tolerance=1)[0])
+
+
+def test_ds3231_aging():
+    # A DS3231 running 2.37 ppm fast, calibrated against NTP over a month
+    sim = Simulation(datetime.date(2026, 5, 1), 30, ds3231_ppm=2.37).run()
+    ds = machine.i2c_devices[FakeDS3231.ADDRESS]
+    history = sim.aging.history
+    check('aging offset calibrated from NTP ({})'.format([(round(ppm, 2), after) for _, ppm, _, _, after in history[:3]]),
+          history and history[0][4] == 24 and ds.registers[FakeDS3231.AGING] == 24)
+    check('residual DS3231 error under a step ({:+.3f} ppm)'.format(ds.ppm()), abs(ds.ppm()) < 0.05)
+    allowed = sys.modules['time_logic'].DS3231_MAX_LEAD_US / 1e6
+    check('DS3231 kept within the lead allowed ({:+.4f}s)'.format(ds.lead()), abs(ds.lead()) < allowed
+          and matches_golden(sim)[0])
+
+
+def test_offline_drift():
+    # No network: boot time from the DS3231, then the RTC drifts uncorrected
+    sim = Simulation(datetime.date(2026, 4, 1), 30, drift_ppm=20, online=False).run()
+    ok, result = matches_golden(sim, tolerance=120)
+    check('offline controller still sends every event', ok and not usocket.replies)
+    check('uncorrected 20 ppm drift shows in the log ({:.1f}s after 30 days)'.format(result['max_error']),
+          result['max_error'] > 40)
+    check('UART log lines carry the send time', sim.uart_lines()[0].split()[1] == '2026-04-01')
+
+
+if __name__ == '__main__':
+    test_year()
+    test_dst_without_plan()
+    test_plan_file()
+    test_plan_for_another_zone()
+    test_computed_zones()
+    test_exact_matches_skipping()
+    test_sunset_switch_off()
+    test_ntp_discipline()
+    test_ds3231_aging()
+    test_offline_drift()
+    finish()
@@ -0,0 +1,263 @@
+"""SQLite index of monitored events.
+
+One row per scheduled event the monitor captured: the event key ('0755',
+'0800', 'sunset_minus_5', 'sunset', '2200'), its scheduled time and local
+date, the capture file and duration, and when measured, the detected
+onset, playback latency, RMS level and the call classification. Rows are
+keyed by (event, scheduled), so re-measuring an event updates its row.
+Audio the monitor's continuous listener picks up outside the schedule
+(e.g. a button pressed on the player) is added as event 'detected', at
+the time it was first heard.
+
+Writes are queued and committed in one transaction per batch. Indexes on
+date and on (event, date) keep queries such as "all late Retreats in
+March" to an index range scan, milliseconds over years of rows.
+
+The monitor adds a row when each capture closes. Clips analysed offline
+can be loaded from archive_analysis.py results.
+
+Usage:
+    python3 event_index.py import recordings/analysis.jsonl [--db events.db]
+    python3 event_index.py late --event sunset --since 2026-03-01 --until 2026-03-31 [--min 1.0]
+    python3 event_index.py benchmark [--years 5]
+"""
+import argparse
+import datetime
+import json
+import sqlite3
+import sys
+import time
+
+DEFAULT_DB = 'events.db'
+BATCH_SIZE = 1000
+LATE_S = 1.0  # Latency beyond which an event counts as late
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    event TEXT NOT NULL,
+    date TEXT NOT NULL,
+    scheduled REAL NOT NULL,
+    capture_path TEXT,
+    duration REAL,
+    onset REAL,
+    latency REAL,
+    rms REAL,
+    call TEXT,
+    confidence REAL,
+    UNIQUE (event, scheduled)
+);
+CREATE INDEX IF NOT EXISTS events_date ON events (date);
+CREATE INDEX IF NOT EXISTS events_event_date ON events (event, date);
+"""
+
+COLUMNS = ('event', 'date', 'scheduled', 'capture_path', 'duration', 'onset', 'latency', 'rms',
+           'call', 'confidence')
+_INSERT = "INSERT INTO events ({0}) VALUES ({1}) ON CONFLICT (event, scheduled) DO UPDATE SET {2}".format(
+    ', '.join(COLUMNS), ', '.join('?' * len(COLUMNS)),
+    ', '.join('{0} = coalesce(excluded.{0}, {0})'.format(c) for c in COLUMNS[3:]))
+
+
+def local_date(epoch, tz=None):
+    """ISO date of an epoch in tz (a tzinfo; the host's timezone if None)."""
+    return datetime.datetime.fromtimestamp(epoch, tz).date().isoformat()
+
+
+class EventIndex:
+    """Rows are dated in tz, the monitored site's timezone (the host's if None)."""
+    def __init__(self, path=DEFAULT_DB, batch_size=BATCH_SIZE, tz=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.tz = tz
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, event, scheduled, **fields):
+        """Queue a row for `event` at epoch `scheduled`; other columns by name.
+
+        Columns left out (or None) keep their stored value when the row exists.
+        """
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError("Unknown column(s): {}".format(', '.join(sorted(unknown))))
+        fields.update(event=event, scheduled=scheduled, date=local_date(scheduled, self.tz))
+        self._pending.append(tuple(fields.get(c) for c in COLUMNS))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write queued rows in one transaction."""
+        if not self._pending:
+            return 0
+        rows, self._pending = self._pending, []
+        with self._db:
+            self._db.executemany(_INSERT, rows)
+        return len(rows)
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+    def query(self, sql, params=()):
+        self.flush()
+        cursor = self._db.execute(sql, params)
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    def events(self, event=None, since=None, until=None):
+        """Rows by scheduled time, optionally for one event key and a date range (inclusive)."""
+        return self._select("1", [], event, since, until)
+
+    def late_events(self, event=None, since=None, until=None, min_latency=LATE_S):
+        """Rows whose audio started more than min_latency seconds late."""
+        return self._select("latency > ?", [min_latency], event, since, until)
+
+    def _select(self, where, params, event, since, until):
+        if event is not None:
+            where += " AND event = ?"
+            params.append(event)
+        if since is not None:
+            where += " AND date >= ?"
+            params.append(str(since))
+        if until is not None:
+            where += " AND date <= ?"
+            params.append(str(until))
+        return self.query("SELECT * FROM events WHERE " + where + " ORDER BY scheduled", params)
+
+
+_references = {}  # Reference directory -> loaded reference features
+
+
+def measure_capture(path, windows, lead, ref_dir=None, site=None):
+    """Rows for the events in one capture: [(event, scheduled, fields)].
+
+    windows are (key, start, stop) of the recording windows the capture
+    covered; an event's scheduled time is its window start plus `lead`.
+    Onset, latency and RMS are measured when NumPy is available and the
+    capture is a clip file, and the call is classified when ref_dir holds
+    the reference calls; otherwise only the capture itself is recorded.
+    site (an audio_monitor.Site) gives the schedule the classification
+    checks against; by default the host's.
+    """
+    try:
+        import clip_analysis
+        import call_classifier
+    except ImportError:
+        clip_analysis = call_classifier = None
+    classified = None
+    if call_classifier is not None and path is not None and ref_dir:
+        try:
+            if ref_dir not in _references and call_classifier.find_references(ref_dir):
+                _references[ref_dir] = call_classifier.load_references(ref_dir)
+            if ref_dir in _references:
+                classified = call_classifier.classify_clip(path, _references[ref_dir], site)
+        except (OSError, ValueError, RuntimeError, EOFError) as e:
+            print(f"Could not classify {path}: {e}")
+    rows = []
+    for key, start, stop in windows:
+        scheduled = start + lead
+        fields = {'capture_path': path, 'duration': stop - start}
+        if clip_analysis is not None and path is not None:
+            try:
+                fields.update(clip_analysis.measure_event(path, scheduled, stop - scheduled))
+            except (OSError, ValueError, EOFError) as e:
+                print(f"Could not measure {key} in {path}: {e}")
+        if classified is not None:
+            fields.update(call=classified['call'], confidence=classified['confidence'])
+        rows.append((key, scheduled, fields))
+    return rows
+
+
+def import_results(index, results_path):
+    """Add rows from an archive_analysis.py results file. Returns the number added."""
+    added = 0
+    with open(results_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not record.get('key') or record.get('scheduled') is None:
+                continue  # Clip without a scheduled event
+            onset = record.get('onset')
+            index.add(record['key'], record['scheduled'], capture_path=record['path'],
+                      duration=record.get('length'),
+                      onset=None if onset is None else record['start'] + onset,
+                      latency=record.get('latency'), rms=record.get('rms'),
+                      call=record.get('call'), confidence=record.get('confidence'))
+            added += 1
+    index.flush()
+    return added
+
+
+def benchmark(path, years=5):
+    """Fill `path` with synthetic years of events, then time a month's late-Retreat query."""
+    import random
+    rng = random.Random(0)
+    keys = (('0755', 28500), ('0800', 28800), ('sunset_minus_5', 61500), ('sunset', 61800),
+            ('2200', 79200))
+    first = datetime.datetime(2025, 1, 1).timestamp()
+    with EventIndex(path) as index:
+        t0 = time.perf_counter()
+        for day in range(365 * years):
+            for key, offset in keys:
+                scheduled = first + day * 86400 + offset
+                latency = rng.gauss(0.4, 0.3)
+                index.add(key, scheduled, capture_path=f'{key}-{day}.wav', duration=120.0,
+                          onset=scheduled + latency, latency=latency, rms=rng.gauss(-20, 2),
+                          call=key, confidence=0.9)
+        index.flush()
+        inserted = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        rows = index.late_events('sunset', '2027-03-01', '2027-03-31')
+        queried = time.perf_counter() - t0
+        plan = index.query("EXPLAIN QUERY PLAN SELECT * FROM events WHERE latency > 1 AND event = 'sunset' "
+                           "AND date >= '2027-03-01' AND date <= '2027-03-31'")
+    print(f"Inserted {365 * years * len(keys)} rows in {inserted:.2f}s; late Retreats in March 2027: "
+          f"{len(rows)} row(s) in {queried * 1000:.2f} ms ({plan[0]['detail']})")
+    return queried
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Query and load the monitor's event index.")
+    parser.add_argument('--db', default=DEFAULT_DB)
+    sub = parser.add_subparsers(dest='command', required=True)
+    import_parser = sub.add_parser('import', help="load archive_analysis.py results")
+    import_parser.add_argument('results')
+    late_parser = sub.add_parser('late', help="list events whose audio started late")
+    late_parser.add_argument('--event', help="event key, e.g. sunset")
+    late_parser.add_argument('--since', help="first date, YYYY-MM-DD")
+    late_parser.add_argument('--until', help="last date, YYYY-MM-DD")
+    late_parser.add_argument('--min', type=float, default=LATE_S, help="latency threshold in seconds")
+    bench_parser = sub.add_parser('benchmark', help="time queries over synthetic years of events")
+    bench_parser.add_argument('--years', type=int, default=5)
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'benchmark':
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            benchmark(os.path.join(tmp, 'events.db'), args.years)
+        return 0
+    with EventIndex(args.db) as index:
+        if args.command == 'import':
+            print(f"Indexed {import_results(index, args.results)} event(s) from {args.results}")
+            return 0
+        rows = index.late_events(args.event, args.since, args.until, args.min)
+        for row in rows:
+            scheduled = datetime.datetime.fromtimestamp(row['scheduled'])
+            print(f"{scheduled:%Y-%m-%d %H:%M:%S} {row['event']:>14}  {row['latency']:+.3f}s  "
+                  f"{row['call'] or '-'}  {row['capture_path'] or '-'}")
+        print(f"{len(rows)} late event(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
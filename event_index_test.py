@@ -0,0 +1,109 @@
+# event_index_test
+# SQLite event index: batching, upserts, queries and capture measurement:
+#   python3 event_index_test.py
+
+import datetime
+import json
+import os
+import tempfile
+import zoneinfo
+import wave
+
+import numpy as np
+
+from audio_capture import clip_name
+from checks import check, finish
+from event_index import EventIndex, import_results, local_date, measure_capture
+
+RATE = 16000
+
+
+def write_clip(directory, started, onsets, length_s):
+    """Quiet noise with a tone starting at each offset in onsets (seconds into the clip)."""
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal(int(length_s * RATE)) * 40
+    for onset, stop in onsets:
+        t = np.arange(int((stop - onset) * RATE)) / RATE
+        x[int(onset * RATE):int(onset * RATE) + len(t)] += 5000 * np.sin(2 * np.pi * 466.16 * t)
+    path = os.path.join(directory, clip_name(started))
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(x.astype('<i2').tobytes())
+    return path
+
+
+def test_batching_and_upsert(tmp):
+    db = os.path.join(tmp, 'batch.db')
+    index = EventIndex(db, batch_size=3)
+    march = datetime.datetime(2026, 3, 10, 19, 10).timestamp()
+    index.add('sunset', march, latency=2.5)
+    index.add('sunset', march + 86400, latency=0.3)
+    check('rows held until the batch fills', EventIndex(db).events() == [])
+    index.add('0800', march - 40000, latency=1.2)
+    check('full batch committed', len(EventIndex(db).events()) == 3)
+    index.add('sunset', march, capture_path='a.wav', call='retreat+carry_on')
+    index.flush()
+    row = index.events('sunset', '2026-03-10', '2026-03-10')[0]
+    check('re-adding an event updates its row and keeps other columns',
+          row['capture_path'] == 'a.wav' and row['latency'] == 2.5 and len(index.events()) == 3)
+    late = index.late_events('sunset', '2026-03-01', '2026-03-31')
+    check('late Retreats in March', [r['date'] for r in late] == ['2026-03-10'])
+    try:
+        index.add('sunset', march, colour='red')
+        check('unknown column rejected', False)
+    except ValueError:
+        check('unknown column rejected', True)
+    index.close()
+
+
+def test_measure_capture(tmp):
+    # One capture holding Sunset-5 (First Call) and, merged, Retreat five minutes later
+    sunset = datetime.datetime(2026, 3, 10, 19, 10).timestamp()
+    started = sunset - 300 - 10
+    path = write_clip(tmp, started, [(10.4, 35), (310.8, 420)], 430)
+    windows = [('sunset_minus_5', sunset - 300, sunset - 270), ('sunset', sunset, sunset + 120)]
+    rows = {key: (scheduled, fields) for key, scheduled, fields in measure_capture(path, windows, 0)}
+    check('one row per merged event', sorted(rows) == ['sunset', 'sunset_minus_5'])
+    check('each event measured in its own part of the capture',
+          abs(rows['sunset_minus_5'][1]['latency'] - 0.4) < 0.01
+          and abs(rows['sunset'][1]['latency'] - 0.8) < 0.01)
+    check('RMS recorded', -40 < rows['sunset'][1]['rms'] < 0)
+    unmeasured = measure_capture(None, [('2200', sunset + 10000, sunset + 10120)], 10)
+    check('capture without a file still indexed',
+          unmeasured == [('2200', sunset + 10010, {'capture_path': None, 'duration': 120})])
+
+
+def test_site_timezone(tmp):
+    # Dates follow the monitored site's timezone, not the host's
+    auckland = zoneinfo.ZoneInfo('Pacific/Auckland')
+    colors = datetime.datetime(2026, 3, 10, 8, tzinfo=auckland).timestamp()
+    with EventIndex(os.path.join(tmp, 'site.db'), tz=auckland) as index:
+        index.add('0800', colors)
+        index.add('2200', colors + 14 * 3600)
+        check('rows dated in the site\'s timezone',
+              [r['date'] for r in index.events()] == ['2026-03-10', '2026-03-10'])
+    check('local_date in a given zone', local_date(colors, datetime.timezone.utc) == '2026-03-09')
+
+
+def test_import(tmp):
+    results = os.path.join(tmp, 'analysis.jsonl')
+    with open(results, 'w') as f:
+        f.write(json.dumps({'path': 'x.wav', 'start': 1000.0, 'length': 190.0, 'onset': 10.5,
+                            'key': '0800', 'scheduled': 1010.0, 'latency': 0.5, 'rms': -18.0,
+                            'call': 'star_spangled_banner+carry_on', 'confidence': 0.9}) + '\n')
+        f.write(json.dumps({'path': 'y.wav', 'start': 5000.0, 'key': None, 'scheduled': None}) + '\n')
+    with EventIndex(os.path.join(tmp, 'import.db')) as index:
+        check('only clips with an event imported', import_results(index, results) == 1)
+        row = index.events()[0]
+        check('imported onset is absolute', row['onset'] == 1010.5 and row['event'] == '0800')
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        test_batching_and_upsert(tmp)
+        test_measure_capture(tmp)
+        test_site_timezone(tmp)
+        test_import(tmp)
+    finish()
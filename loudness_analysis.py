@@ -0,0 +1,340 @@
+"""Streaming loudness, peak and clipping analysis of recordings (requires NumPy).
+
+Tracks the player's output level over time (main.cpp fixes it with
+audio.setVolume(5) and nothing checks what comes out of the speaker). For
+each captured event it reports:
+  - integrated loudness in LUFS (ITU-R BS.1770: K-weighted, 400 ms blocks
+    with 75% overlap, absolute gate at -70 LUFS, relative gate 10 LU down;
+    the channels' powers are summed, so a stereo file playing the same
+    tone on both channels reads 3 dB louder than on one),
+  - sample peak in dBFS, over all channels,
+  - clipping ratio: the fraction of samples at full scale,
+  - noise floor: the 10th percentile of 100 ms RMS levels (all channels), in dBFS,
+and writes daily trend series of the same figures per event.
+
+Audio is read in fixed-size chunks and reduced to 100 ms block powers, so
+memory does not grow with the recording: the gating and the noise-floor
+percentile are computed from fixed histograms instead of per-block lists.
+K-weighting is applied in the frequency domain, as the squared magnitude
+response of the BS.1770 filters over each block's spectrum, so a chunk
+costs one vectorized FFT rather than a per-sample filter loop.
+
+Usage:
+    python3 loudness_analysis.py file capture.wav
+    python3 loudness_analysis.py report [--db events.db] [--since 2026-03-01] [--until ...]
+        [--events-out loudness_events.csv] [--trends-out loudness_trends.csv]
+    python3 loudness_analysis.py benchmark [--hours 2]
+"""
+import argparse
+import csv
+import datetime
+import math
+import sys
+import time
+import wave
+
+import numpy as np
+
+from audio_capture import clip_start_time
+
+BLOCK_S = 0.1  # Power block; a BS.1770 gating block is 4 of them
+CHUNK_BLOCKS = 50  # Blocks per chunk read from disk
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+LOUDNESS_BIN = 0.1  # LU resolution of the gating histogram
+LOUDNESS_RANGE = (-70.0, 10.0)
+LEVEL_BIN = 0.5  # dB resolution of the noise-floor histogram
+LEVEL_RANGE = (-140.0, 0.0)
+NOISE_PERCENTILE = 10
+CLIP_LEVEL = 32767  # |sample| at or above this counts as clipped
+FULL_SCALE = 32768.0
+SURROUND_GAIN = 1.41  # BS.1770 weight of the 5.1 surround channels
+
+
+def channel_gains(channels):
+    """BS.1770 weight of each channel: 1.0, except in 5.1 (L R C LFE Ls Rs) where LFE is left out."""
+    if channels == 6:
+        return np.array([1.0, 1.0, 1.0, 0.0, SURROUND_GAIN, SURROUND_GAIN])
+    return np.ones(channels)
+
+
+def _biquad_power(b, a, freqs, rate):
+    """|H(f)|^2 of a digital biquad at the given frequencies."""
+    z = np.exp(-1j * 2 * np.pi * freqs / rate)
+    h = (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return np.abs(h) ** 2
+
+
+def k_weighting(freqs, rate):
+    """Squared magnitude of the BS.1770 K-weighting filter (shelf then high-pass)."""
+    # High shelf: +4 dB above ~1.5 kHz
+    gain_db, q, fc = 3.99984385397, 0.7071752369554193, 1681.974450955533
+    k = math.tan(math.pi * fc / rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.499666774155
+    a0 = 1 + k / q + k * k
+    shelf_b = ((vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0)
+    shelf_a = (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+    # High-pass at ~38 Hz
+    q, fc = 0.5003270373253953, 38.13547087613982
+    k = math.tan(math.pi * fc / rate)
+    a0 = 1 + k / q + k * k
+    hp_b = (1.0, -2.0, 1.0)
+    hp_a = (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+    return _biquad_power(shelf_b, shelf_a, freqs, rate) * _biquad_power(hp_b, hp_a, freqs, rate)
+
+
+class _Histogram:
+    """Fixed-range histogram of dB values with the linear power summed per bin."""
+    def __init__(self, low, high, step):
+        self.low = low
+        self.step = step
+        self.counts = np.zeros(int(round((high - low) / step)) + 1, dtype=np.int64)
+        self.powers = np.zeros(len(self.counts), dtype=np.float64)
+
+    def add(self, db, power):
+        bins = np.clip(((db - self.low) / self.step).astype(np.int64), 0, len(self.counts) - 1)
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+        self.powers += np.bincount(bins, weights=power, minlength=len(self.counts))
+
+    def lower_edges(self):
+        return self.low + self.step * np.arange(len(self.counts))
+
+    def percentile(self, pct):
+        total = self.counts.sum()
+        if total == 0:
+            return None
+        i = int(np.searchsorted(np.cumsum(self.counts), total * pct / 100.0))
+        return float(self.low + self.step * (i + 0.5))
+
+
+def _loudness(power):
+    return -0.691 + 10 * np.log10(np.maximum(power, 1e-20))
+
+
+class LoudnessMeter:
+    """Accumulates loudness statistics over int16 chunks of any size, in constant memory.
+
+    Chunks hold whole frames, interleaved as in a WAV file when there is
+    more than one channel.
+    """
+    def __init__(self, rate, channels=1):
+        self.rate = rate
+        self.channels = channels
+        self._gains = channel_gains(channels)
+        self.block = int(rate * BLOCK_S)
+        freqs = np.fft.rfftfreq(self.block, 1.0 / rate)
+        # Parseval: block power = sum of weighted |X|^2 over the spectrum, scaled
+        weights = k_weighting(freqs, rate) * 2.0
+        weights[0] /= 2
+        if self.block % 2 == 0:
+            weights[-1] /= 2
+        self._weights = (weights / (self.block * self.block)).astype(np.float64)
+        self._carry = np.zeros((0, channels), dtype=np.int16)  # Frames short of a full block
+        self._previous = np.zeros(0)  # Last 3 block powers, for overlapping gating blocks
+        self._gating = _Histogram(*LOUDNESS_RANGE, LOUDNESS_BIN)
+        self._levels = _Histogram(*LEVEL_RANGE, LEVEL_BIN)
+        self.samples = 0  # Frames
+        self.peak = 0
+        self.clipped = 0
+
+    def feed(self, chunk):
+        chunk = np.asarray(chunk, dtype=np.int16).reshape(-1, self.channels)
+        self.samples += len(chunk)
+        if len(chunk):
+            self.peak = max(self.peak, int(np.abs(chunk.astype(np.int32)).max()))
+            self.clipped += int(np.count_nonzero((chunk >= CLIP_LEVEL) | (chunk <= -CLIP_LEVEL)))
+        data = np.concatenate([self._carry, chunk]) if len(self._carry) else chunk
+        n = len(data) // self.block
+        self._carry = data[n * self.block:].copy()
+        if n == 0:
+            return
+        # Blocks x channels x samples
+        blocks = data[:n * self.block].reshape(n, self.block, self.channels).transpose(0, 2, 1)
+        blocks = blocks.astype(np.float32) / FULL_SCALE
+        # Unweighted block levels for the noise floor
+        mean_square = np.einsum('ijk,ijk->i', blocks, blocks, dtype=np.float64) / (self.block * self.channels)
+        self._levels.add(10 * np.log10(np.maximum(mean_square, 1e-20)), mean_square)
+        # K-weighted block powers summed over the channels, then 400 ms gating blocks every 100 ms
+        spectrum = np.fft.rfft(blocks, axis=2)
+        power = ((spectrum.real ** 2 + spectrum.imag ** 2) @ self._weights) @ self._gains
+        joined = np.concatenate([self._previous, power])
+        if len(joined) >= 4:
+            cumulative = np.concatenate([[0.0], np.cumsum(joined)])
+            gating = (cumulative[4:] - cumulative[:-4]) / 4
+            loudness = _loudness(gating)
+            keep = loudness > ABSOLUTE_GATE
+            self._gating.add(loudness[keep], gating[keep])
+        self._previous = joined[-3:]
+
+    def integrated_loudness(self):
+        """Gated loudness in LUFS, or None if nothing rose above the absolute gate."""
+        counts, powers = self._gating.counts, self._gating.powers
+        if counts.sum() == 0:
+            return None
+        threshold = _loudness(powers.sum() / counts.sum()) + RELATIVE_GATE
+        keep = self._gating.lower_edges() + LOUDNESS_BIN > threshold
+        if counts[keep].sum() == 0:
+            return None
+        return float(_loudness(powers[keep].sum() / counts[keep].sum()))
+
+    def result(self):
+        return {
+            'seconds': self.samples / self.rate,
+            'loudness': self.integrated_loudness(),
+            'peak': 20 * math.log10(self.peak / FULL_SCALE) if self.peak else None,
+            'clip_ratio': self.clipped / (self.samples * self.channels) if self.samples else 0.0,
+            'noise_floor': self._levels.percentile(NOISE_PERCENTILE),
+        }
+
+
+def analyze_file(path, start_s=0.0, stop_s=None):
+    """Stream a 16-bit WAV (optionally only start_s..stop_s into it) through a LoudnessMeter."""
+    with wave.open(path, 'rb') as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path} is not 16-bit PCM")
+        rate = f.getframerate()
+        channels = f.getnchannels()
+        first = min(f.getnframes(), max(0, int(start_s * rate)))
+        last = f.getnframes() if stop_s is None else min(f.getnframes(), int(stop_s * rate))
+        f.setpos(first)
+        meter = LoudnessMeter(rate, channels)
+        chunk = meter.block * CHUNK_BLOCKS
+        remaining = max(0, last - first)
+        while remaining > 0:
+            data = f.readframes(min(chunk, remaining))
+            if not data:
+                break
+            samples = np.frombuffer(data, dtype='<i2')
+            meter.feed(samples)
+            remaining -= len(samples) // channels
+    return meter.result()
+
+
+def analyze_event(row):
+    """Loudness of one event_index row's part of its capture, from the scheduled time on."""
+    offset = row['scheduled'] - clip_start_time(row['capture_path'])
+    stop = None if row['duration'] is None else offset + row['duration']
+    result = analyze_file(row['capture_path'], offset, stop)
+    result.update(event=row['event'], date=row['date'], scheduled=row['scheduled'],
+                  path=row['capture_path'])
+    return result
+
+
+EVENT_FIELDS = ('date', 'event', 'scheduled', 'path', 'seconds', 'loudness', 'peak', 'clip_ratio',
+                'noise_floor')
+TREND_FIELDS = ('date', 'event', 'count', 'loudness', 'peak', 'clip_ratio', 'noise_floor')
+
+
+def daily_trends(results):
+    """Per (date, event): mean loudness and noise floor, max peak, overall clipping ratio."""
+    groups = {}
+    for r in results:
+        groups.setdefault((r['date'], r['event']), []).append(r)
+    trends = []
+    for (date, event), rows in sorted(groups.items()):
+        def mean(field):
+            values = [r[field] for r in rows if r[field] is not None]
+            return sum(values) / len(values) if values else None
+        peaks = [r['peak'] for r in rows if r['peak'] is not None]
+        seconds = sum(r['seconds'] for r in rows)
+        trends.append({
+            'date': date, 'event': event, 'count': len(rows), 'loudness': mean('loudness'),
+            'peak': max(peaks) if peaks else None,
+            'clip_ratio': sum(r['clip_ratio'] * r['seconds'] for r in rows) / seconds if seconds else 0.0,
+            'noise_floor': mean('noise_floor'),
+        })
+    return trends
+
+
+def write_csv(path, rows, fields):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: ('' if row.get(k) is None else
+                                 round(row[k], 4) if isinstance(row[k], float) else row[k])
+                             for k in fields})
+
+
+def report(db, since=None, until=None, events_out='loudness_events.csv',
+           trends_out='loudness_trends.csv'):
+    """Analyse every indexed capture in the date range and write per-event and daily CSVs."""
+    from event_index import EventIndex
+    with EventIndex(db) as index:
+        rows = [r for r in index.events(since=since, until=until) if r['capture_path']]
+    results = []
+    for row in rows:
+        try:
+            results.append(analyze_event(row))
+        except (OSError, ValueError, EOFError, wave.Error) as e:
+            print(f"{row['capture_path']}: {e}")
+    trends = daily_trends(results)
+    write_csv(events_out, results, EVENT_FIELDS)
+    write_csv(trends_out, trends, TREND_FIELDS)
+    print(f"{len(results)} event(s) over {len({t['date'] for t in trends})} day(s) -> "
+          f"{events_out}, {trends_out}")
+    return results, trends
+
+
+def benchmark(hours=2.0, rate=48000):
+    """Feed hours of synthetic audio through a meter in chunks; report speed and memory."""
+    import tracemalloc
+    rng = np.random.default_rng(0)
+    meter = LoudnessMeter(rate)
+    chunk = meter.block * CHUNK_BLOCKS
+    # A minute of tone-over-noise reused chunk by chunk, so generation is not timed
+    t = np.arange(rate * 60) / rate
+    minute = (3000 * np.sin(2 * np.pi * 466.16 * t) * (np.sin(2 * np.pi * t / 20) > 0)
+              + rng.standard_normal(len(t)) * 30).astype(np.int16)
+    total = int(hours * 3600 * rate)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fed = 0
+    while fed < total:
+        i = fed % len(minute)
+        piece = minute[i:i + min(chunk, total - fed)]
+        meter.feed(piece)
+        fed += len(piece)
+    elapsed = time.perf_counter() - t0
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = meter.result()
+    print(f"{hours:g} h at {rate} Hz in {elapsed:.2f}s ({hours * 3600 / elapsed:.0f}x real time), "
+          f"peak memory {peak_memory / 1e6:.1f} MB; loudness {result['loudness']:.1f} LUFS, "
+          f"peak {result['peak']:.1f} dBFS, noise floor {result['noise_floor']:.1f} dBFS")
+    return elapsed, peak_memory
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Loudness, peak and clipping of recordings.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    file_parser = sub.add_parser('file', help="analyse whole WAV files")
+    file_parser.add_argument('paths', nargs='+')
+    report_parser = sub.add_parser('report', help="analyse indexed events and write trends")
+    report_parser.add_argument('--db', default='events.db')
+    report_parser.add_argument('--since')
+    report_parser.add_argument('--until')
+    report_parser.add_argument('--events-out', default='loudness_events.csv')
+    report_parser.add_argument('--trends-out', default='loudness_trends.csv')
+    bench_parser = sub.add_parser('benchmark', help="time a long synthetic stream")
+    bench_parser.add_argument('--hours', type=float, default=2.0)
+    args = parser.parse_args(argv[1:])
+
+    if args.command == 'benchmark':
+        benchmark(args.hours)
+    elif args.command == 'report':
+        report(args.db, args.since, args.until, args.events_out, args.trends_out)
+    else:
+        for path in args.paths:
+            r = analyze_file(path)
+            loudness = 'n/a' if r['loudness'] is None else f"{r['loudness']:.1f} LUFS"
+            peak = 'n/a' if r['peak'] is None else f"{r['peak']:.1f} dBFS"
+            floor = 'n/a' if r['noise_floor'] is None else f"{r['noise_floor']:.1f} dBFS"
+            print(f"{path}: {r['seconds']:.0f}s, loudness {loudness}, peak {peak}, "
+                  f"clipping {r['clip_ratio'] * 100:.3f}%, noise floor {floor}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,139 @@
+# loudness_analysis_test
+# Streaming loudness meter against BS.1770 reference signals and synthetic captures:
+#   python3 loudness_analysis_test.py
+
+import contextlib
+import datetime
+import io
+import os
+import tempfile
+import tracemalloc
+import wave
+
+import numpy as np
+
+import loudness_analysis
+from audio_capture import clip_name
+from checks import check, finish, write_wav
+from event_index import EventIndex
+from loudness_analysis import LoudnessMeter
+
+RATE = 48000
+
+
+def sine(seconds, level_db, freq=997.0):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return 10 ** (level_db / 20) * 32767 * np.sin(2 * np.pi * freq * t)
+
+
+def meter_of(x, chunk=4096):
+    meter = LoudnessMeter(RATE)
+    x = np.asarray(x).astype(np.int16)
+    for i in range(0, len(x), chunk):
+        meter.feed(x[i:i + chunk])
+    return meter.result()
+
+
+def test_reference_levels():
+    # BS.1770: a 0 dBFS 997 Hz sine on one channel reads -3.01 LUFS
+    r = meter_of(sine(10, 0))
+    check('0 dBFS 997 Hz sine is -3.01 LUFS ({:.2f})'.format(r['loudness']), abs(r['loudness'] + 3.01) < 0.05)
+    r = meter_of(sine(10, -20))
+    check('-20 dBFS sine is -23.01 LUFS', abs(r['loudness'] + 23.01) < 0.05)
+    check('sample peak in dBFS', abs(r['peak'] + 20) < 0.01)
+    low = meter_of(sine(10, -20, freq=40))
+    check('K-weighting attenuates 40 Hz', low['loudness'] < -25)
+
+
+def test_chunking_and_gating():
+    x = sine(10, -20)
+    sizes = {round(meter_of(x, chunk)['loudness'], 6) for chunk in (1000, 4800, 33333, len(x))}
+    check('result independent of chunk size', len(sizes) == 1)
+    # Half the time near-silent: the gates leave the loudness of the tone unchanged
+    gapped = np.concatenate([sine(10, -20), np.zeros(10 * RATE), sine(10, -20)])
+    check('silence gated out', abs(meter_of(gapped)['loudness'] + 23.01) < 0.1)
+    quiet = meter_of(np.zeros(5 * RATE))
+    check('silence has no loudness', quiet['loudness'] is None and quiet['peak'] is None)
+
+
+def test_clipping_and_noise_floor():
+    rng = np.random.default_rng(0)
+    noise = rng.standard_normal(20 * RATE) * 32768 * 10 ** (-60 / 20)
+    loud = np.clip(sine(2, 3), -32768, 32767)  # Driven 3 dB past full scale
+    r = meter_of(np.concatenate([noise, loud]))
+    clipped = np.count_nonzero(np.abs(loud) >= 32767) / (22 * RATE)
+    check('clipping ratio counts full-scale samples', abs(r['clip_ratio'] - clipped) < 1e-6 and r['clip_ratio'] > 0)
+    check('noise floor from quiet blocks ({:.1f} dBFS)'.format(r['noise_floor']), abs(r['noise_floor'] + 60) < 1)
+
+
+def test_constant_memory(tmp):
+    # An hour-long file is streamed without holding it in memory
+    path = os.path.join(tmp, 'long.wav')
+    minute = sine(60, -20).astype('<i2').tobytes()
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        for _ in range(60):
+            f.writeframes(minute)
+    tracemalloc.start()
+    r = loudness_analysis.analyze_file(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = os.path.getsize(path)
+    check('hour-long file measured', abs(r['seconds'] - 3600) < 0.01 and abs(r['loudness'] + 23.01) < 0.05)
+    check('memory well below file size ({:.1f} MB of {:.0f} MB)'.format(peak / 1e6, size / 1e6), peak < size / 20)
+
+
+def test_channels(tmp):
+    # BS.1770 sums the channels' powers: a tone on both channels reads 3 dB above the same tone on one
+    tone = sine(10, -20)
+    silence = np.zeros(len(tone))
+    both = write_wav(os.path.join(tmp, 'both.wav'), np.stack([tone, tone], axis=1), RATE, channels=2)
+    right = write_wav(os.path.join(tmp, 'right.wav'), np.stack([silence, tone], axis=1), RATE, channels=2)
+    r = loudness_analysis.analyze_file(both)
+    check('stereo channels summed ({:.2f} LUFS)'.format(r['loudness']), abs(r['loudness'] + 20.0) < 0.05)
+    check('stereo length in frames', abs(r['seconds'] - 10) < 0.01)
+    r = loudness_analysis.analyze_file(right)
+    check('second channel measured', abs(r['loudness'] + 23.01) < 0.05 and abs(r['peak'] + 20) < 0.01)
+    check('clipping ratio over every sample', r['clip_ratio'] == 0.0)
+
+
+def test_short_file(tmp):
+    path = write_wav(os.path.join(tmp, 'short.wav'), sine(0.05, -20), RATE)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        code = loudness_analysis.main(['loudness_analysis.py', 'file', path])
+    check('file shorter than a block reported without a noise floor',
+          code == 0 and 'noise floor n/a' in out.getvalue())
+
+
+def test_report(tmp):
+    db = os.path.join(tmp, 'events.db')
+    with EventIndex(db) as index:
+        for day, level in ((1, -20), (2, -26)):
+            colors = datetime.datetime(2026, 3, day, 8).timestamp()
+            # 10 s of pre-roll noise, then the call: only the call is measured
+            clip = np.concatenate([np.random.default_rng(day).standard_normal(10 * RATE) * 3000,
+                                   sine(30, level)])
+            path = write_wav(os.path.join(tmp, clip_name(colors - 10)), clip, RATE)
+            index.add('0800', colors, capture_path=path, duration=30)
+    events_out = os.path.join(tmp, 'events.csv')
+    trends_out = os.path.join(tmp, 'trends.csv')
+    results, trends = loudness_analysis.report(db, events_out=events_out, trends_out=trends_out)
+    check('one result per event', len(results) == 2)
+    check('event measured from its scheduled time',
+          [round(t['loudness']) for t in trends] == [-23, -29])
+    check('trend files written', os.path.exists(events_out) and sum(1 for _ in open(trends_out)) == 3)
+
+
+if __name__ == '__main__':
+    test_reference_levels()
+    test_chunking_and_gating()
+    test_clipping_and_noise_floor()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_constant_memory(tmp)
+        test_channels(tmp)
+        test_short_file(tmp)
+        test_report(tmp)
+    finish()
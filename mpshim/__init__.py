@@ -0,0 +1,72 @@
+"""Stand-ins for the MicroPython modules the controller imports, for CPython.
+
+machine, utime (also served as `time` to controller code), usocket and
+uselect (served as `socket` and `select`), network, ssd1306, ure and
+micropython all run on one VirtualClock, so the controller's code can be
+driven through days of simulated time in a few milliseconds per day.
+
+    clock = mpshim.VirtualClock(start)
+    mpshim.install(clock)
+    with mpshim.controller_imports('controller'):
+        import main
+
+install() registers the stand-ins in sys.modules under their MicroPython
+names (no CPython module uses those names). controller_imports() also
+swaps in utime as `time`, usocket as `socket` and uselect as `select`
+while the controller modules are imported, so they see MicroPython's
+integer, 2000-epoch clock and the simulated network; modules imported
+under it are imported afresh each time.
+"""
+import contextlib
+import sys
+
+from mpshim.clock import SimulationEnd, VirtualClock
+from mpshim import machine, micropython, network, ssd1306, ure, uselect, usocket, utime
+
+MODULES = {
+    'machine': machine,
+    'micropython': micropython,
+    'network': network,
+    'ssd1306': ssd1306,
+    'ure': ure,
+    'uselect': uselect,
+    'usocket': usocket,
+    'utime': utime,
+}
+
+# Served under CPython's names only while controller modules are imported
+SWAPPED = {'time': utime, 'socket': usocket, 'select': uselect}
+
+# Controller modules to import afresh, so each simulation starts from boot
+CONTROLLER_MODULES = ('main', 'time_logic', 'wifimgr', 'sunset', 'schedule', 'scheduler', 'config',
+                      'event_broadcast', 'ds3231_port', 'sdcard', 'sntp', 'discipline')
+
+
+def install(clock):
+    """Registers the stand-ins and points them at `clock`, resetting their state."""
+    utime.clock = clock
+    machine.reset()
+    network.reset()
+    usocket.reset()
+    ssd1306.reset()
+    sys.modules.update(MODULES)
+
+
+@contextlib.contextmanager
+def controller_imports(path, modules=CONTROLLER_MODULES):
+    """Imports under this block come from `path`, with the SWAPPED stand-ins."""
+    # Standard modules, loaded before their names are taken over
+    import array, os, select, socket, struct  # noqa: F401
+    for name in modules:
+        sys.modules.pop(name, None)
+    saved = {name: sys.modules[name] for name in SWAPPED}
+    sys.modules.update(SWAPPED)
+    sys.path.insert(0, path)
+    try:
+        yield
+    finally:
+        sys.path.remove(path)
+        sys.modules.update(saved)
+
+
+__all__ = ['SimulationEnd', 'VirtualClock', 'install', 'controller_imports']
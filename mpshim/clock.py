@@ -0,0 +1,45 @@
+"""Virtual time shared by the stand-in modules."""
+
+
+class SimulationEnd(Exception):
+    """Raised by a sleep that would run past the clock's end."""
+
+
+class VirtualClock:
+    """Reference time, the device's RTC and a monotonic counter, all in seconds.
+
+    true is the reference time (MicroPython's 2000 epoch); the RTC reads
+    true + offset, which NTP or the DS3231 sets. mono (ticks_ms) runs from
+    the same crystal as the RTC, so drifts with it. sleep() advances all three.
+    """
+    def __init__(self, start=0, end=None, drift_ppm=0.0):
+        self.true = float(start)
+        self.offset = 0.0
+        self.mono = 0.0
+        self.end = end
+        self.drift_ppm = drift_ppm  # RTC gain against the reference, parts per million
+        self.slept = 0  # Calls to sleep()
+
+    def now(self):
+        """RTC time."""
+        return self.true + self.offset
+
+    def set(self, rtc_time):
+        self.offset = rtc_time - self.true
+
+    def sleep(self, seconds):
+        self.slept += 1
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        if seconds <= 0:
+            return
+        end = self.end is not None and self.true + seconds >= self.end
+        if end:
+            seconds = self.end - self.true
+        gain = seconds * self.drift_ppm * 1e-6
+        self.true = self.end if end else self.true + seconds
+        self.mono += seconds + gain
+        self.offset += gain
+        if end:
+            raise SimulationEnd()
@@ -0,0 +1,211 @@
+"""Fake I2C and SPI devices for mpshim.machine."""
+from mpshim import utime
+
+
+def _bcd(n):
+    return ((n // 10) << 4) | (n % 10)
+
+
+def _dec(b):
+    return (b >> 4) * 10 + (b & 0x0F)
+
+
+class FakeDS3231:
+    """DS3231 register file whose time registers follow the virtual clock.
+
+    The chip keeps its own offset from the reference time, so setting the
+    RTC does not set the DS3231 and vice versa. Registers 0-6 read back the
+    current time in BCD (24-hour, century bit set) and writing one of them
+    sets that field; the others are plain storage. As on the chip, writing
+    the seconds restarts the count to the next second. The oscillator runs
+    drift_ppm fast, less AGING_STEP_PPM per step of the aging offset
+    (register 0x10), which applies at once; a conversion started with the
+    control register's CONV bit finishes at once. The temperature registers
+    (0x11, 0x12) read `temperature` in quarter degrees. Setting `stopped`
+    to an epoch second stops the oscillator there, as with a flat battery;
+    writing the time registers then moves it without restarting the count.
+    """
+    ADDRESS = 104
+    AGING = 0x10
+    CONTROL = 0x0E
+    CONV = 0x20
+    AGING_STEP_PPM = 0.1
+
+    def __init__(self, clock, offset=None, drift_ppm=0.0, temperature=25.0):
+        self.clock = clock
+        # Starts out agreeing with the RTC, as after a previous sync
+        self.offset = clock.offset if offset is None else offset  # As of self.since
+        self.since = clock.true
+        self.drift_ppm = drift_ppm
+        self.temperature = temperature
+        self.registers = bytearray(0x13)
+        self.stopped = None  # Epoch second the oscillator stopped at
+
+    def ppm(self):
+        """How fast the oscillator runs now, with the aging offset applied."""
+        aging = self.registers[self.AGING]
+        return self.drift_ppm - self.AGING_STEP_PPM * (aging - 256 if aging > 127 else aging)
+
+    def lead(self):
+        """Seconds the DS3231 is ahead of the reference time (its count to the next second included)."""
+        return self.offset + (self.clock.true - self.since) * self.ppm() * 1e-6
+
+    def now(self):
+        if self.stopped is not None:
+            return self.stopped
+        return int(self.clock.true + self.lead())
+
+    def _rebase(self):
+        self.offset = self.lead()
+        self.since = self.clock.true
+
+    def _time_registers(self):
+        y, m, d, hh, mm, ss, wd, _ = utime.gmtime(self.now())
+        return bytes((_bcd(ss), _bcd(mm), _bcd(hh), wd + 1, _bcd(d), _bcd(m) | 0x80, _bcd(y % 100)))
+
+    def read(self, memaddr, nbytes):
+        self.registers[0:7] = self._time_registers()
+        quarters = int(round(self.temperature * 4)) & 0x3FF
+        self.registers[0x11] = quarters >> 2
+        self.registers[0x12] = (quarters & 3) << 6
+        return bytes(self.registers[memaddr:memaddr + nbytes])
+
+    def write(self, memaddr, data):
+        if memaddr is None:  # Register pointer then data, as one write
+            memaddr, data = data[0], data[1:]
+        self._rebase()
+        self.registers[0:7] = self._time_registers()
+        self.registers[memaddr:memaddr + len(data)] = data
+        self.registers[self.CONTROL] &= ~self.CONV & 0xFF
+        if memaddr < 7:
+            r = self.registers
+            t = (2000 + _dec(r[6]), _dec(r[5] & 0x1F), _dec(r[4]), _dec(r[2] & 0x3F), _dec(r[1]),
+                 _dec(r[0]), 0, 0)
+            if self.stopped is not None:
+                self.stopped = utime.mktime(t)
+                return
+            phase = 0.0 if memaddr == 0 else (self.clock.true + self.offset) % 1
+            self.offset = utime.mktime(t) + phase - self.clock.true
+
+
+class FakeSDCard:
+    """SDHC card in SPI mode, backed by a bytearray image.
+
+    Answers the commands sdcard.py uses: CMD0/8/55/41/58 to initialise,
+    CMD9 (a version 2 CSD), CMD16, single and multiple block reads (CMD17,
+    CMD18 then CMD12) and writes (CMD24, CMD25). Responses follow one byte
+    of NCR and data tokens after a few bytes of access time, as on a real
+    card; a multiple block read streams blocks until CMD12. `reads` and `writes` count whole blocks transferred.
+    """
+    BLOCK_SIZE = 512
+    ACCESS_BYTES = 4  # 0xFF clocked out before each data token (the card's read access time)
+
+    def __init__(self, blocks=2048, image=None):
+        if blocks % 1024:
+            raise ValueError("blocks must be a multiple of 1024 (the CSD counts 512 KB units)")
+        self.blocks = blocks
+        self.image = bytearray(image) if image is not None else bytearray(blocks * self.BLOCK_SIZE)
+        self.idle = True
+        self.reads = 0
+        self.writes = 0
+        self._out = bytearray()  # Bytes to shift out, in order
+        self._cmd = bytearray()
+        self._app = False  # Last command was CMD55
+        self._stream = None  # Next block of a CMD18 read
+        self._write_block = None  # Block a CMD24/25 data packet goes to
+        self._multi_write = False
+        self._packet = None  # Data packet being received
+
+    def transfer(self, data):
+        n = len(data)
+        if self._stream is not None and len(self._out) < n:
+            self._queue_block(self._stream)
+            self._stream += 1
+        out = bytes(self._out[:n])
+        del self._out[:n]
+        if len(out) < n:
+            out += b'\xff' * (n - len(out))
+        if self._cmd or self._packet is not None or self._write_block is not None \
+                or data.count(0xFF) != n:
+            self._receive(data)
+        return out
+
+    def _queue_block(self, block):
+        start = block * self.BLOCK_SIZE
+        self._out += b'\xff' * self.ACCESS_BYTES + b'\xfe' + self.image[start:start + self.BLOCK_SIZE] + b'\xff\xff'
+        self.reads += 1
+
+    def _respond(self, r1, extra=b''):
+        self._out[:] = b'\xff' + bytes((r1,)) + extra
+
+    def _receive(self, data):
+        for i, byte in enumerate(data):
+            if self._packet is not None:
+                self._packet.append(byte)
+                if len(self._packet) == self.BLOCK_SIZE + 2:  # Data then CRC
+                    start = self._write_block * self.BLOCK_SIZE
+                    self.image[start:start + self.BLOCK_SIZE] = self._packet[:self.BLOCK_SIZE]
+                    self.writes += 1
+                    self._packet = None
+                    self._write_block = self._write_block + 1 if self._multi_write else None
+                    self._out[:] = b'\x05'  # Data accepted
+            elif self._cmd:
+                self._cmd.append(byte)
+                if len(self._cmd) == 6:
+                    self._command(self._cmd[0] & 0x3F, int.from_bytes(self._cmd[1:5], 'big'))
+                    self._cmd = bytearray()
+            elif self._write_block is not None and byte in (0xFE, 0xFC):
+                self._packet = bytearray()
+            elif self._write_block is not None and byte == 0xFD:  # Stop transmission
+                self._write_block = None
+            elif byte & 0xC0 == 0x40:
+                self._cmd.append(byte)
+
+    def _command(self, cmd, arg):
+        app, self._app = self._app, False
+        idle = 1 if self.idle else 0
+        if cmd == 0:
+            self.idle = True
+            self._stream = None
+            self._write_block = None
+            self._respond(1)
+        elif cmd == 8:
+            self._respond(idle, bytes((0, 0, 1, arg & 0xFF)))
+        elif cmd == 55:
+            self._app = True
+            self._respond(idle)
+        elif cmd == 41 and app:
+            self.idle = False
+            self._respond(0)
+        elif cmd == 58:
+            self._respond(idle, b'\xc0\xff\x80\x00')  # Powered up, block addressed (SDHC)
+        elif self.idle:
+            self._respond(0x05)  # Illegal command while initialising
+        elif cmd == 9:
+            csd = bytearray(16)
+            csd[0] = 0x40  # CSD version 2.0
+            c_size = self.blocks // 1024 - 1
+            csd[7], csd[8], csd[9] = (c_size >> 16) & 0x3F, (c_size >> 8) & 0xFF, c_size & 0xFF
+            self._respond(0, b'\xfe' + csd + b'\xff\xff')
+        elif cmd == 16:
+            self._respond(0 if arg == self.BLOCK_SIZE else 0x40)
+        elif cmd == 12:
+            if self._stream is not None and self._out:
+                self.reads -= 1  # Block cut off by the stop command
+            self._stream = None
+            self._out[:] = b'\xff\xff\x00'  # Stuff byte, NCR, R1
+        elif cmd in (17, 18, 24, 25):
+            if arg >= self.blocks:
+                self._respond(0x20)  # Address error
+            elif cmd == 17:
+                self._respond(0)
+                self._queue_block(arg)
+            elif cmd == 18:
+                self._respond(0)
+                self._stream = arg
+            else:
+                self._respond(0)
+                self._write_block = arg
+                self._multi_write = cmd == 25
+        else:
+            self._respond(0x04)  # Illegal command
@@ -0,0 +1,198 @@
+"""machine stand-in: Pin, I2C, UART and RTC on the virtual clock.
+
+I2C devices are shared by every bus object, keyed by address in
+`i2c_devices` (the controller opens the same pins twice); the DS3231 is
+present by default. While `record_i2c` is set every transfer is appended
+to `i2c_log` as (operation, address, register, bytes), and takes its time
+on the bus from the virtual clock (nine clocks a byte). SPI devices are
+attached by bus id in `spi_devices` and see every byte clocked on their
+bus (see devices.FakeSDCard). Every UART object is kept in `uarts` by id:
+writes are logged with the reference time (when they really happened,
+whatever the RTC says), and input queued with feed() becomes readable when
+the clock reaches it.
+"""
+from mpshim import utime
+from mpshim.devices import FakeDS3231
+
+i2c_devices = {}
+i2c_log = []  # (operation, address, register or None, bytes)
+record_i2c = True
+spi_devices = {}
+uarts = {}
+
+
+def reset():
+    i2c_devices.clear()
+    i2c_devices[FakeDS3231.ADDRESS] = FakeDS3231(utime.clock)
+    del i2c_log[:]
+    spi_devices.clear()
+    uarts.clear()
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=None, pull=None, value=None):
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        self._value = value if value is not None else (1 if pull == Pin.PULL_UP else 0)
+
+    def init(self, mode=None, pull=None, value=None):
+        if mode is not None:
+            self.mode = mode
+        if value is not None:
+            self._value = 1 if value else 0
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = 1 if v else 0
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+
+class I2C:
+    def __init__(self, id=-1, scl=None, sda=None, freq=400000):
+        self.id = id
+        self.freq = freq
+
+    def _device(self, addr, nbytes=0):
+        """The device at addr, once nbytes (address bytes included) have crossed the bus."""
+        utime.clock.advance(9 * nbytes / self.freq)
+        device = i2c_devices.get(addr)
+        if device is None:
+            raise OSError(19, 'ENODEV')  # No ACK
+        return device
+
+    def scan(self):
+        if record_i2c:
+            i2c_log.append(('scan', None, None, b''))
+        return sorted(i2c_devices)
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        data = bytes(self._device(addr, nbytes + 3).read(memaddr, nbytes))  # Address, register, address
+        if record_i2c:
+            i2c_log.append(('read', addr, memaddr, data))
+        return data
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        buf[:] = self._device(addr, len(buf) + 3).read(memaddr, len(buf))
+        if record_i2c:
+            i2c_log.append(('read', addr, memaddr, bytes(buf)))
+
+    def writeto_mem(self, addr, memaddr, buf):
+        self._device(addr, len(buf) + 2).write(memaddr, bytes(buf))
+        if record_i2c:
+            i2c_log.append(('write', addr, memaddr, bytes(buf)))
+
+    def writeto(self, addr, buf):
+        self._device(addr, len(buf) + 1).write(None, bytes(buf))
+        if record_i2c:
+            i2c_log.append(('write', addr, None, bytes(buf)))
+        return len(buf)
+
+
+SoftI2C = I2C
+
+
+class SPI:
+    """Full-duplex bus: every byte written is clocked into the attached device
+    and the byte it shifts back is what is read (0xFF with nothing attached).
+    Chip select is not modelled; the device sees all traffic on the bus.
+    """
+    MSB = 0
+    LSB = 1
+
+    def __init__(self, id, baudrate=1000000, polarity=0, phase=0, **kwargs):
+        self.id = id
+        self.baudrate = baudrate
+        self.transferred = 0  # Bytes clocked in each direction
+
+    def init(self, baudrate=1000000, polarity=0, phase=0, **kwargs):
+        self.baudrate = baudrate
+
+    def deinit(self):
+        pass
+
+    def _transfer(self, data):
+        self.transferred += len(data)
+        device = spi_devices.get(self.id)
+        if device is None:
+            return b'\xff' * len(data)
+        return device.transfer(data)
+
+    def write(self, buf):
+        self._transfer(bytes(buf))
+
+    def read(self, nbytes, write=0x00):
+        return self._transfer(bytes((write,)) * nbytes)
+
+    def readinto(self, buf, write=0x00):
+        buf[:] = self._transfer(bytes((write,)) * len(buf))
+
+    def write_readinto(self, write_buf, read_buf):
+        read_buf[:] = self._transfer(bytes(write_buf))
+
+
+SoftSPI = SPI
+
+
+class UART:
+    def __init__(self, id, baudrate=9600, tx=None, rx=None, **kwargs):
+        self.id = id
+        self.baudrate = baudrate
+        self.written = []  # (reference time, bytes) of every write
+        self._input = []  # (reference time, line) queued by feed(), in time order
+        uarts[id] = self
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.written.append((utime.clock.true, bytes(data)))
+        return len(data)
+
+    def feed(self, when, line):
+        """Queues `line` to arrive at reference time `when`."""
+        if isinstance(line, str):
+            line = line.encode()
+        self._input.append((when, line))
+        self._input.sort(key=lambda item: item[0])
+
+    def next_input(self):
+        """Reference time of the next queued line, or None."""
+        return self._input[0][0] if self._input else None
+
+    def any(self):
+        return sum(len(line) for when, line in self._input if when <= utime.clock.true)
+
+    def readline(self):
+        if self._input and self._input[0][0] <= utime.clock.true:
+            return self._input.pop(0)[1]
+        return None
+
+    def read(self, n=-1):
+        return self.readline()
+
+
+class RTC:
+    def datetime(self, t=None):
+        """(year, month, day, weekday, hours, minutes, seconds, subseconds)."""
+        if t is None:
+            us = utime._us(utime.clock.now())
+            y, m, d, hh, mm, ss, wd, _ = utime.gmtime(us // 1000000)
+            return (y, m, d, wd, hh, mm, ss, us % 1000000)
+        y, m, d, wd, hh, mm, ss = t[:7]
+        subseconds = t[7] if len(t) > 7 else 0  # Microseconds, as on the ESP32
+        utime.clock.set(utime.mktime((y, m, d, hh, mm, ss, 0, 0)) + subseconds / 1000000)
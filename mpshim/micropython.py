@@ -0,0 +1,24 @@
+"""micropython stand-in: const() and the code emitter decorators do nothing on CPython."""
+
+
+def const(value):
+    return value
+
+
+def native(f):
+    return f
+
+
+viper = native
+
+
+def opt_level(level=None):
+    return 0
+
+
+def mem_info(verbose=False):
+    pass
+
+
+def alloc_emergency_exception_buf(size):
+    pass
@@ -0,0 +1,66 @@
+"""network stand-in: WLAN interfaces that join the access points listed in `access_points`.
+
+access_points maps SSID to password (None for an open network); `up` set
+False drops every connection, as losing the access point would.
+"""
+STA_IF = 0
+AP_IF = 1
+
+access_points = {}
+up = True
+_interfaces = {}
+
+
+def reset():
+    global up
+    access_points.clear()
+    _interfaces.clear()
+    up = True
+
+
+class WLAN:
+    def __new__(cls, interface=STA_IF):
+        # One object per interface, as on the device
+        if interface not in _interfaces:
+            wlan = object.__new__(cls)
+            wlan.interface = interface
+            wlan._active = False
+            wlan._ssid = None
+            wlan._config = {}
+            _interfaces[interface] = wlan
+        return _interfaces[interface]
+
+    def active(self, state=None):
+        if state is None:
+            return self._active
+        self._active = bool(state)
+        if not self._active:
+            self._ssid = None
+
+    def scan(self):
+        """(ssid, bssid, channel, rssi, authmode, hidden) for each access point."""
+        return [(ssid.encode(), b'\x00' * 6, 1, -50 - i, 0 if password is None else 3, False)
+                for i, (ssid, password) in enumerate(sorted(access_points.items()))]
+
+    def connect(self, ssid, password=None):
+        if ssid in access_points and access_points[ssid] in (password, None):
+            self._ssid = ssid
+
+    def disconnect(self):
+        self._ssid = None
+
+    def isconnected(self):
+        return up and self._active and self._ssid is not None
+
+    def status(self):
+        return 1010 if self.isconnected() else 1000
+
+    def ifconfig(self):
+        return ('192.168.1.50', '255.255.255.0', '192.168.1.1', '192.168.1.1')
+
+    def config(self, *args, **kwargs):
+        if args:
+            if args[0] == 'essid':
+                return self._ssid if self.interface == STA_IF else self._config.get('essid')
+            return self._config.get(args[0])
+        self._config.update(kwargs)
@@ -0,0 +1,2 @@
+"""ure stand-in: MicroPython's regular expressions are a subset of re."""
+from re import compile, match, search, sub  # noqa: F401
@@ -0,0 +1,46 @@
+"""select stand-in (served as `select` to controller code): poll() waits on the virtual clock.
+
+A poll advances the clock to the first datagram's arrival at a registered
+mpshim.usocket socket, or by the whole timeout if none arrives in it.
+"""
+from mpshim import utime
+from mpshim.usocket import EARLY_S
+
+POLLIN = 1
+POLLOUT = 4
+POLLERR = 8
+POLLHUP = 16
+
+
+def poll():
+    return _Poll()
+
+
+class _Poll:
+    def __init__(self):
+        self._sockets = {}
+
+    def register(self, sock, mask=POLLIN | POLLOUT):
+        self._sockets[sock] = mask
+
+    def unregister(self, sock):
+        self._sockets.pop(sock, None)
+
+    def modify(self, sock, mask):
+        self._sockets[sock] = mask
+
+    def poll(self, timeout=-1):
+        """[(socket, POLLIN)] once something can be received; [] after timeout ms."""
+        clock = utime.clock
+        arrivals = [sock.next_arrival() for sock, mask in self._sockets.items() if mask & POLLIN]
+        arrivals = [when for when in arrivals if when is not None]
+        first = min(arrivals) if arrivals else None
+        if first is None or (timeout >= 0 and first - clock.true > timeout / 1000):
+            if timeout < 0:
+                raise OSError(110, 'ETIMEDOUT')  # Would block forever
+            clock.advance(timeout / 1000)
+            return []
+        clock.advance(first - clock.true)
+        due = clock.true + EARLY_S
+        return [(sock, POLLIN) for sock in self._sockets
+                if sock.next_arrival() is not None and sock.next_arrival() <= due]
@@ -0,0 +1,114 @@
+"""socket stand-in (served as `socket` to controller code): UDP to simulated NTP servers.
+
+ntp_servers maps a host name to (address, round trip in seconds). A
+request sent to one is answered from the reference time, stamped half way
+through the round trip, and can be received once the round trip has
+passed on the virtual clock (mpshim.uselect waits for it). Hosts in
+`unreachable` resolve but never answer; nothing resolves or goes out
+while network.up is False. Every answer is logged in `replies` as
+(reference time sent, host); other datagrams are dropped and logged in
+`sent` as (address, bytes).
+"""
+import struct
+
+from mpshim import network, utime
+
+AF_INET = 2
+SOCK_STREAM = 1
+SOCK_DGRAM = 2
+SOL_SOCKET = 1
+SO_REUSEADDR = 4
+SO_BROADCAST = 32
+NTP_PORT = 123
+NTP_DELTA = 3155673600  # 1900 to 2000, in seconds
+EAGAIN = 11
+EHOSTUNREACH = 113
+EARLY_S = 1e-6  # Float slack: an arrival this close is due
+
+ntp_servers = {}
+unreachable = set()
+replies = []
+sent = []
+
+
+def reset():
+    ntp_servers.clear()
+    unreachable.clear()
+    replies.clear()
+    sent.clear()
+
+
+def _numeric(host):
+    return all(part.isdigit() for part in host.split('.'))
+
+
+def getaddrinfo(host, port, *args):
+    if _numeric(host):
+        address = host
+    elif network.up and host in ntp_servers:
+        address = ntp_servers[host][0]
+    else:
+        raise OSError(-202, 'EAI_FAIL')  # As lwIP reports a failed lookup
+    return [(AF_INET, SOCK_DGRAM, 0, '', (address, port))]
+
+
+def _ntp_timestamp(seconds):
+    whole = int(seconds)
+    return whole + NTP_DELTA, int((seconds - whole) * (1 << 32))
+
+
+def _answer(request, server_time):
+    """A stratum 2 server's answer to request, stamped server_time on arrival and departure."""
+    packet = bytearray(48)
+    packet[0] = 0x24  # Leap indicator 0, version 4, mode 4 (server)
+    packet[1] = 2
+    packet[24:32] = request[40:48]  # Originate: the client's transmit timestamp
+    struct.pack_into('!IIII', packet, 32, *(_ntp_timestamp(server_time) * 2))
+    return bytes(packet)
+
+
+class socket:
+    def __init__(self, af=AF_INET, type=SOCK_STREAM, proto=0):
+        self.type = type
+        self._inbox = []  # (reference time it arrives, data, address)
+
+    def setblocking(self, flag):
+        pass
+
+    def settimeout(self, value):
+        pass
+
+    def setsockopt(self, level, option, value):
+        pass
+
+    def bind(self, address):
+        pass
+
+    def close(self):
+        self._inbox = []
+
+    def sendto(self, data, address):
+        if not network.up:
+            raise OSError(EHOSTUNREACH, 'EHOSTUNREACH')
+        host = None
+        if address[1] == NTP_PORT:
+            host = next((name for name, (ip, _) in ntp_servers.items() if ip == address[0]), None)
+        if host is None:
+            sent.append((address, bytes(data)))
+        elif host not in unreachable:
+            clock = utime.clock
+            rtt = ntp_servers[host][1]
+            replies.append((clock.true, host))
+            self._inbox.append((clock.true + rtt, _answer(data, clock.true + rtt / 2), address))
+            self._inbox.sort(key=lambda entry: entry[0])
+        return len(data)
+
+    def recvfrom(self, bufsize):
+        if not self._inbox or self._inbox[0][0] > utime.clock.true + EARLY_S:
+            raise OSError(EAGAIN, 'EAGAIN')
+        _, data, address = self._inbox.pop(0)
+        return data[:bufsize], address
+
+    def next_arrival(self):
+        """Reference time the next datagram can be received, or None."""
+        return self._inbox[0][0] if self._inbox else None
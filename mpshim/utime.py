@@ -0,0 +1,64 @@
+"""MicroPython's time module on the virtual clock: integer seconds from 2000-01-01, no timezone."""
+import calendar
+import time as _time
+
+EPOCH_OFFSET = 946684800  # Unix time of 2000-01-01
+TICKS_PERIOD = 1 << 30  # ESP32 ticks_ms() wraps here
+clock = None  # Set by mpshim.install()
+
+
+def _us(seconds):
+    """Whole microseconds, so float error in the virtual clock never shows as a second boundary."""
+    return int(round(seconds * 1000000))
+
+
+def time():
+    return _us(clock.now()) // 1000000
+
+
+def time_ns():
+    return _us(clock.now()) * 1000
+
+
+def gmtime(secs=None):
+    """(year, month, mday, hour, minute, second, weekday 0=Monday, yearday)."""
+    if secs is None:
+        secs = time()
+    t = _time.gmtime(int(secs) + EPOCH_OFFSET)
+    return (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_wday, t.tm_yday)
+
+
+localtime = gmtime  # MicroPython has no timezone
+
+
+def mktime(t):
+    return calendar.timegm(tuple(t[:6]) + (0, 0, 0)) - EPOCH_OFFSET
+
+
+def sleep(seconds):
+    clock.sleep(seconds)
+
+
+def sleep_ms(ms):
+    clock.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    clock.sleep(us / 1000000)
+
+
+def ticks_ms():
+    return _us(clock.mono) // 1000 % TICKS_PERIOD
+
+
+def ticks_us():
+    return _us(clock.mono) % TICKS_PERIOD
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % TICKS_PERIOD
+
+
+def ticks_diff(end, start):
+    diff = (end - start) % TICKS_PERIOD
+    return diff - TICKS_PERIOD if diff >= TICKS_PERIOD // 2 else diff
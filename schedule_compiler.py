@@ -0,0 +1,290 @@
+"""Host-side compiler for the controller's daily event plan (controller/schedule.bin).
+
+For every day it works out the UTC epoch of each event the controller
+sends over UART -- First Call 07:55, Colors 08:00, First Call at
+sunset-5, Retreat at sunset and Taps 22:00 -- applying the time zone and
+the day's sunset the same way main.py and time_logic.py do at runtime.
+The zone is main.py's POSIX TZ string (--timezone), converted by the
+controller's own time_logic.TimeZone, and is recorded in the plan so the
+controller ignores a plan built for another zone. The controller reads
+each day's epochs with one seek and does no schedule math. Records are 12
+bytes, so the plan covers a window (--start, --years) rather than the
+whole sunset table; rebuild it before the window runs out. See
+controller/schedule.py for the layout.
+
+Usage:
+    python3 schedule_compiler.py build [--start YYYY-MM-DD] [--years N] [--timezone TZ]
+                                      [--out controller/schedule.bin]
+    python3 schedule_compiler.py check [--years N] [--out controller/schedule.bin]
+
+`check` replays the original runtime logic minute by minute (a fixed UTC
+offset plus is_dst_us, then minutes-past-midnight equality) and compares
+each trigger with the plan. That logic only knows the US DST rules, so
+plans for zones with other rules cannot be checked.
+"""
+import argparse
+import datetime
+import os
+import struct
+import sys
+
+import sunset_table
+
+PLAN_MAGIC = b'SPL2'
+PLAN_HEADER_FMT = '<4sHBBHBBHii'
+PLAN_HEADER_SIZE = struct.calcsize(PLAN_HEADER_FMT)
+PLAN_NONE = 0xFFFF  # Event without a time that day
+DEFAULT_PLAN_YEARS = 2
+DEFAULT_PLAN = os.path.join('controller', 'schedule.bin')
+CONTROLLER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'controller')
+
+# Must match main.py (timezone, enable_dst) and controller/schedule.py (EVENT_TIMES)
+DEFAULT_TIMEZONE = 'PST8PDT,M3.2.0,M11.1.0'
+ENABLE_DST = True
+# (event key, minutes past local midnight or offset from sunset, relative to sunset)
+EVENTS = (
+    ('0755', 7 * 60 + 55, False),
+    ('0800', 8 * 60, False),
+    ('five_min_before_sunset', -5, True),
+    ('sunset', 0, True),
+    ('2200', 22 * 60, False),
+)
+# First event's epoch, then each other event's seconds after it
+PLAN_RECORD_FMT = '<I{}H'.format(len(EVENTS) - 1)
+PLAN_RECORD_SIZE = struct.calcsize(PLAN_RECORD_FMT)
+# MicroPython on the ESP32 counts time.time() from 2000-01-01 UTC
+EPOCH = datetime.datetime(2000, 1, 1)
+
+_time_logic = None  # The controller's time_logic, imported on first use
+_default_zone = None
+
+
+def time_zone(tz=DEFAULT_TIMEZONE, enable_dst=ENABLE_DST):
+    """The controller's time_logic.TimeZone for a POSIX TZ string.
+
+    time_logic is imported once, on the mpshim stand-ins, so the zone counts
+    epoch seconds from 2000 as on the controller.
+    """
+    global _time_logic
+    if _time_logic is None:
+        import mpshim
+        if 'machine' not in sys.modules:
+            mpshim.install(mpshim.VirtualClock(0))
+        with mpshim.controller_imports(CONTROLLER_DIR, ('time_logic', 'ds3231_port', 'discipline',
+                                                        'sntp', 'sunset')):
+            import time_logic
+        _time_logic = time_logic
+    return _time_logic.TimeZone(tz, enable_dst)
+
+
+def default_zone():
+    """time_zone() for main.py's timezone, made once."""
+    global _default_zone
+    if _default_zone is None:
+        _default_zone = time_zone()
+    return _default_zone
+
+
+def load_sunset_minutes():
+    """Sunset minutes by day number, from the delta table if built, else the CSV."""
+    if os.path.exists(sunset_table.DEFAULT_SDT):
+        start_date, minutes = sunset_table.read_delta_table(sunset_table.DEFAULT_SDT)
+        if start_date != sunset_table.START_DATE:
+            raise ValueError("{} starts on {}".format(sunset_table.DEFAULT_SDT, start_date))
+        return minutes
+    return sunset_table.read_csv(sunset_table.DEFAULT_CSV)
+
+
+def local_time(ts, tz=None):
+    """Wall-clock datetime of an epoch second in tz (a time_zone(), default main.py's)."""
+    if tz is None:
+        tz = default_zone()
+    return EPOCH + datetime.timedelta(seconds=ts + tz.utcoffset(ts))
+
+
+def wall_to_epoch(date, minutes, tz=None):
+    """Epoch second at which local wall-clock time on date first reads `minutes`."""
+    if tz is None:
+        tz = default_zone()
+    std = int((datetime.datetime.combine(date, datetime.time()) - EPOCH).total_seconds()) \
+        + minutes * 60 - tz.std_offset
+    if tz.rules is not None:
+        # During DST the wall clock runs ahead of standard time
+        ts = std - (tz.dst_offset - tz.std_offset)
+        t = local_time(ts, tz)
+        if t.date() == date and t.hour * 60 + t.minute == minutes:
+            return ts
+    return std
+
+
+def compile_plan(sunset_minutes, start_date, days, tz=None):
+    """Return a list of per-day tuples of event epochs (None where there is no time).
+
+    sunset_minutes[0] is start_date's sunset.
+    """
+    plan = []
+    for day in range(days):
+        date = start_date + datetime.timedelta(days=day)
+        sunset = sunset_minutes[day] if day < len(sunset_minutes) else None
+        record = []
+        for key, minutes, from_sunset in EVENTS:
+            if from_sunset:
+                if sunset is None:
+                    record.append(None)
+                    continue
+                minutes += sunset
+            record.append(wall_to_epoch(date, minutes, tz))
+        plan.append(tuple(record))
+    return plan
+
+
+def pack_plan(plan, start_date, tz=None):
+    """The plan file for compile_plan()'s epochs."""
+    if tz is None:
+        tz = default_zone()
+    zone = tz.tz.encode()
+    header = struct.pack(PLAN_HEADER_FMT, PLAN_MAGIC, start_date.year, start_date.month,
+                         start_date.day, len(plan), len(EVENTS), len(zone), EPOCH.year,
+                         tz.std_offset, tz.dst_offset)
+    records = []
+    for day, (first, *others) in enumerate(plan):
+        if first is None or not all(when is None or 0 <= when - first < PLAN_NONE for when in others):
+            raise ValueError("{}: events do not fit a plan record".format(
+                start_date + datetime.timedelta(days=day)))
+        after = [PLAN_NONE if when is None else when - first for when in others]
+        records.append(struct.pack(PLAN_RECORD_FMT, first, *after))
+    return header + zone + b''.join(records)
+
+
+def unpack_plan(data):
+    """Per-day tuples of event epochs from a plan's records, as schedule.get_day_plan reads them."""
+    plan = []
+    for offset in range(0, len(data) - PLAN_RECORD_SIZE + 1, PLAN_RECORD_SIZE):
+        first, *after = struct.unpack_from(PLAN_RECORD_FMT, data, offset)
+        plan.append((first,) + tuple(None if a == PLAN_NONE else first + a for a in after))
+    return plan
+
+
+def read_plan(path):
+    """Return (start_date, (TZ string, std offset, dst offset), event epochs per day) from a plan file."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, year, month, day, count, events, zone_len, epoch_year, std_offset, dst_offset = \
+        struct.unpack(PLAN_HEADER_FMT, data[:PLAN_HEADER_SIZE])
+    if magic != PLAN_MAGIC or events != len(EVENTS) or epoch_year != EPOCH.year:
+        raise ValueError("{} is not a compatible plan".format(path))
+    zone = data[PLAN_HEADER_SIZE:PLAN_HEADER_SIZE + zone_len].decode()
+    start = PLAN_HEADER_SIZE + zone_len
+    return (datetime.date(year, month, day), (zone, std_offset, dst_offset),
+            unpack_plan(data[start:start + count * PLAN_RECORD_SIZE]))
+
+
+def baseline_checkable(tz):
+    """Whether the original runtime (a fixed offset plus is_dst_us) can express tz."""
+    if tz.rules is None:
+        return True
+    return tz.rules == time_zone('UTC0DST').rules and tz.dst_offset - tz.std_offset == 3600
+
+
+def baseline_local_time(ts, utc_offset, enable_dst, is_dst_us):
+    """Wall-clock datetime of an epoch second as the original main.py worked it out.
+
+    That is time_logic.localtime_with_optional_dst before time zones: the
+    standard offset, plus an hour when is_dst_us (the controller's) holds
+    for the standard-time date and hour.
+    """
+    t = EPOCH + datetime.timedelta(seconds=ts + utc_offset)
+    if enable_dst and is_dst_us(t.year, t.month, t.day, t.hour):
+        t += datetime.timedelta(hours=1)
+    return t
+
+
+def simulate_runtime(sunset_minutes, start_date, days, tz=None):
+    """Replay the original main.py's minute-equality triggers and return per-day trigger epochs.
+
+    tz gives the standard offset and whether DST applies (see
+    baseline_checkable()); sunset_minutes[0] is start_date's sunset.
+    """
+    if tz is None:
+        tz = default_zone()
+    is_dst_us = sunset_table.load_controller_sunset().is_dst_us
+    targets = {}
+    first_ts = wall_to_epoch(start_date, 0, tz) - 3 * 3600
+    last_ts = wall_to_epoch(start_date + datetime.timedelta(days=days), 0, tz) + 3 * 3600
+    triggered = {}
+    for ts in range(first_ts - first_ts % 60, last_ts, 60):
+        t = baseline_local_time(ts, tz.std_offset, tz.rules is not None, is_dst_us)
+        day = (t.date() - start_date).days
+        if not 0 <= day < days:
+            continue
+        current_minutes = t.hour * 60 + t.minute
+        sunset = sunset_minutes[day] if day < len(sunset_minutes) else None
+        for i, (key, minutes, from_sunset) in enumerate(EVENTS):
+            if from_sunset:
+                if sunset is None:
+                    continue
+                minutes += sunset
+            if current_minutes == minutes and (day, key) not in triggered:
+                triggered[(day, key)] = ts
+    for day in range(days):
+        targets[day] = tuple(triggered.get((day, key)) for key, _, _ in EVENTS)
+    return targets
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Compile the controller's daily event plan.")
+    parser.add_argument('command', choices=('build', 'check'))
+    parser.add_argument('--start', help="first day of the plan (YYYY-MM-DD), default today")
+    parser.add_argument('--years', type=int, help="years to cover (default: {} for build, the"
+                        " whole plan for check)".format(DEFAULT_PLAN_YEARS))
+    parser.add_argument('--timezone', default=DEFAULT_TIMEZONE,
+                        help="main.py's POSIX TZ string, default %(default)s")
+    parser.add_argument('--no-dst', action='store_true', help="main.py has enable_dst = False")
+    parser.add_argument('--out', default=DEFAULT_PLAN)
+    args = parser.parse_args(argv[1:])
+
+    sunset_minutes = load_sunset_minutes()
+    if args.command == 'build':
+        try:
+            tz = time_zone(args.timezone, not args.no_dst)
+        except ValueError as e:
+            parser.error("--timezone: {}".format(e))
+        start_date = datetime.date.fromisoformat(args.start) if args.start else datetime.date.today()
+        first = (start_date - sunset_table.START_DATE).days
+        if not 0 <= first < len(sunset_minutes):
+            last = sunset_table.START_DATE + datetime.timedelta(days=len(sunset_minutes) - 1)
+            parser.error("--start: the sunset table covers {} to {}".format(sunset_table.START_DATE, last))
+        years = args.years or DEFAULT_PLAN_YEARS
+        days = (datetime.date(start_date.year + years, start_date.month, start_date.day) - start_date).days
+        plan = compile_plan(sunset_minutes[first:], start_date, days, tz)
+        data = pack_plan(plan, start_date, tz)
+        with open(args.out, 'wb') as f:
+            f.write(data)
+        print("Wrote {} days from {} ({} bytes) to {}".format(days, start_date, len(data), args.out))
+        return 0
+
+    start_date, zone, plan = read_plan(args.out)
+    tz = time_zone(zone[0], zone[1] != zone[2])  # Built with --no-dst if the offsets are equal
+    if not baseline_checkable(tz):
+        print("{} is for time zone {!r}: the original runtime only has the US DST rules".format(
+            args.out, zone[0]))
+        return 1
+    days = len(plan)
+    if args.years:
+        days = min(days, (datetime.date(start_date.year + args.years, start_date.month, start_date.day)
+                          - start_date).days)
+    first = (start_date - sunset_table.START_DATE).days
+    runtime = simulate_runtime(sunset_minutes[first:], start_date, days, tz)
+    mismatches = 0
+    for day in range(days):
+        if plan[day] != runtime[day]:
+            mismatches += 1
+            print("{}: plan {} runtime {}".format(start_date + datetime.timedelta(days=day),
+                                                  plan[day], runtime[day]))
+    print("Checked {} days of {} from {} against the original runtime logic: {} mismatches".format(
+        days, args.out, start_date, mismatches))
+    return 0 if mismatches == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,263 @@
+"""Host-side generator for sunset tables.
+
+Computes sunset for many sites and many years in one pass with NumPy,
+using the same NOAA solar position equations as the controller's
+computed sunset (controller/sunset.py), evaluated over a (site x day)
+array instead of a per-day loop. Times are local wall-clock minutes past
+midnight, with the site's daylight saving rules applied, which is what
+the controller compares against.
+
+For every site it writes the CSV format the controller and audio monitor
+read, plus the packed (.bin) and/or delta (.sdt) tables from sunset_table.py.
+
+Sites come from --site NAME,LAT,LON,TZ (longitude east positive, TZ an
+IANA name) or a CSV file with a name,latitude,longitude,timezone header.
+
+Usage:
+    python3 sunset_generator.py --site colors_machine,38.32,-122.94,America/Los_Angeles -o out
+    python3 sunset_generator.py --sites sites.csv --years 30 --formats csv,sdt -o out
+    python3 sunset_generator.py --site ... --compare controller/sunset_data.csv
+    python3 sunset_generator.py --benchmark
+"""
+import argparse
+import csv
+import datetime
+import os
+import sys
+import time
+import zoneinfo
+
+import numpy as np
+
+import sunset_table
+
+DEFAULT_SITE = ('colors_machine', 38.32, -122.94, 'America/Los_Angeles')
+DEFAULT_YEARS = 20
+FORMATS = ('csv', 'bin', 'sdt')
+COS_ZENITH = np.cos(np.radians(90.833))  # Sun's upper limb on the horizon with refraction
+J2000 = datetime.date(2000, 1, 1)
+OFFSET_SAMPLE_DAYS = 7  # Zones change offset at most once a week
+
+
+def read_sites(path):
+    """Return [(name, latitude, longitude, timezone)] from a sites CSV."""
+    sites = []
+    with open(path, 'r') as csvfile:
+        for row in csv.DictReader(csvfile):
+            sites.append((row['name'], float(row['latitude']), float(row['longitude']),
+                          row['timezone']))
+    return sites
+
+
+def parse_site(text):
+    name, lat, lon, tz = text.split(',')
+    return name, float(lat), float(lon), tz
+
+
+def sunset_utc_minutes(latitudes, longitudes, start_date, days):
+    """Sunset in UTC minutes past midnight of each date, shape (sites, days).
+
+    NaN where the sun does not set or rise that day.
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))[:, None]
+    lon = np.asarray(longitudes, dtype=np.float64)[:, None]
+    day = (start_date - J2000).days + np.arange(days, dtype=np.float64)[None, :]
+    # Days since J2000.0, evaluated at each site's local solar noon
+    t = day - lon / 360.0
+    c = t / 36525.0  # Julian centuries
+
+    l0 = np.radians((280.46646 + 0.98564736 * t) % 360.0)
+    m = np.radians(357.52911 + 0.98560028 * t)
+    ecc = 0.016708634 - 0.000042037 * c
+    center = (np.sin(m) * (1.914602 - 0.004817 * c)
+              + np.sin(2 * m) * 0.019993 + np.sin(3 * m) * 0.000289)
+    omega = np.radians(125.04 - 0.0529538 * t)
+    apparent = np.radians(np.degrees(l0) + center - 0.00569 - 0.00478 * np.sin(omega))
+    obliquity = np.radians(23.439291 - 0.0130042 * c + 0.00256 * np.cos(omega))
+
+    sin_decl = np.sin(obliquity) * np.sin(apparent)
+    cos_decl = np.sqrt(1.0 - sin_decl * sin_decl)
+
+    y = np.tan(obliquity / 2) ** 2
+    eq_time = 4 * np.degrees(
+        y * np.sin(2 * l0) - 2 * ecc * np.sin(m)
+        + 4 * ecc * y * np.sin(m) * np.cos(2 * l0)
+        - 0.5 * y * y * np.sin(4 * l0) - 1.25 * ecc * ecc * np.sin(2 * m))
+
+    cos_ha = (COS_ZENITH - np.sin(lat) * sin_decl) / (np.cos(lat) * cos_decl)
+    with np.errstate(invalid='ignore'):
+        hour_angle = np.degrees(np.arccos(cos_ha))
+    return 720.0 - 4 * lon - eq_time + 4 * hour_angle
+
+
+def utc_offset_minutes(tz_name, start_date, days):
+    """UTC offset in minutes at local noon of each date, including DST.
+
+    The zone is asked once every OFFSET_SAMPLE_DAYS, and where the offset
+    changed, bisected to the first day of the new one; the days in between
+    are filled in from the change days with NumPy.
+    """
+    tz = zoneinfo.ZoneInfo(tz_name)
+
+    def offset(day):
+        date = start_date + datetime.timedelta(days=day)
+        noon = datetime.datetime(date.year, date.month, date.day, 12, tzinfo=tz)
+        return int(noon.utcoffset().total_seconds()) // 60
+
+    if days <= 0:
+        return np.empty(0, dtype=np.int32)
+    changes = [0]  # First day of each offset
+    values = [offset(0)]
+    last = 0
+    for day in list(range(OFFSET_SAMPLE_DAYS, days, OFFSET_SAMPLE_DAYS)) + [days - 1]:
+        value = offset(day)
+        if value != values[-1]:
+            lo, hi = last, day
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if offset(mid) == values[-1]:
+                    lo = mid
+                else:
+                    hi = mid
+            changes.append(hi)
+            values.append(value)
+        last = day
+    index = np.searchsorted(np.asarray(changes), np.arange(days), side='right') - 1
+    return np.asarray(values, dtype=np.int32)[index]
+
+
+def generate(sites, start_date, days):
+    """Return an int array of local sunset minutes, shape (sites, days).
+
+    Raises ValueError if a site has days without a sunset.
+    """
+    utc = sunset_utc_minutes([s[1] for s in sites], [s[2] for s in sites], start_date, days)
+    offsets = {}
+    for tz_name in {s[3] for s in sites}:
+        offsets[tz_name] = utc_offset_minutes(tz_name, start_date, days)
+    local = utc + np.stack([offsets[s[3]] for s in sites])
+    bad = np.isnan(local).any(axis=1)
+    if bad.any():
+        names = [s[0] for s, b in zip(sites, bad) if b]
+        raise ValueError("No sunset on some days for: {}".format(', '.join(names)))
+    # Times past local midnight; round half up like the controller
+    return (np.floor(local + 0.5).astype(np.int64) % 1440).astype(np.uint16)
+
+
+def write_site(out_dir, name, minutes, start_date, formats):
+    """Write one site's table in each requested format. Returns the paths written."""
+    paths = []
+    values = minutes.tolist()
+    if 'csv' in formats:
+        path = os.path.join(out_dir, name + '.csv')
+        with open(path, 'w') as f:
+            f.write('day_number,minutes_past_midnight\n')
+            f.write(''.join('{},{}\n'.format(i, v) for i, v in enumerate(values)))
+        paths.append(path)
+    if 'bin' in formats:
+        path = os.path.join(out_dir, name + '.bin')
+        with open(path, 'wb') as f:
+            f.write(sunset_table.pack_table(values, start_date))
+        paths.append(path)
+    if 'sdt' in formats:
+        path = os.path.join(out_dir, name + '.sdt')
+        with open(path, 'wb') as f:
+            f.write(sunset_table.pack_delta_table(values, start_date))
+        paths.append(path)
+    return paths
+
+
+def compare(minutes, csv_path):
+    """Report how a generated series matches an existing sunset CSV.
+
+    Prints the days matching exactly and within a minute, the range of the
+    differences (generated minus CSV) and, by year, the days more than a
+    minute apart. Returns True if every day matches exactly.
+    """
+    expected = sunset_table.read_csv(csv_path)
+    n = min(len(expected), len(minutes))
+    diff = minutes[:n].astype(np.int64) - np.asarray(expected[:n], dtype=np.int64)
+    exact = int((diff == 0).sum())
+    near = int((np.abs(diff) <= 1).sum())
+    print("Compared {} days with {}: {} exact ({:.1%}), {} within 1 minute ({:.1%}), "
+          "differences {:+d} to {:+d} minutes".format(
+              n, csv_path, exact, exact / n, near, near / n, int(diff.min()), int(diff.max())))
+    off = np.nonzero(np.abs(diff) > 1)[0]
+    if len(off):
+        years = {}
+        for day in off.tolist():
+            year = (sunset_table.START_DATE + datetime.timedelta(days=day)).year
+            years[year] = years.get(year, 0) + 1
+        print("  {} days more than 1 minute apart, by year: {}".format(
+            len(off), ', '.join('{}: {}'.format(y, years[y]) for y in sorted(years))))
+    return exact == n
+
+
+def benchmark(sites=100, years=30, formats=('csv', 'sdt')):
+    """Time generating and writing sites x years of tables into a scratch directory."""
+    import tempfile
+    rng = np.random.default_rng(0)
+    zones = ['America/Los_Angeles', 'America/Denver', 'America/Chicago', 'America/New_York',
+             'Europe/London', 'Australia/Sydney', 'Asia/Tokyo']
+    site_list = [('site{:03d}'.format(i), float(rng.uniform(-55, 55)), float(rng.uniform(-180, 180)),
+                  zones[i % len(zones)]) for i in range(sites)]
+    start_date = datetime.date(2025, 1, 1)
+    days = (datetime.date(2025 + years, 1, 1) - start_date).days
+    t0 = time.perf_counter()
+    table = generate(site_list, start_date, days)
+    t1 = time.perf_counter()
+    with tempfile.TemporaryDirectory() as out_dir:
+        for site, minutes in zip(site_list, table):
+            write_site(out_dir, site[0], minutes, start_date, formats)
+    t2 = time.perf_counter()
+    print("{} sites x {} years ({} site-days): compute {:.3f} s, write {} {:.3f} s, total {:.3f} s".format(
+        sites, years, sites * days, t1 - t0, '+'.join(formats), t2 - t1, t2 - t0))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Generate sunset tables for many sites.")
+    parser.add_argument('--site', action='append', type=parse_site, default=[],
+                        help="NAME,LAT,LON,TZ (may be repeated)")
+    parser.add_argument('--sites', help="CSV file with name,latitude,longitude,timezone")
+    parser.add_argument('--start', default=sunset_table.START_DATE.isoformat(),
+                        help="first date (YYYY-MM-DD), default %(default)s")
+    parser.add_argument('--years', type=int, default=DEFAULT_YEARS)
+    parser.add_argument('--formats', default='csv,bin,sdt',
+                        help="comma separated subset of {}".format(','.join(FORMATS)))
+    parser.add_argument('-o', '--out', default='.', help="output directory")
+    parser.add_argument('--compare', help="report the first site against this sunset CSV")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="time 100 sites x 30 years and exit")
+    args = parser.parse_args(argv[1:])
+
+    if args.benchmark:
+        benchmark()
+        return 0
+
+    formats = [f for f in args.formats.split(',') if f]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        parser.error("unknown format(s): {}".format(', '.join(sorted(unknown))))
+    sites = list(args.site)
+    if args.sites:
+        sites += read_sites(args.sites)
+    if not sites:
+        sites = [DEFAULT_SITE]
+
+    start_date = datetime.date.fromisoformat(args.start)
+    end_date = datetime.date(start_date.year + args.years, start_date.month, start_date.day)
+    days = (end_date - start_date).days
+    table = generate(sites, start_date, days)
+
+    if args.compare:
+        return 0 if compare(table[0], args.compare) else 1
+
+    os.makedirs(args.out, exist_ok=True)
+    for site, minutes in zip(sites, table):
+        for path in write_site(args.out, site[0], minutes, start_date, formats):
+            print("Wrote", path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
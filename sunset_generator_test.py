@@ -0,0 +1,86 @@
+# sunset_generator_test
+# Vectorized sunset tables against the shipped controller/sunset_data.csv:
+#   python3 sunset_generator_test.py
+
+import contextlib
+import datetime
+import io
+import os
+import tempfile
+import zoneinfo
+
+import numpy as np
+
+import sunset_generator
+import sunset_table
+from checks import check, finish
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SHIPPED_CSV = os.path.join(HERE, 'controller', 'sunset_data.csv')
+EXPECTED = np.array(sunset_table.read_csv(SHIPPED_CSV))
+DAYS = len(EXPECTED)
+PRE_2038 = (datetime.date(2038, 1, 1) - sunset_table.START_DATE).days
+
+
+def test_utc_offsets():
+    # The weekly samples and bisection agree with asking the zone about every day
+    start = datetime.date(2025, 1, 1)
+    days = (datetime.date(2055, 1, 1) - start).days
+    for name in ('America/Los_Angeles', 'Europe/London', 'Australia/Sydney', 'Asia/Tokyo'):
+        tz = zoneinfo.ZoneInfo(name)
+        daily = []
+        for day in range(days):
+            date = start + datetime.timedelta(days=day)
+            noon = datetime.datetime(date.year, date.month, date.day, 12, tzinfo=tz)
+            daily.append(int(noon.utcoffset().total_seconds()) // 60)
+        check('{} offsets match day by day'.format(name),
+              sunset_generator.utc_offset_minutes(name, start, days).tolist() == daily)
+    short = [sunset_generator.utc_offset_minutes('America/Los_Angeles', start, n).tolist() for n in (0, 1)]
+    check('a short range', short == [[], [-480]])
+
+
+def test_shipped_csv():
+    # The shipped CSV came from another tool: the physical model is reported against it, not fitted
+    model = sunset_generator.generate([sunset_generator.DEFAULT_SITE], sunset_table.START_DATE, DAYS)[0]
+    diff = model.astype(int) - EXPECTED
+    check('{} of {} days exact'.format(int((diff == 0).sum()), DAYS), (diff == 0).sum() == 5173)
+    check('within 1 minute before 2038', np.abs(diff[:PRE_2038]).max() <= 1)
+    off = np.nonzero(np.abs(diff) > 1)[0]
+    summer = [sunset_table.START_DATE + datetime.timedelta(days=int(day)) for day in off]
+    check('CSV is standard time in 2038+ summers ({} days)'.format(len(off)),
+          len(off) == 1666 and all(d.year >= 2038 and 3 <= d.month <= 11 for d in summer)
+          and set(np.abs(diff[off]).tolist()) <= {59, 60, 61})
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        code = sunset_generator.main(['sunset_generator.py', '--compare', SHIPPED_CSV])
+    report = out.getvalue()
+    check('--compare reports the match and error bounds',
+          code == 1 and '5173 exact' in report and 'differences -1 to +61' in report
+          and '1666 days more than 1 minute apart' in report)
+
+
+def test_write_site():
+    minutes = sunset_generator.generate([sunset_generator.DEFAULT_SITE], sunset_table.START_DATE, 400)[0]
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = sunset_generator.write_site(tmp, 'site', minutes, sunset_table.START_DATE,
+                                            sunset_generator.FORMATS)
+        check('CSV round-trips', sunset_table.read_csv(paths[0]) == minutes.tolist())
+        check('all formats written', [os.path.splitext(p)[1] for p in paths] == ['.csv', '.bin', '.sdt'])
+
+
+def test_solar_report():
+    # The controller's computed sunset, with the 2038+ rows put back into daylight time
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        ok = sunset_table.solar_report(SHIPPED_CSV, os.path.join(HERE, sunset_table.DEFAULT_BIN))
+    counted = sum(int(line.split(':')[1].split()[0]) for line in out.getvalue().splitlines()
+                  if line.strip().endswith('days') and ' min:' in line)
+    check('solar report compares every row ({} of {})'.format(counted, DAYS), ok and counted == DAYS)
+
+
+if __name__ == '__main__':
+    test_utc_offsets()
+    test_shipped_csv()
+    test_write_site()
+    test_solar_report()
+    finish()
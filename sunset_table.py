@@ -0,0 +1,384 @@
+"""Host-side tool for building the controller's packed sunset table.
+
+The controller looks sunset up by day number. Scanning the CSV means parsing
+every row up to that day, so this tool packs the same data into a fixed-width
+binary file that the controller can seek into directly:
+
+    offset 0   4 bytes   magic b'SUN1'
+    offset 4   uint16    start year     (little endian)
+    offset 6   uint8     start month
+    offset 7   uint8     start day
+    offset 8   uint16    record count
+    offset 10  uint16[]  sunset in minutes past local midnight, one per day
+
+The delta table (.sdt) stores the same days in a few KB: a full value
+every `interval` days (keyframe) and small signed deltas in between, so a
+lookup decodes at most interval-1 deltas:
+
+    offset 0   4 bytes   magic b'SUND'
+    offset 4   uint16    start year, uint8 month, uint8 day
+    offset 8   uint16    record count
+    offset 10  uint8     keyframe interval
+    offset 11  uint8     delta bits (2-4)
+    offset 12  index     (uint16 keyframe minutes, uint16 block byte offset) per block
+    then       blocks    interval-1 deltas each, MSB first, byte aligned;
+                         the most negative code escapes a 16-bit absolute value
+
+It also reports how the controller's computed (table-free) sunset compares
+with the table, and how long each lookup path takes.
+
+Usage:
+    python3 sunset_table.py build [csv] [bin]
+    python3 sunset_table.py build-delta [csv] [sdt]
+    python3 sunset_table.py check [csv] [bin] [sdt]
+    python3 sunset_table.py solar [csv] [bin]
+"""
+import csv
+import datetime
+import os
+import struct
+import sys
+import time
+
+MAGIC = b'SUN1'
+HEADER_FMT = '<4sHBBH'
+HEADER_SIZE = struct.calcsize(HEADER_FMT)
+RECORD_SIZE = 2
+
+DELTA_MAGIC = b'SUND'
+DELTA_HEADER_FMT = '<4sHBBHBB'
+DELTA_HEADER_SIZE = struct.calcsize(DELTA_HEADER_FMT)
+DELTA_INTERVAL = 32
+DELTA_BITS = (2, 3, 4)
+
+START_DATE = datetime.date(2025, 1, 1)
+DEFAULT_CSV = os.path.join('controller', 'sunset_data.csv')
+DEFAULT_BIN = os.path.join('controller', 'sunset_data.bin')
+DEFAULT_SDT = os.path.join('controller', 'sunset_data.sdt')
+# The shipped CSV is in standard time from this year on: the tool that made
+# it had no DST rules past 2037
+CSV_DST_UNTIL = 2038
+CONTROLLER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'controller')
+
+
+def read_csv(csv_path):
+    """Return the sunset minutes from csv_path as a list indexed by day number."""
+    rows = {}
+    with open(csv_path, 'r') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader, None)  # Skip header
+        for row in reader:
+            if len(row) == 2:
+                rows[int(row[0])] = int(row[1])
+    count = len(rows)
+    if sorted(rows) != list(range(count)):
+        raise ValueError("{}: day numbers must run 0..{} without gaps".format(csv_path, count - 1))
+    return [rows[day] for day in range(count)]
+
+
+def pack_table(minutes, start_date=START_DATE):
+    """Return the binary table for a list of sunset minutes."""
+    if len(minutes) > 0xFFFF:
+        raise ValueError("Too many records for a uint16 count: {}".format(len(minutes)))
+    header = struct.pack(HEADER_FMT, MAGIC, start_date.year, start_date.month,
+                         start_date.day, len(minutes))
+    return header + struct.pack('<{}H'.format(len(minutes)), *minutes)
+
+
+def read_header(f):
+    """Read the table header from an open binary file.
+
+    Returns (start_date, count).
+    """
+    magic, year, month, day, count = struct.unpack(HEADER_FMT, f.read(HEADER_SIZE))
+    if magic != MAGIC:
+        raise ValueError("Not a sunset table (magic {!r})".format(magic))
+    return datetime.date(year, month, day), count
+
+
+def lookup(bin_path, day_number):
+    """Return sunset minutes for day_number from the binary table, or None.
+
+    Mirrors the controller's seek-based lookup in controller/sunset.py.
+    """
+    with open(bin_path, 'rb') as f:
+        start_date, count = read_header(f)
+        index = day_number - (start_date - START_DATE).days
+        if index < 0 or index >= count:
+            return None
+        f.seek(HEADER_SIZE + index * RECORD_SIZE)
+        return struct.unpack('<H', f.read(RECORD_SIZE))[0]
+
+
+class _BitWriter:
+    def __init__(self):
+        self.data = bytearray()
+        self.acc = 0
+        self.nacc = 0
+
+    def write(self, value, bits):
+        self.acc = (self.acc << bits) | (value & ((1 << bits) - 1))
+        self.nacc += bits
+        while self.nacc >= 8:
+            self.nacc -= 8
+            self.data.append((self.acc >> self.nacc) & 0xFF)
+        self.acc &= (1 << self.nacc) - 1
+
+    def align(self):
+        if self.nacc:
+            self.write(0, 8 - self.nacc)
+
+
+def pack_delta_table(minutes, start_date=START_DATE, interval=DELTA_INTERVAL, bits=None):
+    """Return the delta table for a list of sunset minutes.
+
+    With bits=None every width in DELTA_BITS is tried and the smallest
+    table is returned.
+    """
+    if bits is None:
+        return min((pack_delta_table(minutes, start_date, interval, b) for b in DELTA_BITS), key=len)
+    if len(minutes) > 0xFFFF or not 1 < interval < 256:
+        raise ValueError("Unsupported table size {} or interval {}".format(len(minutes), interval))
+    escape = -(1 << (bits - 1))
+    index = []
+    stream = _BitWriter()
+    for block_start in range(0, len(minutes), interval):
+        block = minutes[block_start:block_start + interval]
+        if len(stream.data) > 0xFFFF:
+            raise ValueError("Delta stream too long for uint16 block offsets")
+        index.append(struct.pack('<HH', block[0], len(stream.data)))
+        for prev, value in zip(block, block[1:]):
+            delta = value - prev
+            if escape < delta < -escape:
+                stream.write(delta, bits)
+            else:
+                stream.write(escape, bits)
+                stream.write(value, 16)
+        stream.align()
+    header = struct.pack(DELTA_HEADER_FMT, DELTA_MAGIC, start_date.year, start_date.month,
+                         start_date.day, len(minutes), interval, bits)
+    return header + b''.join(index) + bytes(stream.data)
+
+
+def read_delta_table(sdt_path):
+    """Decode a whole delta table. Returns (start_date, minutes list)."""
+    with open(sdt_path, 'rb') as f:
+        data = f.read()
+    magic, year, month, day, count, interval, bits = struct.unpack(
+        DELTA_HEADER_FMT, data[:DELTA_HEADER_SIZE])
+    if magic != DELTA_MAGIC:
+        raise ValueError("Not a delta sunset table (magic {!r})".format(magic))
+    blocks = (count + interval - 1) // interval
+    stream_start = DELTA_HEADER_SIZE + blocks * 4
+    escape = 1 << (bits - 1)
+    minutes = []
+    for block in range(blocks):
+        value, offset = struct.unpack_from('<HH', data, DELTA_HEADER_SIZE + block * 4)
+        pos = stream_start + offset
+        bitpos = 0
+        minutes.append(value)
+        for _ in range(min(interval, count - block * interval) - 1):
+            code = _read_bits(data, pos, bitpos, bits)
+            bitpos += bits
+            if code == escape:
+                value = _read_bits(data, pos, bitpos, 16)
+                bitpos += 16
+            else:
+                value += code - (1 << bits) if code > escape else code
+            minutes.append(value)
+    return datetime.date(year, month, day), minutes
+
+
+def _read_bits(data, pos, bitpos, bits):
+    """Read `bits` bits, MSB first, starting bitpos bits into data[pos:]."""
+    value = 0
+    for i in range(bitpos, bitpos + bits):
+        byte = data[pos + i // 8]
+        value = (value << 1) | ((byte >> (7 - i % 8)) & 1)
+    return value
+
+
+def build(csv_path=DEFAULT_CSV, bin_path=DEFAULT_BIN):
+    minutes = read_csv(csv_path)
+    data = pack_table(minutes)
+    with open(bin_path, 'wb') as f:
+        f.write(data)
+    print("Wrote {} records ({} bytes) to {}".format(len(minutes), len(data), bin_path))
+
+
+def build_delta(csv_path=DEFAULT_CSV, sdt_path=DEFAULT_SDT):
+    minutes = read_csv(csv_path)
+    data = pack_delta_table(minutes)
+    with open(sdt_path, 'wb') as f:
+        f.write(data)
+    bits = struct.unpack(DELTA_HEADER_FMT, data[:DELTA_HEADER_SIZE])[-1]
+    print("Wrote {} records ({} bytes, {}-bit deltas, keyframe every {} days) to {}".format(
+        len(minutes), len(data), bits, DELTA_INTERVAL, sdt_path))
+
+
+def check(csv_path=DEFAULT_CSV, bin_path=DEFAULT_BIN, sdt_path=DEFAULT_SDT):
+    """Compare every day in the binary tables that exist against the CSV.
+
+    Returns True on parity.
+    """
+    checked = False
+    ok = True
+    if os.path.exists(bin_path):
+        ok = check_bin(csv_path, bin_path)
+        checked = True
+    if os.path.exists(sdt_path):
+        ok = check_delta(csv_path, sdt_path) and ok
+        checked = True
+    if not checked:
+        print("No table found at {} or {}".format(bin_path, sdt_path))
+    return checked and ok
+
+
+def check_delta(csv_path=DEFAULT_CSV, sdt_path=DEFAULT_SDT):
+    """Round-trip the delta table through the host and controller decoders."""
+    minutes = read_csv(csv_path)
+    start_date, decoded = read_delta_table(sdt_path)
+    mismatches = 0
+    if start_date != START_DATE or decoded != minutes:
+        mismatches += 1
+        print("Host decode of {} does not match the CSV".format(sdt_path))
+    sunset = load_controller_sunset()
+    sunset.DELTA_TABLE_FILENAME = sdt_path
+    for day in range(-1, len(minutes) + 1):
+        expected = minutes[day] if 0 <= day < len(minutes) else None
+        got = sunset.get_sunset_minutes_delta(day)
+        if got != expected:
+            mismatches += 1
+            print("Day {}: delta table has {}, CSV has {}".format(day, got, expected))
+    for window in (None, 40):
+        provider = sunset.SunsetProvider(window, mode='table')
+        for day in range(len(minutes)):
+            if provider.get_sunset_minutes(day) != minutes[day]:
+                mismatches += 1
+                print("Day {}: resident delta table (window {}) differs".format(day, window))
+                break
+    print("Checked {} days in {} ({} bytes): {} mismatches".format(
+        len(minutes), sdt_path, os.path.getsize(sdt_path), mismatches))
+    return mismatches == 0
+
+
+def check_bin(csv_path=DEFAULT_CSV, bin_path=DEFAULT_BIN):
+    """Compare every day in the packed table against the CSV. Returns True on parity."""
+    minutes = read_csv(csv_path)
+    with open(bin_path, 'rb') as f:
+        start_date, count = read_header(f)
+    if start_date != START_DATE or count != len(minutes):
+        print("Header mismatch: start {} count {}, expected start {} count {}".format(
+            start_date, count, START_DATE, len(minutes)))
+        return False
+    mismatches = 0
+    for day, expected in enumerate(minutes):
+        got = lookup(bin_path, day)
+        if got != expected:
+            mismatches += 1
+            print("Day {}: table has {}, CSV has {}".format(day, got, expected))
+    for day in (-1, len(minutes)):
+        if lookup(bin_path, day) is not None:
+            mismatches += 1
+            print("Day {} is out of range but returned a value".format(day))
+    print("Checked {} days: {} mismatches".format(len(minutes), mismatches))
+    return mismatches == 0
+
+
+def load_controller_sunset():
+    """Import controller/sunset.py so host reports exercise the device code."""
+    if CONTROLLER_DIR not in sys.path:
+        sys.path.insert(0, CONTROLLER_DIR)
+    import sunset
+    return sunset
+
+
+def _time_per_call(fn, days, repeat=3):
+    """Best-of-repeat seconds per call of fn(day) over days."""
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for day in days:
+            fn(day)
+        elapsed = (time.perf_counter() - t0) / len(days)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def solar_report(csv_path=DEFAULT_CSV, bin_path=DEFAULT_BIN, dst_until=CSV_DST_UNTIL):
+    """Compare the computed sunset with every CSV day and time each lookup path.
+
+    Rows from January of dst_until on are taken as standard time and get
+    the DST hour added where it applies before comparing. Returns True if
+    every day is within one minute.
+    """
+    sunset = load_controller_sunset()
+    minutes = read_csv(csv_path)
+    errors = {}
+    corrected = {}
+    bad_days = []
+    for day, expected in enumerate(minutes):
+        year, month, date = (START_DATE + datetime.timedelta(days=day)).timetuple()[:3]
+        if (dst_until is not None and year >= dst_until
+                and sunset.is_dst_us(year, month, date, expected // 60)):
+            expected += 60
+            corrected[year] = corrected.get(year, 0) + 1
+        got = sunset.get_sunset_minutes_solar(day, sunset.is_dst_us)
+        error = got - expected
+        if abs(error) > 1:
+            bad_days.append((day, got, expected))
+        errors[error] = errors.get(error, 0) + 1
+
+    print("Computed sunset vs {} ({} days)".format(csv_path, len(minutes)))
+    for error in sorted(errors):
+        print("  {:+d} min: {} days".format(error, errors[error]))
+    if corrected:
+        print("  Standard-time rows from {} on, compared with the DST hour added:".format(dst_until))
+        for year in sorted(corrected):
+            print("    {}: {} days".format(year, corrected[year]))
+    for day, got, expected in bad_days:
+        print("  Day {}: computed {}, table {}".format(day, got, expected))
+
+    days = list(range(len(minutes)))
+    sunset.TABLE_FILENAME = bin_path
+    resident = sunset.SunsetProvider(mode='table')
+    resident.get_sunset_minutes(0)  # Load outside the timed loop
+    sample = days[::25]
+    print("Time per lookup on this host (relative cost only):")
+    print("  CSV scan      {:9.2f} us".format(1e6 * _time_per_call(
+        lambda day: _csv_scan(csv_path, day), sample, repeat=1)))
+    print("  table seek    {:9.2f} us".format(1e6 * _time_per_call(sunset.get_sunset_minutes_bin, days)))
+    print("  resident      {:9.2f} us".format(1e6 * _time_per_call(resident.get_sunset_minutes, days)))
+    print("  computed      {:9.2f} us".format(1e6 * _time_per_call(sunset.get_sunset_minutes_solar, days)))
+    return not bad_days
+
+
+def _csv_scan(csv_path, day_number):
+    """The controller's original row-by-row CSV lookup."""
+    with open(csv_path, 'r') as csvfile:
+        next(csvfile)  # Skip header
+        for line in csvfile:
+            parts = line.strip().split(',')
+            if len(parts) == 2 and int(parts[0]) == day_number:
+                return int(parts[1])
+    return None
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] not in ('build', 'build-delta', 'check', 'solar'):
+        print(__doc__)
+        return 2
+    paths = argv[2:4]
+    if argv[1] == 'build':
+        build(*paths)
+        return 0
+    if argv[1] == 'build-delta':
+        build_delta(*paths)
+        return 0
+    if argv[1] == 'solar':
+        return 0 if solar_report(*paths) else 1
+    return 0 if check(*argv[2:5]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))